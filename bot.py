@@ -1,5 +1,8 @@
 import asyncio
+import hmac
 import os
+import socket
+from contextlib import suppress
 import django
 
 from aiogram import Bot, Dispatcher
@@ -11,9 +14,13 @@ from aiogram.types import (
     CallbackQuery,
     InlineKeyboardMarkup,
     InlineKeyboardButton,
+    Update,
 )
+from aiogram.webhook.aiohttp_server import setup_application
+from aiohttp import web
 from aiogram.filters import Command
-from asgiref.sync import sync_to_async
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.storage.base import StorageKey
 from dotenv import load_dotenv
 
 
@@ -31,7 +38,22 @@ SOCKS5_PROXY = os.getenv("SOCKS5_PROXY")
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "tg_poll_project.settings")
 django.setup()
 
-from polls.models import User, Poll, Answer  # noqa: E402
+from django.conf import settings  # noqa: E402
+from polls.jobs import enqueue  # noqa: E402
+from polls.services.answer_queue import answer_queue  # noqa: E402
+from polls.services.broadcasts import broadcast_loop  # noqa: E402
+from polls.services.db import run_db, shutdown as shutdown_db_pool  # noqa: E402
+from polls.services.deliveries import claim_delivery, record_delivery, resolve_delivery  # noqa: E402
+from polls.services.fsm_storage import build_fsm_storage  # noqa: E402
+from polls.services.questionnaire import aget_questionnaire  # noqa: E402
+from polls.services.send_scheduler import SchedulerMiddleware, SendScheduler  # noqa: E402
+from polls.services.users import aget_user, asave_user  # noqa: E402
+from polls.services.sessions import (  # noqa: E402
+    adiscard_session,
+    aresume_session,
+    astart_session,
+)
+from states import SurveyState  # noqa: E402
 
 
 # ---------- BOT ----------
@@ -41,14 +63,89 @@ if SOCKS5_PROXY:
     bot = Bot(token=BOT_TOKEN, session=proxy_session)
 else:
     bot = Bot(token=BOT_TOKEN)
-dp = Dispatcher()
+dp = Dispatcher(storage=build_fsm_storage())
+
+# все исходящие сообщения идут через общий планировщик (лимиты Telegram)
+send_scheduler = SendScheduler(
+    rate=settings.BOT_SEND_RATE,
+    chat_rate=settings.BOT_SEND_CHAT_RATE,
+    chat_burst=settings.BOT_SEND_CHAT_BURST,
+)
+bot.session.middleware(SchedulerMiddleware(send_scheduler))
+
+
+# ---------- STATE (FSM STORAGE) ----------
+# data: poll_id -> current text/scale poll, scale_index -> current statement
+#       of scale group. Позиция в анкете здесь не хранится: её источник —
+#       SurveySession (см. get_progress).
+PROFILE_STATES = {
+    "full_name": SurveyState.full_name,
+    "phone": SurveyState.phone,
+    "consent": SurveyState.consent,
+}
+
+
+def user_state(user_id: int) -> FSMContext:
+    # poll_answer приходит без чата, поэтому ключ собираем сами (личный чат == user_id)
+    key = StorageKey(bot_id=bot.id, chat_id=user_id, user_id=user_id)
+    return FSMContext(storage=dp.storage, key=key)
+
+
+async def reset_state(user_id: int):
+    state = user_state(user_id)
+    await state.set_state(None)
+    await state.set_data({})
+
+
+async def get_progress(user) -> int | None:
+    """
+    Позиция респондента в анкете или None, если открытой анкеты нет.
+
+    Позиция берётся из SurveySession, а пока очередь ответов не записала
+    сдвиг — из очереди: сдвиг попадёт в сессию одной транзакцией с ответами,
+    поэтому после сбоя анкета продолжится с первого несохранённого ответа.
+    """
+    position = answer_queue.position(user.id)
+    if position is not None:
+        return position
+    questionnaire = await aget_questionnaire(user.role)
+    return await aresume_session(user.id, user.role, questionnaire)
+
 
+async def advance_progress(user, progress: int):
+    # позиция в БД сдвинется вместе с записью ответов из очереди
+    upcoming = (await aget_questionnaire(user.role)).at(progress + 1)
+    answer_queue.advance(user.id, progress + 1, upcoming.id if upcoming else None)
+    await reset_state(user.tg_id)
 
-# ---------- STATE (IN MEMORY) ----------
-user_progress = {}            # user_id -> index of poll
-waiting_text_answer = {}      # user_id -> poll_id
-waiting_scale_answer = {}     # user_id -> scale state
-waiting_profile = {}          # user_id -> profile step
+
+async def current_poll(user, poll_id):
+    """(позиция, вопрос) респондента, если он сейчас стоит на вопросе ``poll_id``, иначе None."""
+    progress = await get_progress(user)
+    if progress is None:
+        return None
+    poll = (await aget_questionnaire(user.role)).at(progress)
+    if poll is None or poll.id != poll_id:
+        return None
+    return progress, poll
+
+
+async def begin_survey(user, restart=False) -> bool:
+    """Продолжает незавершённую анкету или начинает новую. Возвращает True при продолжении."""
+    # отложенные ответы и сдвиги должны попасть в текущую сессию до её чтения или замены
+    await answer_queue.flush()
+    questionnaire = await aget_questionnaire(user.role)
+    position = None if restart else await aresume_session(user.id, user.role, questionnaire)
+    await reset_state(user.tg_id)
+    if position is not None:
+        return True
+
+    await astart_session(user.id, user.role, questionnaire)
+    return False
+
+
+def survey_intro(resumed: bool) -> str:
+    return "Продолжаем опрос 👇" if resumed else "Начинаем опрос 👇"
 
 
 # ---------- ROLE KEYBOARD ----------
@@ -61,6 +158,14 @@ def role_keyboard():
     )
 
 
+def survey_keyboard():
+    return InlineKeyboardMarkup(
+        inline_keyboard=[
+            [InlineKeyboardButton(text="📝 Пройти опрос", callback_data="survey_start")],
+        ]
+    )
+
+
 def consent_keyboard():
     return InlineKeyboardMarkup(
         inline_keyboard=[
@@ -94,48 +199,60 @@ async def prompt_profile_step(user_id: int, step: str):
 
 
 async def continue_after_profile(user_id: int):
-    user = await sync_to_async(User.objects.get)(tg_id=user_id)
+    user = await aget_user(user_id)
     if not user.role:
         await bot.send_message(user_id, "Кто вы?", reply_markup=role_keyboard())
         return
 
-    user_progress[user_id] = 0
-    await bot.send_message(user_id, "Начинаем опрос 👇")
+    resumed = await begin_survey(user)
+    await bot.send_message(user_id, survey_intro(resumed))
     await send_next_poll(user_id)
 
 
 # ---------- /start ----------
-@dp.message(Command("start"))
-async def start_handler(message: Message):
-    user, _ = await sync_to_async(User.objects.get_or_create)(
-        tg_id=message.from_user.id
-    )
+async def open_survey(user_id: int):
+    user = await aget_user(user_id, create=True)
 
     profile_step = get_profile_step(user)
     if profile_step:
-        waiting_profile[message.from_user.id] = profile_step
-        await prompt_profile_step(message.from_user.id, profile_step)
+        await user_state(user_id).set_state(PROFILE_STATES[profile_step])
+        await prompt_profile_step(user_id, profile_step)
         return
 
     if not user.role:
-        await message.answer("Кто вы?", reply_markup=role_keyboard())
+        await bot.send_message(user_id, "Кто вы?", reply_markup=role_keyboard())
         return
 
-    user_progress[message.from_user.id] = 0
-    await message.answer("Начинаем опрос 👇")
-    await send_next_poll(message.from_user.id)
+    resumed = await begin_survey(user)
+    await bot.send_message(user_id, survey_intro(resumed))
+    await send_next_poll(user_id)
+
+
+@dp.message(Command("start"))
+async def start_handler(message: Message):
+    await open_survey(message.from_user.id)
+
+
+# кнопка из рассылки-напоминания
+@dp.callback_query(lambda c: c.data == "survey_start")
+async def survey_start_callback(callback: CallbackQuery):
+    await callback.answer()
+    await open_survey(callback.from_user.id)
 
 
 # ---------- /change_role ----------
 @dp.message(Command("change_role"))
 async def change_role_handler(message: Message):
-    user = await sync_to_async(User.objects.get)(tg_id=message.from_user.id)
+    user = await aget_user(message.from_user.id)
     user.role = None
-    await sync_to_async(user.save)()
+    await asave_user(user)
+    await answer_queue.flush()
+    await adiscard_session(user.id)
 
-    user_progress.pop(message.from_user.id, None)
-    waiting_text_answer.pop(message.from_user.id, None)
-    waiting_scale_answer.pop(message.from_user.id, None)
+    state = user_state(message.from_user.id)
+    if await state.get_state() not in {s.state for s in PROFILE_STATES.values()}:
+        await state.set_state(None)
+    await state.set_data({})
 
     await message.answer("Хорошо, давай выберем заново 👇", reply_markup=role_keyboard())
 
@@ -145,11 +262,11 @@ async def change_role_handler(message: Message):
 async def role_callback(callback: CallbackQuery):
     role = callback.data.replace("role_", "")
 
-    user = await sync_to_async(User.objects.get)(tg_id=callback.from_user.id)
+    user = await aget_user(callback.from_user.id)
     user.role = role
-    await sync_to_async(user.save)()
+    await asave_user(user)
 
-    user_progress[callback.from_user.id] = 0
+    await begin_survey(user, restart=True)
 
     await callback.message.edit_text("Роль сохранена ✅\nНачинаем опрос 👇")
     await send_next_poll(callback.from_user.id)
@@ -159,18 +276,18 @@ async def role_callback(callback: CallbackQuery):
 async def consent_callback(callback: CallbackQuery):
     decision = callback.data.replace("consent_", "")
     user_id = callback.from_user.id
-    user = await sync_to_async(User.objects.get)(tg_id=user_id)
+    user = await aget_user(user_id)
 
     if decision == "yes":
         user.consent_personal_data = True
-        await sync_to_async(user.save)()
-        waiting_profile.pop(user_id, None)
+        await asave_user(user)
+        await user_state(user_id).set_state(None)
         await callback.message.edit_text("Спасибо! Согласие сохранено ✅")
         await continue_after_profile(user_id)
     else:
         user.consent_personal_data = False
-        await sync_to_async(user.save)()
-        waiting_profile.pop(user_id, None)
+        await asave_user(user)
+        await user_state(user_id).set_state(None)
         await callback.message.edit_text(
             "Без согласия мы не можем продолжить опрос."
         )
@@ -180,22 +297,23 @@ async def consent_callback(callback: CallbackQuery):
 
 # ---------- SEND NEXT POLL ----------
 async def send_next_poll(user_id: int):
-    user = await sync_to_async(User.objects.get)(tg_id=user_id)
-    index = user_progress.get(user_id, 0)
-
-    polls = await sync_to_async(list)(
-        Poll.objects.filter(
-            role=user.role,
-            is_active=True
-        ).order_by("order", "id")
-    )
-
-    if index >= len(polls):
+    user = await aget_user(user_id)
+    index = await get_progress(user)
+    if index is None:
+        # открытой анкеты нет (отброшена или не начата) — начинаем её
+        await begin_survey(user)
+        index = await get_progress(user)
+
+    questionnaire = await aget_questionnaire(user.role)
+    poll = questionnaire.at(index)
+
+    if poll is None:
+        answer_queue.finish(user.id)
         await bot.send_message(user_id, "Спасибо! Опрос завершён ✅")
+        if user.role == "parent" and settings.OPENAI_API_KEY:
+            await enqueue_respondent_summary(user)
         return
 
-    poll = polls[index]
-
     # ---- choice ----
     if poll.question_type == "choice":
         msg = await bot.send_poll(
@@ -205,14 +323,14 @@ async def send_next_poll(user_id: int):
             is_anonymous=False
         )
 
-        await sync_to_async(
-            Poll.objects.filter(id=poll.id).update
-        )(telegram_poll_id=msg.poll.id)
+        await record_delivery(msg.poll.id, user.id, poll.id)
 
     # ---- text ----
     elif poll.question_type == "text":
         await bot.send_message(user_id, poll.question)
-        waiting_text_answer[user_id] = poll.id
+        state = user_state(user_id)
+        await state.update_data(poll_id=poll.id)
+        await state.set_state(SurveyState.text_answer)
 
     # ---- scale group ----
     elif poll.question_type == "scale_group":
@@ -220,13 +338,19 @@ async def send_next_poll(user_id: int):
         await start_scale_group_flow(user_id, poll)
 
 
+# ---------- RESPONDENT SUMMARY ----------
+async def enqueue_respondent_summary(user):
+    # сводку строит воркер (manage.py run_jobs) по сохранённым ответам,
+    # поэтому сначала дописываем очередь ответов
+    await answer_queue.flush()
+    await run_db(enqueue, "respondent_summary", {"user_id": user.id})
+
+
 # ---------- SCALE GROUP FLOW ----------
 async def start_scale_group_flow(user_id, poll):
-    waiting_scale_answer[user_id] = {
-        "poll_id": poll.id,
-        "options": poll.options,
-        "index": 0
-    }
+    state = user_state(user_id)
+    await state.update_data(poll_id=poll.id, scale_index=0)
+    await state.set_state(SurveyState.scale_answer)
 
     first = poll.options[0]
     await bot.send_message(
@@ -240,26 +364,33 @@ async def start_scale_group_flow(user_id, poll):
 async def poll_answer_handler(answer: PollAnswer):
     user_id = answer.user.id
 
-    user = await sync_to_async(User.objects.get)(tg_id=user_id)
+    # пустой список приходит, когда пользователь отозвал голос
+    if not answer.option_ids:
+        return
+
+    delivery = await resolve_delivery(answer.poll_id)
+    if delivery is None:
+        return
 
-    poll = await sync_to_async(
-        lambda: Poll.objects.filter(telegram_poll_id=answer.poll_id).first()
-    )()
+    user = await aget_user(user_id)
+    if user.id != delivery.user_id:
+        return
 
-    if not poll:
+    # голос в уже пройденном опросе (в том числе повторный после отзыва)
+    # не записывается и не сдвигает анкету с вопроса, на котором стоит респондент
+    current = await current_poll(user, delivery.poll_id)
+    if current is None:
+        return
+    progress, poll = current
+    if not await claim_delivery(answer.poll_id):
         return
 
     # 🔥 ВАЖНО: перебираем ВСЕ выбранные варианты
     for index in answer.option_ids:
         selected_text = poll.options[index]["text"]
+        answer_queue.put(delivery.user_id, poll.id, selected_text, option_index=index)
 
-        await sync_to_async(Answer.objects.create)(
-            user=user,
-            poll=poll,
-            answer=selected_text
-        )
-
-    user_progress[user_id] = user_progress.get(user_id, 0) + 1
+    await advance_progress(user, progress)
     await send_next_poll(user_id)
 
 
@@ -268,38 +399,38 @@ async def poll_answer_handler(answer: PollAnswer):
 async def handle_text_and_scale(message: Message):
     user_id = message.from_user.id
     text = message.text
+    state = user_state(user_id)
+    current_state = await state.get_state()
 
     # ----- PROFILE FLOW -----
-    if user_id in waiting_profile:
-        step = waiting_profile[user_id]
-        user = await sync_to_async(User.objects.get)(tg_id=user_id)
-
-        if step == "full_name":
-            user.full_name = text.strip()
-            await sync_to_async(user.save)()
-            waiting_profile[user_id] = "phone"
-            await message.answer("Введите номер телефона")
-            return
+    if current_state == SurveyState.full_name.state:
+        user = await aget_user(user_id)
+        user.full_name = text.strip()
+        await asave_user(user)
+        await state.set_state(SurveyState.phone)
+        await message.answer("Введите номер телефона")
+        return
 
-        if step == "phone":
-            user.phone_number = text.strip()
-            await sync_to_async(user.save)()
-            waiting_profile[user_id] = "consent"
-            await message.answer(
-                "Согласен с обработкой персональных данных",
-                reply_markup=consent_keyboard(),
-            )
-            return
+    if current_state == SurveyState.phone.state:
+        user = await aget_user(user_id)
+        user.phone_number = text.strip()
+        await asave_user(user)
+        await state.set_state(SurveyState.consent)
+        await message.answer(
+            "Согласен с обработкой персональных данных",
+            reply_markup=consent_keyboard(),
+        )
+        return
 
-        if step == "consent":
-            await message.answer(
-                "Пожалуйста, подтвердите согласие кнопкой ниже.",
-                reply_markup=consent_keyboard(),
-            )
-            return
+    if current_state == SurveyState.consent.state:
+        await message.answer(
+            "Пожалуйста, подтвердите согласие кнопкой ниже.",
+            reply_markup=consent_keyboard(),
+        )
+        return
 
     # ----- SCALE GROUP -----
-    if user_id in waiting_scale_answer:
+    if current_state == SurveyState.scale_answer.state:
         try:
             value = int(text)
             if not 1 <= value <= 10:
@@ -308,57 +439,170 @@ async def handle_text_and_scale(message: Message):
             await message.answer("Пожалуйста, введи число от 1 до 10")
             return
 
-        state = waiting_scale_answer[user_id]
-        poll_id = state["poll_id"]
-        options = state["options"]
-        idx = state["index"]
+        data = await state.get_data()
+        idx = data["scale_index"]
 
-        poll = await sync_to_async(Poll.objects.get)(id=poll_id)
-        user = await sync_to_async(User.objects.get)(tg_id=user_id)
+        user = await aget_user(user_id)
+        current = await current_poll(user, data["poll_id"])
+        if current is None:
+            # диалог отстал от сессии (например, после сбоя) — задаём текущий вопрос
+            await send_next_poll(user_id)
+            return
+        progress, poll = current
+        options = poll.options
 
         current = options[idx]
 
-        await sync_to_async(Answer.objects.create)(
-            user=user,
-            poll=poll,
-            answer=f"{current['key']}: {value}"
+        answer_queue.put(
+            user.id,
+            poll.id,
+            f"{current['key']}: {value}",
+            option_key=current["key"],
+            score=value,
         )
 
-        state["index"] += 1
+        idx += 1
 
-        if state["index"] < len(options):
-            next_opt = options[state["index"]]
+        if idx < len(options):
+            await state.update_data(scale_index=idx)
+            next_opt = options[idx]
             await message.answer(
                 f"{next_opt['key']}) {next_opt['text']}\n\nОцени от 1 до 10"
             )
         else:
-            waiting_scale_answer.pop(user_id)
-            user_progress[user_id] = user_progress.get(user_id, 0) + 1
+            await advance_progress(user, progress)
             await send_next_poll(user_id)
 
         return
 
     # ----- TEXT ANSWER -----
-    if user_id in waiting_text_answer:
-        poll_id = waiting_text_answer.pop(user_id)
+    if current_state == SurveyState.text_answer.state:
+        data = await state.get_data()
+        user = await aget_user(user_id)
+        current = await current_poll(user, data["poll_id"])
+        if current is None:
+            await send_next_poll(user_id)
+            return
+        progress, poll = current
+
+        # answer — короткая версия для списков, полный текст хранится в text
+        answer_queue.put(user.id, poll.id, text[:255], text=text)
+
+        await advance_progress(user, progress)
+        await send_next_poll(user_id)
+
+
+# ---------- WEBHOOK ----------
+webhook_slots = None  # asyncio.Semaphore, создаётся при старте приложения
+webhook_tasks = set()
+
+
+async def process_webhook_update(update: Update):
+    try:
+        await dp.feed_update(bot, update)
+    finally:
+        webhook_slots.release()
 
-        poll = await sync_to_async(Poll.objects.get)(id=poll_id)
-        user = await sync_to_async(User.objects.get)(tg_id=user_id)
 
-        await sync_to_async(Answer.objects.create)(
-            user=user,
-            poll=poll,
-            answer=text
+async def webhook_handler(request: web.Request) -> web.Response:
+    secret = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+    if not hmac.compare_digest(secret, settings.BOT_WEBHOOK_SECRET):
+        return web.Response(status=401)
+
+    update = Update.model_validate(await request.json(), context={"bot": bot})
+
+    # Не больше BOT_WEBHOOK_CONCURRENCY обновлений в работе: дальше Telegram
+    # ждёт ответа на webhook и сам придерживает следующие запросы
+    await webhook_slots.acquire()
+    task = asyncio.create_task(process_webhook_update(update))
+    webhook_tasks.add(task)
+    task.add_done_callback(webhook_tasks.discard)
+    return web.Response()
+
+
+async def on_webhook_startup():
+    global webhook_slots
+    webhook_slots = asyncio.Semaphore(settings.BOT_WEBHOOK_CONCURRENCY)
+    # Несколько воркеров за балансировщиком ставят один и тот же webhook — это безопасно
+    await bot.set_webhook(
+        url=settings.BOT_WEBHOOK_URL.rstrip("/") + settings.BOT_WEBHOOK_PATH,
+        secret_token=settings.BOT_WEBHOOK_SECRET,
+        allowed_updates=dp.resolve_used_update_types(),
+        max_connections=settings.BOT_WEBHOOK_MAX_CONNECTIONS,
+    )
+
+
+async def drain_webhook_updates():
+    # обновления в работе ещё кладут ответы в очередь и ходят в БД, поэтому
+    # их ждём до закрытия очереди, планировщика и пула (см. порядок ниже)
+    if webhook_tasks:
+        await asyncio.gather(*webhook_tasks, return_exceptions=True)
+
+
+def build_webhook_app() -> web.Application:
+    if not settings.BOT_WEBHOOK_URL or not settings.BOT_WEBHOOK_SECRET:
+        raise RuntimeError("BOT_WEBHOOK_URL and BOT_WEBHOOK_SECRET are required for webhook mode")
+
+    dp.startup.register(on_webhook_startup)
+
+    app = web.Application()
+    app.router.add_post(settings.BOT_WEBHOOK_PATH, webhook_handler)
+    setup_application(app, dp, bot=bot)
+    return app
+
+
+# ---------- BROADCASTS ----------
+broadcast_task = None
+
+
+async def send_broadcast_message(chat_id: int, text: str):
+    await bot.send_message(chat_id, text, reply_markup=survey_keyboard())
+
+
+async def start_broadcasts():
+    global broadcast_task
+    broadcast_task = asyncio.create_task(
+        broadcast_loop(
+            send_broadcast_message,
+            worker_id=f"{socket.gethostname()}:{os.getpid()}",
+            poll_interval=settings.BOT_BROADCAST_POLL_INTERVAL,
+            batch_size=settings.BOT_BROADCAST_BATCH_SIZE,
+            stale_after=settings.BOT_BROADCAST_STALE_AFTER,
         )
+    )
 
-        user_progress[user_id] = user_progress.get(user_id, 0) + 1
-        await send_next_poll(user_id)
+
+async def stop_broadcasts():
+    # ждём, пока рассылка вернётся в очередь: пул БД закрывается следом
+    if broadcast_task is not None:
+        broadcast_task.cancel()
+        with suppress(asyncio.CancelledError):
+            await broadcast_task
 
 
 # ---------- START ----------
+dp.startup.register(answer_queue.start)
+dp.startup.register(start_broadcasts)
+# aiogram вызывает обработчики остановки по порядку регистрации
+dp.shutdown.register(stop_broadcasts)
+dp.shutdown.register(drain_webhook_updates)
+dp.shutdown.register(answer_queue.close)
+dp.shutdown.register(send_scheduler.close)
+dp.shutdown.register(shutdown_db_pool)
+
+
 async def main():
+    # в режиме long polling webhook должен быть снят, иначе getUpdates вернёт ошибку
+    await bot.delete_webhook()
     await dp.start_polling(bot)
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    if settings.BOT_MODE == "webhook":
+        web.run_app(
+            build_webhook_app(),
+            host=settings.BOT_WEBHOOK_HOST,
+            port=settings.BOT_WEBHOOK_PORT,
+        )
+    else:
+        asyncio.run(main())
@@ -1,26 +1,67 @@
-from django.contrib import admin
+import difflib
+
 from django.conf import settings
+from django.contrib import admin
 from django.core.exceptions import PermissionDenied
-from django.http import HttpResponseRedirect
+from django.forms.models import BaseInlineFormSet
+from django.http import FileResponse, Http404, HttpResponseRedirect
+from django.template.response import TemplateResponse
 from django.urls import path, reverse
-import requests
+from django.utils.html import format_html
+from django.views.decorators.http import require_POST
 
-from .models import User, Poll, Answer
-from .ai.report import generate_parent_report_for_all
-from .ai.docx import build_docx_bytes
+from .models import (
+    User, Poll, Answer, SurveySession, Job, Broadcast, QuestionStat, FunnelStat, Report,
+)
+from .jobs import enqueue
+from .services.export import FORMATS, LAYOUTS
+from .services.reports import check_report_settings
+from .services.statistics import ROLES
 
 
 # ======================================================
 # INLINE: ответы пользователя (красивая смета)
 # ======================================================
 
+# Сколько последних ответов показывать на странице пользователя;
+# полный список — в разделе ответов с фильтром по респонденту
+ANSWER_INLINE_LIMIT = 50
+
+
+class LatestAnswersFormSet(BaseInlineFormSet):
+    def get_queryset(self):
+        if not hasattr(self, "_latest"):
+            self._latest = super().get_queryset()[:ANSWER_INLINE_LIMIT]
+        return self._latest
+
+    def total_count(self):
+        return self.queryset.count()
+
+    def full_list_url(self):
+        url = reverse("admin:polls_answer_changelist")
+        return f"{url}?{RespondentFilter.parameter_name}={self.instance.tg_id}"
+
+
 class AnswerInline(admin.TabularInline):
     model = Answer
+    formset = LatestAnswersFormSet
+    template = "admin/polls/user/answer_inline.html"
     extra = 0
     can_delete = False
     readonly_fields = ("pretty_poll", "pretty_answer", "created_at")
     fields = ("pretty_poll", "pretty_answer", "created_at")
 
+    def get_queryset(self, request):
+        # poll — через prefetch, а не JOIN: ответы на один вопрос получают общий
+        # объект Poll, и его options_by_key считается один раз;
+        # user нужен в Answer.__str__ для подписи каждой строки
+        return (
+            super().get_queryset(request)
+            .select_related("user")
+            .prefetch_related("poll")
+            .order_by("-created_at")
+        )
+
     def has_add_permission(self, request, obj=None):
         return False
 
@@ -28,30 +69,18 @@ class AnswerInline(admin.TabularInline):
     def pretty_poll(self, obj):
         poll = obj.poll
 
-        if poll.question_type == "scale_group":
-            try:
-                letter, _ = obj.answer.split(":")
-                letter = letter.strip()
-
-                for opt in poll.options:
-                    if opt.get("key") == letter:
-                        return f"{poll.question}\n— {letter}) {opt.get('text')}"
-
-                return poll.question
-            except Exception:
-                return poll.question
+        if poll.question_type == "scale_group" and obj.option_key:
+            statement = poll.options_by_key.get(obj.option_key)
+            if statement:
+                return f"{poll.question}\n— {obj.option_key}) {statement}"
 
         return poll.question
 
     @admin.display(description="Ответ")
     def pretty_answer(self, obj):
-        if obj.poll.question_type == "scale_group":
-            try:
-                return obj.answer.split(":")[1].strip()
-            except Exception:
-                return obj.answer
-
-        return obj.answer
+        if obj.score is not None:
+            return obj.score
+        return obj.text or obj.answer
 
 
 # ======================================================
@@ -60,78 +89,26 @@ class AnswerInline(admin.TabularInline):
 
 @admin.action(description="🤖 Сформировать AI-отчёт по всем анкетам и отправить админу")
 def send_ai_report(modeladmin, request, queryset):
-    admins = User.objects.filter(is_admin=True)
-
-    if not admins.exists():
-        modeladmin.message_user(
-            request,
-            "❌ Нет пользователей с флагом is_admin",
-            level="error"
-        )
+    error = check_report_settings()
+    if error:
+        modeladmin.message_user(request, error, level="error")
         return
 
-    if not getattr(settings, "BOT_TOKEN", None):
-        modeladmin.message_user(
-            request,
-            "❌ BOT_TOKEN не задан в settings.py",
-            level="error"
-        )
-        return
-
-    if not getattr(settings, "OPENAI_API_KEY", None):
-        modeladmin.message_user(
-            request,
-            "❌ OPENAI_API_KEY не задан в settings.py",
-            level="error"
-        )
-        return
-
-    try:
-        report_text = generate_parent_report_for_all()
-    except Exception as e:
-        modeladmin.message_user(
-            request,
-            f"❌ Ошибка генерации AI-отчёта: {e}",
-            level="error"
-        )
-        return
-
-    if not report_text:
-        modeladmin.message_user(
-            request,
-            "❌ Нет анкет родителей для анализа",
-            level="error"
-        )
-        return
-
-    report_docx = build_docx_bytes(report_text)
-    for admin_user in admins:
-        try:
-            requests.post(
-                f"https://api.telegram.org/bot{settings.BOT_TOKEN}/sendDocument",
-                data={
-                    "chat_id": admin_user.tg_id,
-                    "caption": "AI-отчёт по анкетам родителей (Word)",
-                },
-                files={
-                    "document": (
-                        "parent_report.docx",
-                        report_docx,
-                        "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-                    )
-                },
-                timeout=30,
-            )
-        except Exception as e:
-            modeladmin.message_user(
-                request,
-                f"❌ Ошибка отправки админу {admin_user.tg_id}: {e}",
-                level="error"
-            )
-
+    # повторный клик не ставит второй отчёт, пока первый не готов
+    job = (
+        Job.objects
+        .filter(kind="parent_report", status__in=[Job.STATUS_PENDING, Job.STATUS_RUNNING])
+        .first()
+    ) or enqueue("parent_report", max_attempts=2)
+    job_url = reverse("admin:polls_job_change", args=[job.pk])
     modeladmin.message_user(
         request,
-        "✅ AI-отчёт успешно сформирован и отправлен"
+        format_html(
+            "⏳ AI-отчёт поставлен в очередь: <a href=\"{}\">задача #{}</a>. "
+            "Готовый отчёт придёт администраторам в Telegram.",
+            job_url,
+            job.pk,
+        ),
     )
 
 
@@ -201,9 +178,501 @@ class PollAdmin(admin.ModelAdmin):
 # ANSWER
 # ======================================================
 
+def _export_selection(request, queryset):
+    """
+    Что выгрузить по действию над списком: отмеченные строки, а если выбраны
+    все строки — фильтры и поиск списка, по которым воркер сам прочитает ответы.
+    """
+    if request.POST.get("select_across") != "1":
+        # отмечены строки одной страницы списка
+        return {"answer_ids": list(queryset.values_list("pk", flat=True))}
+
+    selection = {"search": request.GET.get("q", "")}
+    poll_id = request.GET.get("poll__id__exact", "")
+    if poll_id.isdigit():
+        selection["poll_id"] = int(poll_id)
+    tg_id = request.GET.get(RespondentFilter.parameter_name, "").strip()
+    if tg_id:
+        if not tg_id.lstrip("-").isdigit():
+            # так же, как RespondentFilter: некорректный tg_id не находит ничего
+            return {"answer_ids": []}
+        selection["tg_id"] = int(tg_id)
+    return selection
+
+
+@admin.action(description="📄 CSV: выбранные ответы, строка на ответ", permissions=["export"])
+def export_csv_long(modeladmin, request, queryset):
+    modeladmin.enqueue_export(request, "csv", "long", selection=_export_selection(request, queryset))
+
+
+@admin.action(description="📄 CSV: выбранные ответы, строка на респондента", permissions=["export"])
+def export_csv_wide(modeladmin, request, queryset):
+    modeladmin.enqueue_export(request, "csv", "wide", selection=_export_selection(request, queryset))
+
+
+class RespondentFilter(admin.SimpleListFilter):
+    """Фильтр по tg_id полем ввода: выпадающий список всех пользователей не масштабируется."""
+    title = "Респондент (tg_id)"
+    parameter_name = "tg_id"
+    template = "admin/polls/input_filter.html"
+
+    def lookups(self, request, model_admin):
+        # фильтр выводится, только если lookups не пуст; варианты рисует шаблон
+        return [("", "")]
+
+    def queryset(self, request, queryset):
+        value = (self.value() or "").strip()
+        if not value:
+            return queryset
+        if not value.lstrip("-").isdigit():
+            return queryset.none()
+        return queryset.filter(user__tg_id=int(value))
+
+    def choices(self, changelist):
+        yield {
+            "value": self.value() or "",
+            "reset_url": changelist.get_query_string(remove=[self.parameter_name]),
+            # остальные фильтры сохраняются скрытыми полями формы
+            "hidden": [
+                (key, value)
+                for key, values in changelist.get_filters_params().items()
+                if key != self.parameter_name
+                for value in (values if isinstance(values, list) else [values])
+            ],
+        }
+
+
 @admin.register(Answer)
 class AnswerAdmin(admin.ModelAdmin):
+    change_list_template = "admin/polls/answer/change_list.html"
     list_display = ("user", "poll", "answer", "created_at")
-    list_filter = ("poll", "user")
+    list_filter = ("poll", RespondentFilter)
+    list_select_related = ("user", "poll")
+    autocomplete_fields = ("user", "poll")
     search_fields = ("answer",)
     ordering = ("-created_at",)
+    # на сотнях тысяч ответов не считаем COUNT(*) всей таблицы при каждом поиске
+    show_full_result_count = False
+    actions = [export_csv_long, export_csv_wide]
+
+    def get_urls(self):
+        urls = super().get_urls()
+        custom_urls = [
+            path(
+                "export/",
+                self.admin_site.admin_view(require_POST(self.export_view)),
+                name="polls_answer_export",
+            ),
+        ]
+        return custom_urls + urls
+
+    def has_export_permission(self, request):
+        return request.user.has_perm("polls.export_answer")
+
+    def changelist_view(self, request, extra_context=None):
+        extra_context = {"can_export": self.has_export_permission(request), **(extra_context or {})}
+        return super().changelist_view(request, extra_context)
+
+    def export_view(self, request):
+        """Полная выгрузка собирается воркером задач, а не в запросе админки."""
+        if not self.has_export_permission(request):
+            raise PermissionDenied
+
+        fmt = request.POST.get("format", "csv")
+        layout = request.POST.get("layout", "long")
+        if fmt not in FORMATS or layout not in LAYOUTS:
+            raise Http404
+
+        # пустая роль — выгрузка по всем ролям
+        role = request.POST.get("role", "")
+        if role and role not in ROLES:
+            self.message_user(
+                request,
+                f"Неизвестная роль «{role}»: допустимы {', '.join(ROLES)} или пусто для всех ролей",
+                level="error",
+            )
+            return HttpResponseRedirect(reverse("admin:polls_answer_changelist"))
+
+        self.enqueue_export(request, fmt, layout, role)
+        return HttpResponseRedirect(reverse("admin:polls_answer_changelist"))
+
+    def enqueue_export(self, request, fmt, layout, role="", selection=None):
+        """Выгрузка собирается воркером задач: запрос админки не держит воркер веб-сервера."""
+        payload = {"format": fmt, "layout": layout, "role": role}
+        if selection is not None:
+            payload["selection"] = selection
+        job = enqueue("export", payload, max_attempts=1)
+        self.message_user(
+            request,
+            format_html(
+                "⏳ Выгрузка поставлена в очередь: <a href=\"{}\">задача #{}</a>. "
+                "Когда она завершится, файл можно скачать со страницы задачи.",
+                reverse("admin:polls_job_change", args=[job.pk]),
+                job.pk,
+            ),
+        )
+
+
+# ======================================================
+# SURVEY SESSION
+# ======================================================
+
+@admin.register(SurveySession)
+class SurveySessionAdmin(admin.ModelAdmin):
+    list_display = (
+        "user",
+        "role",
+        "position",
+        "questionnaire_version",
+        "started_at",
+        "finished_at",
+    )
+    list_filter = ("role",)
+    list_select_related = ("user",)
+    raw_id_fields = ("user", "poll")
+    ordering = ("-started_at",)
+
+
+# ======================================================
+# JOB
+# ======================================================
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    change_form_template = "admin/polls/job/change_form.html"
+    list_display = (
+        "id",
+        "kind",
+        "status",
+        "progress",
+        "progress_message",
+        "attempts",
+        "created_at",
+        "finished_at",
+    )
+    list_filter = ("status", "kind")
+    ordering = ("-id",)
+    readonly_fields = (
+        "kind",
+        "status",
+        "payload",
+        "result",
+        "error",
+        "progress",
+        "progress_message",
+        "attempts",
+        "max_attempts",
+        "run_after",
+        "locked_by",
+        "heartbeat_at",
+        "created_at",
+        "started_at",
+        "finished_at",
+        "download",
+    )
+
+    def has_add_permission(self, request):
+        return False
+
+    def get_urls(self):
+        urls = super().get_urls()
+        custom_urls = [
+            path(
+                "<int:job_id>/download/",
+                self.admin_site.admin_view(self.download_view),
+                name="polls_job_download",
+            ),
+        ]
+        return custom_urls + urls
+
+    @admin.display(description="Файл")
+    def download(self, obj):
+        if obj.kind != "export" or obj.status != Job.STATUS_DONE or not obj.result:
+            return "—"
+        return format_html(
+            "<a href=\"{}\">⬇ {}</a> ({} строк)",
+            reverse("admin:polls_job_download", args=[obj.pk]),
+            obj.result["file"],
+            obj.result["rows"],
+        )
+
+    def download_view(self, request, job_id):
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+
+        job = Job.objects.filter(pk=job_id, kind="export", status=Job.STATUS_DONE).first()
+        if job is None or not job.result:
+            raise Http404
+
+        # имя файла берётся из результата задачи; за пределы EXPORT_ROOT не выходим
+        root = settings.EXPORT_ROOT.resolve()
+        file_path = (root / job.result["file"]).resolve()
+        if file_path.parent != root or not file_path.is_file():
+            raise Http404
+        return FileResponse(open(file_path, "rb"), as_attachment=True, filename=file_path.name)
+
+
+# ======================================================
+# REPORT
+# ======================================================
+
+@admin.action(description="🔍 Сравнить два выбранных отчёта")
+def compare_reports(modeladmin, request, queryset):
+    ids = sorted(queryset.values_list("pk", flat=True))
+    if len(ids) != 2:
+        modeladmin.message_user(request, "Выберите ровно два отчёта", level="error")
+        return None
+    url = reverse("admin:polls_report_diff", args=[ids[1]])
+    return HttpResponseRedirect(f"{url}?against={ids[0]}")
+
+
+@admin.register(Report)
+class ReportAdmin(admin.ModelAdmin):
+    list_display = (
+        "id",
+        "created_at",
+        "answers",
+        "model",
+        "tokens",
+        "total_seconds",
+        "download",
+        "diff",
+    )
+    list_filter = ("role", "model")
+    actions = [compare_reports]
+    fields = (
+        "created_at",
+        "role",
+        "model",
+        "finished_only",
+        "watermark",
+        "requests",
+        "prompt_tokens",
+        "completion_tokens",
+        "timings",
+        "download",
+        "diff",
+        "text",
+    )
+    readonly_fields = fields
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def get_urls(self):
+        urls = super().get_urls()
+        custom_urls = [
+            path(
+                "<int:report_id>/download/",
+                self.admin_site.admin_view(self.download_view),
+                name="polls_report_download",
+            ),
+            path(
+                "<int:report_id>/diff/",
+                self.admin_site.admin_view(self.diff_view),
+                name="polls_report_diff",
+            ),
+        ]
+        return custom_urls + urls
+
+    @admin.display(description="Ответов")
+    def answers(self, obj):
+        return obj.watermark.get("count")
+
+    @admin.display(description="Токены")
+    def tokens(self, obj):
+        return obj.prompt_tokens + obj.completion_tokens
+
+    @admin.display(description="Время, с")
+    def total_seconds(self, obj):
+        return obj.timings.get("total")
+
+    @admin.display(description="DOCX")
+    def download(self, obj):
+        if not obj.docx:
+            return "—"
+        return format_html(
+            "<a href=\"{}\">⬇ Скачать</a>",
+            reverse("admin:polls_report_download", args=[obj.pk]),
+        )
+
+    @admin.display(description="Изменения")
+    def diff(self, obj):
+        return format_html(
+            "<a href=\"{}\">с предыдущим</a>",
+            reverse("admin:polls_report_diff", args=[obj.pk]),
+        )
+
+    def download_view(self, request, report_id):
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+
+        report = Report.objects.filter(pk=report_id).first()
+        if report is None or not report.docx:
+            raise Http404
+        return FileResponse(
+            report.docx.open("rb"),
+            as_attachment=True,
+            filename=f"parent_report_{report.pk}.docx",
+        )
+
+    def diff_view(self, request, report_id):
+        """Построчное сравнение текста отчёта с выбранным (по умолчанию — предыдущим)."""
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+
+        report = Report.objects.filter(pk=report_id).first()
+        if report is None:
+            raise Http404
+
+        against = request.GET.get("against")
+        if against:
+            if not against.isdigit():
+                raise Http404
+            other = Report.objects.filter(pk=against).first()
+        else:
+            other = Report.objects.filter(role=report.role, pk__lt=report.pk).first()
+
+        table = ""
+        if other is not None:
+            table = difflib.HtmlDiff(wrapcolumn=90).make_table(
+                other.text.splitlines(),
+                report.text.splitlines(),
+                fromdesc=str(other),
+                todesc=str(report),
+                context=True,
+                numlines=3,
+            )
+
+        return TemplateResponse(request, "admin/polls/report/diff.html", {
+            **self.admin_site.each_context(request),
+            "opts": self.model._meta,
+            "title": f"{report} — изменения",
+            "report": report,
+            "other": other,
+            "table": table,
+        })
+
+
+# ======================================================
+# BROADCAST
+# ======================================================
+
+@admin.action(description="⏹ Остановить рассылку")
+def cancel_broadcasts(modeladmin, request, queryset):
+    updated = queryset.filter(
+        status__in=[Broadcast.STATUS_PENDING, Broadcast.STATUS_RUNNING]
+    ).update(status=Broadcast.STATUS_CANCELLED)
+    modeladmin.message_user(request, f"Остановлено рассылок: {updated}")
+
+
+@admin.register(Broadcast)
+class BroadcastAdmin(admin.ModelAdmin):
+    list_display = (
+        "id",
+        "role",
+        "audience",
+        "status",
+        "sent",
+        "blocked",
+        "failed",
+        "created_at",
+        "finished_at",
+    )
+    list_filter = ("status", "role", "audience")
+    ordering = ("-id",)
+    actions = [cancel_broadcasts]
+    readonly_fields = (
+        "status",
+        "last_user_id",
+        "sent",
+        "failed",
+        "blocked",
+        "locked_by",
+        "started_at",
+        "finished_at",
+    )
+
+
+# ======================================================
+# STATISTICS
+# ======================================================
+
+@admin.register(QuestionStat)
+class QuestionStatAdmin(admin.ModelAdmin):
+    change_list_template = "admin/polls/questionstat/change_list.html"
+    list_display = (
+        "poll",
+        "option_key",
+        "label",
+        "answers",
+        "share",
+        "mean",
+        "median",
+        "p25",
+        "p75",
+        "computed_at",
+    )
+    list_filter = ("role", "kind", "finished_only")
+    list_select_related = ("poll",)
+    ordering = ("poll__order", "poll_id", "option_index", "option_key")
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def get_urls(self):
+        urls = super().get_urls()
+        custom_urls = [
+            path(
+                "refresh/",
+                self.admin_site.admin_view(require_POST(self.refresh_view)),
+                name="polls_questionstat_refresh",
+            ),
+        ]
+        return custom_urls + urls
+
+    def has_refresh_permission(self, request):
+        # таблицы только для чтения, поэтому пересчёт — отдельное право, а не change
+        return request.user.has_perm("polls.refresh_questionstat")
+
+    def changelist_view(self, request, extra_context=None):
+        extra_context = {"can_refresh": self.has_refresh_permission(request), **(extra_context or {})}
+        return super().changelist_view(request, extra_context)
+
+    def refresh_view(self, request):
+        if not self.has_refresh_permission(request):
+            raise PermissionDenied
+
+        job = (
+            Job.objects
+            .filter(kind="statistics", status__in=[Job.STATUS_PENDING, Job.STATUS_RUNNING])
+            .first()
+        ) or enqueue("statistics")
+        self.message_user(
+            request,
+            format_html(
+                "⏳ Пересчёт поставлен в очередь: <a href=\"{}\">задача #{}</a>.",
+                reverse("admin:polls_job_change", args=[job.pk]),
+                job.pk,
+            ),
+        )
+        return HttpResponseRedirect(reverse("admin:polls_questionstat_changelist"))
+
+
+@admin.register(FunnelStat)
+class FunnelStatAdmin(admin.ModelAdmin):
+    list_display = ("role", "step", "poll", "reached", "answered", "computed_at")
+    list_filter = ("role", "finished_only")
+    list_select_related = ("poll",)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
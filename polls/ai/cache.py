@@ -0,0 +1,57 @@
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Count, Max
+
+from ..models import Answer
+from ..services.questionnaire import get_questionnaire
+from ..services.sessions import finished_user_ids
+from . import prompts
+
+
+def report_cache():
+    """Готовые отчёты."""
+    return caches["reports"]
+
+
+def completion_cache():
+    """Ответы модели на промежуточные свёртки (``ReportEngine``)."""
+    return caches["report_completions"]
+
+
+def parent_answers_watermark(finished_only=False):
+    """Отпечаток набора ответов родителей: меняется при любом добавлении или удалении ответа."""
+    answers = Answer.objects.filter(user__role="parent")
+    if finished_only:
+        answers = answers.filter(user_id__in=finished_user_ids("parent"))
+
+    watermark = answers.aggregate(count=Count("id"), max_id=Max("id"))
+    # текст вопросов входит в корпус, поэтому правка анкеты тоже сбрасывает кэш
+    watermark["questionnaire"] = get_questionnaire("parent").version
+    return watermark
+
+
+def parent_report_cache_key(watermark, finished_only=False, statistics_at=None):
+    payload = {
+        "prompts": [
+            prompts.PARENT_REPORT_PROMPT,
+            prompts.PARENT_CHUNK_PROMPT,
+            prompts.PARENT_REDUCE_PROMPT,
+            prompts.PARENT_SUMMARIES_HEADER,
+            prompts.PARENT_STATISTICS_HEADER,
+        ],
+        "model": settings.AI_REPORT_MODEL,
+        "temperature": settings.AI_REPORT_TEMPERATURE,
+        "chunk_tokens": settings.AI_REPORT_CHUNK_TOKENS,
+        "finished_only": finished_only,
+        "answers": watermark,
+        # воронка зависит ещё и от сессий: отчёт пересобирается и после
+        # пересчёта таблиц статистики, даже если ответы не менялись
+        "statistics": statistics_at.isoformat() if statistics_at else None,
+    }
+    digest = hashlib.sha256(
+        json.dumps(payload, ensure_ascii=False, sort_keys=True).encode("utf-8")
+    ).hexdigest()
+    return f"parent-report:{digest}"
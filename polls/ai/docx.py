@@ -1,135 +1,472 @@
+import io
+import re
+import tempfile
+import zipfile
+from functools import lru_cache
 from io import BytesIO
 from xml.sax.saxutils import escape
-import zipfile
 
+from .markdown import (
+    Heading,
+    ListItem,
+    Paragraph,
+    Rule,
+    TableEnd,
+    TableRow,
+    TableStart,
+    iter_lines,
+    parse_inline,
+    tokenize,
+)
+
+
+# ======================================================
+# СТАТИЧЕСКИЕ ЧАСТИ ПАКЕТА (собраны один раз при импорте)
+# ======================================================
 
-def _is_table_separator(line):
-    stripped = line.strip()
-    if not stripped or "-" not in stripped:
-        return False
-    for char in stripped:
-        if char not in "|-: ":
-            return False
-    return True
+_NAMESPACES = (
+    'xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships" '
+    'xmlns:wp="http://schemas.openxmlformats.org/drawingml/2006/wordprocessingDrawing" '
+    'xmlns:a="http://schemas.openxmlformats.org/drawingml/2006/main" '
+    'xmlns:c="http://schemas.openxmlformats.org/drawingml/2006/chart"'
+)
 
+DOCUMENT_HEAD = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    f"<w:document {_NAMESPACES}><w:body>"
+)
+DOCUMENT_TAIL = "</w:body></w:document>"
 
-def _split_table_row(line):
-    parts = line.strip().strip("|").split("|")
-    return [part.strip() for part in parts]
+CONTENT_TYPES_HEAD = (
+    '<?xml version="1.0" encoding="UTF-8"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/'
+    'vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/word/document.xml" ContentType="application/'
+    'vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+    '<Override PartName="/word/styles.xml" ContentType="application/'
+    'vnd.openxmlformats-officedocument.wordprocessingml.styles+xml"/>'
+    '<Override PartName="/word/numbering.xml" ContentType="application/'
+    'vnd.openxmlformats-officedocument.wordprocessingml.numbering+xml"/>'
+).encode()
+CONTENT_TYPES_CHART = (
+    '<Override PartName="/word/charts/chart{}.xml" ContentType="application/'
+    'vnd.openxmlformats-officedocument.drawingml.chart+xml"/>'
+)
+CONTENT_TYPES_TAIL = b"</Types>"
 
+PACKAGE_RELS = (
+    '<?xml version="1.0" encoding="UTF-8"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/'
+    'officeDocument/2006/relationships/officeDocument" Target="word/document.xml"/>'
+    "</Relationships>"
+).encode()
 
-def _build_paragraph_xml(text):
-    if text.strip() == "":
-        return "<w:p/>"
-    safe_text = escape(text)
+DOCUMENT_RELS_HEAD = (
+    '<?xml version="1.0" encoding="UTF-8"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/'
+    'officeDocument/2006/relationships/styles" Target="styles.xml"/>'
+    '<Relationship Id="rId2" Type="http://schemas.openxmlformats.org/'
+    'officeDocument/2006/relationships/numbering" Target="numbering.xml"/>'
+).encode()
+DOCUMENT_RELS_CHART = (
+    '<Relationship Id="rIdChart{0}" Type="http://schemas.openxmlformats.org/'
+    'officeDocument/2006/relationships/chart" Target="charts/chart{0}.xml"/>'
+)
+DOCUMENT_RELS_TAIL = b"</Relationships>"
+
+HEADING_LEVELS = 4
+HEADING_SIZES = {1: 32, 2: 28, 3: 26, 4: 24}  # в полупунктах
+
+
+def _heading_style(level):
     return (
-        "<w:p><w:r><w:t xml:space=\"preserve\">"
-        f"{safe_text}"
-        "</w:t></w:r></w:p>"
+        f'<w:style w:type="paragraph" w:styleId="Heading{level}">'
+        f'<w:name w:val="heading {level}"/><w:basedOn w:val="Normal"/>'
+        '<w:next w:val="Normal"/><w:qFormat/>'
+        '<w:pPr><w:keepNext/><w:spacing w:before="240" w:after="120"/>'
+        f'<w:outlineLvl w:val="{level - 1}"/></w:pPr>'
+        f'<w:rPr><w:b/><w:sz w:val="{HEADING_SIZES[level]}"/></w:rPr>'
+        "</w:style>"
     )
 
 
-def _build_table_xml(rows):
-    if not rows:
-        return ""
+STYLES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<w:styles xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+    '<w:style w:type="paragraph" w:default="1" w:styleId="Normal">'
+    '<w:name w:val="Normal"/><w:qFormat/>'
+    '<w:pPr><w:spacing w:after="120"/></w:pPr>'
+    "</w:style>"
+    + "".join(_heading_style(level) for level in range(1, HEADING_LEVELS + 1))
+    + "</w:styles>"
+).encode()
 
-    column_count = max(len(row) for row in rows)
-    grid_cols = "".join("<w:gridCol w:w=\"2400\"/>" for _ in range(column_count))
-    tbl_pr = (
-        "<w:tblPr>"
-        "<w:tblBorders>"
-        "<w:top w:val=\"single\" w:sz=\"4\" w:color=\"auto\"/>"
-        "<w:left w:val=\"single\" w:sz=\"4\" w:color=\"auto\"/>"
-        "<w:bottom w:val=\"single\" w:sz=\"4\" w:color=\"auto\"/>"
-        "<w:right w:val=\"single\" w:sz=\"4\" w:color=\"auto\"/>"
-        "<w:insideH w:val=\"single\" w:sz=\"4\" w:color=\"auto\"/>"
-        "<w:insideV w:val=\"single\" w:sz=\"4\" w:color=\"auto\"/>"
-        "</w:tblBorders>"
-        "</w:tblPr>"
-    )
+LIST_LEVELS = 9
+BULLETS = "•◦▪"
 
-    table_rows = []
-    for row in rows:
-        cells = row + [""] * (column_count - len(row))
-        row_cells = []
-        for cell in cells:
-            safe_text = escape(cell)
-            row_cells.append(
-                "<w:tc><w:tcPr/><w:p><w:r><w:t xml:space=\"preserve\">"
-                f"{safe_text}"
-                "</w:t></w:r></w:p></w:tc>"
-            )
-        table_rows.append("<w:tr>" + "".join(row_cells) + "</w:tr>")
-
-    return "<w:tbl>" + tbl_pr + f"<w:tblGrid>{grid_cols}</w:tblGrid>" + "".join(table_rows) + "</w:tbl>"
-
-
-def _build_body_xml(text):
-    lines = text.splitlines() or [""]
-
-    blocks = []
-    index = 0
-    while index < len(lines):
-        line = lines[index]
-        next_line = lines[index + 1] if index + 1 < len(lines) else ""
-        if "|" in line and _is_table_separator(next_line):
-            header = _split_table_row(line)
-            rows = [header]
-            index += 2
-            while index < len(lines):
-                row_line = lines[index]
-                if "|" not in row_line:
-                    break
-                rows.append(_split_table_row(row_line))
-                index += 1
-            blocks.append(_build_table_xml(rows))
-            continue
-
-        blocks.append(_build_paragraph_xml(line))
-        index += 1
-
-    return "".join(blocks)
 
+def _list_level(level, ordered):
+    if ordered:
+        number_format = '<w:numFmt w:val="decimal"/>' f'<w:lvlText w:val="%{level + 1}."/>'
+    else:
+        number_format = (
+            '<w:numFmt w:val="bullet"/>'
+            f'<w:lvlText w:val="{BULLETS[level % len(BULLETS)]}"/>'
+        )
+    return (
+        f'<w:lvl w:ilvl="{level}"><w:start w:val="1"/>{number_format}'
+        '<w:lvlJc w:val="left"/>'
+        f'<w:pPr><w:ind w:left="{720 * (level + 1)}" w:hanging="360"/></w:pPr></w:lvl>'
+    )
 
-def build_docx_bytes(text):
-    body_xml = _build_body_xml(text)
-
-    document_xml = (
-        "<?xml version=\"1.0\" encoding=\"UTF-8\" standalone=\"yes\"?>"
-        "<w:document xmlns:w=\"http://schemas.openxmlformats.org/"
-        "wordprocessingml/2006/main\">"
-        "<w:body>"
-        f"{body_xml}"
-        "</w:body>"
-        "</w:document>"
+
+# abstractNum 0 — маркеры, 1 — нумерация; w:num 1 — общий маркированный список,
+# нумерованным спискам номера выдаются при записи, чтобы каждый начинался заново
+NUMBERING_HEAD = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<w:numbering xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+    + "".join(
+        f'<w:abstractNum w:abstractNumId="{ordered:d}"><w:multiLevelType w:val="multilevel"/>'
+        + "".join(_list_level(level, ordered) for level in range(LIST_LEVELS))
+        + "</w:abstractNum>"
+        for ordered in (False, True)
     )
+    + '<w:num w:numId="1"><w:abstractNumId w:val="0"/></w:num>'
+).encode()
+NUMBERING_ORDERED = (
+    '<w:num w:numId="{0}"><w:abstractNumId w:val="1"/>'
+    '<w:lvlOverride w:ilvl="{1}"><w:startOverride w:val="{2}"/></w:lvlOverride></w:num>'
+)
+NUMBERING_TAIL = b"</w:numbering>"
+
+TABLE_PROPERTIES = (
+    "<w:tblPr>"
+    "<w:tblBorders>"
+    '<w:top w:val="single" w:sz="4" w:color="auto"/>'
+    '<w:left w:val="single" w:sz="4" w:color="auto"/>'
+    '<w:bottom w:val="single" w:sz="4" w:color="auto"/>'
+    '<w:right w:val="single" w:sz="4" w:color="auto"/>'
+    '<w:insideH w:val="single" w:sz="4" w:color="auto"/>'
+    '<w:insideV w:val="single" w:sz="4" w:color="auto"/>'
+    "</w:tblBorders>"
+    "</w:tblPr>"
+)
+
+# Размер диаграммы в EMU: 16 × 9 см
+CHART_WIDTH = 5760000
+CHART_HEIGHT = 3240000
+
 
-    content_types_xml = (
-        "<?xml version=\"1.0\" encoding=\"UTF-8\"?>"
-        "<Types xmlns=\"http://schemas.openxmlformats.org/package/2006/"
-        "content-types\">"
-        "<Default Extension=\"rels\" ContentType=\"application/"
-        "vnd.openxmlformats-package.relationships+xml\"/>"
-        "<Default Extension=\"xml\" ContentType=\"application/xml\"/>"
-        "<Override PartName=\"/word/document.xml\" ContentType=\"application/"
-        "vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml\"/>"
-        "</Types>"
+@lru_cache(maxsize=32)
+def _table_start(column_count):
+    grid = '<w:gridCol w:w="2400"/>' * column_count
+    return f"<w:tbl>{TABLE_PROPERTIES}<w:tblGrid>{grid}</w:tblGrid>"
+
+
+@lru_cache(maxsize=64)
+def _cell_starts(column_count, align):
+    """Начало ячейки каждой колонки вместе с её выравниванием."""
+    align = align[:column_count] + ("left",) * (column_count - len(align))
+    return tuple(
+        "<w:tc><w:tcPr/><w:p>"
+        + (f'<w:pPr><w:jc w:val="{a}"/></w:pPr>' if a in ("center", "right") else "")
+        for a in align
     )
 
-    rels_xml = (
-        "<?xml version=\"1.0\" encoding=\"UTF-8\"?>"
-        "<Relationships xmlns=\"http://schemas.openxmlformats.org/package/2006/"
-        "relationships\">"
-        "<Relationship Id=\"rId1\" Type=\"http://schemas.openxmlformats.org/"
-        "officeDocument/2006/relationships/officeDocument\" "
-        "Target=\"word/document.xml\"/>"
-        "</Relationships>"
+
+# ======================================================
+# ТЕКСТ
+# ======================================================
+
+# Управляющие символы запрещены в XML 1.0 — Word не откроет такой файл
+_INVALID_XML = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]")
+_NUMBER = re.compile(r"-?\d+(?:[.,]\d+)?")
+
+_RUN_PROPERTIES = {
+    (False, False): "",
+    (True, False): "<w:rPr><w:b/></w:rPr>",
+    (False, True): "<w:rPr><w:i/></w:rPr>",
+    (True, True): "<w:rPr><w:b/><w:i/></w:rPr>",
+}
+_CODE_PROPERTIES = '<w:rPr><w:rFonts w:ascii="Consolas" w:hAnsi="Consolas" w:cs="Consolas"/></w:rPr>'
+
+
+def _escape(text):
+    # обычный текст (печатные символы без &, <, >) проверяется без регулярного выражения
+    if text.isprintable() and "&" not in text and "<" not in text and ">" not in text:
+        return text
+    return escape(_INVALID_XML.sub("", text))
+
+
+def _run(text, bold=False, italic=False, code=False):
+    if not text:
+        return ""
+    properties = _CODE_PROPERTIES if code else _RUN_PROPERTIES[bold, italic]
+    return f'<w:r>{properties}<w:t xml:space="preserve">{_escape(text)}</w:t></w:r>'
+
+
+def _runs(text):
+    """Строка markdown с **жирным**, *курсивом* и `кодом` в виде последовательности <w:r>."""
+    # экранирование не трогает разделители *, _ и `, поэтому строка экранируется
+    # один раз целиком, а не каждый фрагмент отдельно
+    text = _escape(text)
+    if "*" not in text and "_" not in text and "`" not in text:
+        return f'<w:r><w:t xml:space="preserve">{text}</w:t></w:r>' if text else ""
+    return "".join([
+        f"<w:r>{_CODE_PROPERTIES if code else _RUN_PROPERTIES[bold, italic]}"
+        f'<w:t xml:space="preserve">{part}</w:t></w:r>'
+        for part, bold, italic, code in parse_inline(text)
+        if part
+    ])
+
+
+def _chart_xml(title, points):
+    labels = "".join(
+        f'<c:pt idx="{i}"><c:v>{_escape(label)}</c:v></c:pt>' for i, (label, _) in enumerate(points)
     )
+    values = "".join(
+        f'<c:pt idx="{i}"><c:v>{value:g}</c:v></c:pt>' for i, (_, value) in enumerate(points)
+    )
+    title_xml = (
+        "<c:title><c:tx><c:rich><a:bodyPr/><a:p><a:r>"
+        f"<a:t>{_escape(title)}</a:t>"
+        '</a:r></a:p></c:rich></c:tx><c:overlay val="0"/></c:title>'
+        '<c:autoTitleDeleted val="0"/>'
+    ) if title else '<c:autoTitleDeleted val="1"/>'
+    count = f'<c:ptCount val="{len(points)}"/>'
 
-    buffer = BytesIO()
-    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as docx:
-        docx.writestr("[Content_Types].xml", content_types_xml)
-        docx.writestr("_rels/.rels", rels_xml)
-        docx.writestr("word/document.xml", document_xml)
+    # Данные лежат литералами (strLit/numLit): встроенная книга Excel не нужна
+    return (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<c:chartSpace xmlns:c="http://schemas.openxmlformats.org/drawingml/2006/chart" '
+        'xmlns:a="http://schemas.openxmlformats.org/drawingml/2006/main">'
+        f"<c:chart>{title_xml}<c:plotArea><c:layout/>"
+        '<c:barChart><c:barDir val="bar"/><c:grouping val="clustered"/><c:varyColors val="0"/>'
+        '<c:ser><c:idx val="0"/><c:order val="0"/>'
+        '<c:dLbls><c:showLegendKey val="0"/><c:showVal val="1"/><c:showCatName val="0"/>'
+        '<c:showSerName val="0"/><c:showPercent val="0"/><c:showBubbleSize val="0"/></c:dLbls>'
+        f"<c:cat><c:strLit>{count}{labels}</c:strLit></c:cat>"
+        f"<c:val><c:numLit>{count}{values}</c:numLit></c:val>"
+        '</c:ser><c:gapWidth val="60"/><c:axId val="1"/><c:axId val="2"/></c:barChart>'
+        '<c:catAx><c:axId val="1"/><c:scaling><c:orientation val="maxMin"/></c:scaling>'
+        '<c:delete val="0"/><c:axPos val="l"/><c:crossAx val="2"/></c:catAx>'
+        '<c:valAx><c:axId val="2"/><c:scaling><c:orientation val="minMax"/></c:scaling>'
+        '<c:delete val="0"/><c:axPos val="t"/><c:majorGridlines/><c:crossAx val="1"/></c:valAx>'
+        '</c:plotArea><c:plotVisOnly val="1"/></c:chart></c:chartSpace>'
+    ).encode()
+
+
+# ======================================================
+# ПОТОКОВАЯ ЗАПИСЬ
+# ======================================================
+
+class DocxWriter:
+    """
+    Пишет DOCX в файл по мере поступления блоков.
+
+    document.xml кодируется и сжимается прямо в запись архива, поэтому в
+    памяти держится только текущий блок. Диаграммы — отдельные части
+    пакета; они дописываются после document.xml вместе со связями.
+    """
+
+    def __init__(self, file):
+        # уровень 1: XML сжимается почти так же хорошо, а сжатие втрое быстрее уровня 6
+        self._zip = zipfile.ZipFile(file, "w", zipfile.ZIP_DEFLATED, compresslevel=1)
+        self._document = io.TextIOWrapper(
+            self._zip.open("word/document.xml", "w", force_zip64=True),
+            encoding="utf-8",
+        )
+        self._document.write(DOCUMENT_HEAD)
+        # части диаграмм копятся не в памяти, а во временном файле до закрытия document.xml
+        self._charts = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+        self._chart_sizes = []
+        self._ordered_lists = []   # (уровень, первый номер) для каждого нумерованного списка
+        self._list_ids = {}        # уровень -> numId текущего списка
+        self._table_columns = 0
+        self._cell_starts = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self._document.close()
+            self._charts.close()
+            self._zip.close()
+
+    def paragraph(self, lines):
+        """Абзац; строки ``lines`` разделяются переносом строки."""
+        body = "<w:r><w:br/></w:r>".join([_runs(line) for line in lines])
+        self._document.write(f"<w:p>{body}</w:p>")
+
+    def heading(self, level, text):
+        level = min(max(level, 1), HEADING_LEVELS)
+        self._document.write(
+            f'<w:p><w:pPr><w:pStyle w:val="Heading{level}"/></w:pPr>{_runs(text)}</w:p>'
+        )
+
+    def list_item(self, depth, ordered, number, new_list, text):
+        depth = min(depth, LIST_LEVELS - 1)
+        if not ordered:
+            num_id = 1
+        elif new_list or depth not in self._list_ids:
+            self._ordered_lists.append((depth, max(number, 0)))
+            num_id = self._list_ids[depth] = len(self._ordered_lists) + 1
+        else:
+            num_id = self._list_ids[depth]
+        self._document.write(
+            f'<w:p><w:pPr><w:numPr><w:ilvl w:val="{depth}"/><w:numId w:val="{num_id}"/></w:numPr>'
+            f"</w:pPr>{_runs(text)}</w:p>"
+        )
+
+    def rule(self):
+        self._document.write(
+            '<w:p><w:pPr><w:pBdr><w:bottom w:val="single" w:sz="6" w:space="1" w:color="auto"/>'
+            "</w:pBdr></w:pPr></w:p>"
+        )
+
+    def code(self, lines):
+        for line in lines or [""]:
+            self._document.write(f"<w:p>{_run(line, code=True)}</w:p>")
+
+    def table_start(self, header, align=()):
+        """Таблица пишется построчно; число колонок задаёт заголовок."""
+        self._table_columns = max(len(header), 1)
+        self._cell_starts = _cell_starts(self._table_columns, tuple(align))
+        self._document.write(_table_start(self._table_columns))
+        self._table_row(header, bold=True)
+
+    def table_row(self, cells):
+        self._table_row(cells)
+
+    def table_end(self):
+        self._document.write("</w:tbl>")
 
+    def _table_row(self, cells, bold=False):
+        column_count = self._table_columns
+        if len(cells) > column_count:
+            # лишние ячейки не помещаются в сетку — дописываем их в последнюю
+            cells = cells[:column_count - 1] + [" | ".join(cells[column_count - 1:])]
+        elif len(cells) < column_count:
+            cells = list(cells) + [""] * (column_count - len(cells))
+        self._document.write("<w:tr>" + "".join([
+            f"{start}{_run(cell, bold=True) if bold else _runs(cell)}</w:p></w:tc>"
+            for start, cell in zip(self._cell_starts, cells)
+        ]) + "</w:tr>")
+
+    def chart(self, title, points):
+        """Горизонтальная столбчатая диаграмма по парам (подпись, число)."""
+        self._chart_sizes.append(self._charts.write(_chart_xml(title, points)))
+        number = len(self._chart_sizes)
+        self._document.write(
+            "<w:p><w:r><w:drawing>"
+            '<wp:inline distT="0" distB="0" distL="0" distR="0">'
+            f'<wp:extent cx="{CHART_WIDTH}" cy="{CHART_HEIGHT}"/>'
+            f'<wp:docPr id="{number}" name="Диаграмма {number}"/>'
+            '<a:graphic><a:graphicData uri="http://schemas.openxmlformats.org/drawingml/2006/chart">'
+            f'<c:chart r:id="rIdChart{number}"/>'
+            "</a:graphicData></a:graphic></wp:inline></w:drawing></w:r></w:p>"
+        )
+
+    def close(self):
+        self._document.write(DOCUMENT_TAIL)
+        self._document.close()
+
+        numbers = range(1, len(self._chart_sizes) + 1)
+        self._charts.seek(0)
+        for number, size in zip(numbers, self._chart_sizes):
+            self._zip.writestr(f"word/charts/chart{number}.xml", self._charts.read(size))
+        self._charts.close()
+        self._zip.writestr(
+            "[Content_Types].xml",
+            CONTENT_TYPES_HEAD
+            + "".join(CONTENT_TYPES_CHART.format(n) for n in numbers).encode()
+            + CONTENT_TYPES_TAIL,
+        )
+        self._zip.writestr("_rels/.rels", PACKAGE_RELS)
+        self._zip.writestr("word/_rels/document.xml.rels", (
+            DOCUMENT_RELS_HEAD
+            + "".join(DOCUMENT_RELS_CHART.format(n) for n in numbers).encode()
+            + DOCUMENT_RELS_TAIL
+        ))
+        self._zip.writestr("word/styles.xml", STYLES)
+        self._zip.writestr("word/numbering.xml", (
+            NUMBERING_HEAD
+            + "".join(
+                NUMBERING_ORDERED.format(num_id, level, start)
+                for num_id, (level, start) in enumerate(self._ordered_lists, start=2)
+            ).encode()
+            + NUMBERING_TAIL
+        ))
+        self._zip.close()
+
+
+# ======================================================
+# MARKDOWN → DOCX
+# ======================================================
+
+def _chart_points(lines):
+    """
+    Заголовок и точки диаграммы из блока ```chart.
+
+    Строка «подпись | число» — точка, первая строка без «|» — заголовок.
+    """
+    title, points = "", []
+    for line in lines:
+        label, sep, value = line.strip().strip("|").rpartition("|")
+        match = _NUMBER.search(value) if sep else None
+        if match:
+            points.append((label.strip(), float(match.group().replace(",", "."))))
+        elif line.strip() and not title:
+            title = line.strip()
+    return title, points
+
+
+def write_markdown(writer, text):
+    """Передаёт токены markdown-текста в ``writer`` по мере разбора."""
+    # поля токенов совпадают с аргументами методов writer: вызов без цепочки проверок типа
+    methods = {
+        Paragraph: writer.paragraph,
+        Heading: writer.heading,
+        ListItem: writer.list_item,
+        TableStart: writer.table_start,
+        TableRow: writer.table_row,
+        TableEnd: writer.table_end,
+        Rule: writer.rule,
+    }
+    empty = True
+    for token in tokenize(iter_lines(text)):
+        empty = False
+        method = methods.get(type(token))
+        if method is not None:
+            method(*token)
+        else:
+            # Code: блок ```chart с точками — диаграмма, остальное — моноширинный текст
+            title, points = _chart_points(token.lines) if token.language == "chart" else ("", [])
+            if points:
+                writer.chart(title, points)
+            else:
+                writer.code(token.lines)
+
+    if empty:
+        # в документе должен быть хотя бы один абзац
+        writer.paragraph([""])
+
+
+def write_docx(text, file):
+    """Markdown-текст отчёта → DOCX, записанный в файловый объект ``file``."""
+    with DocxWriter(file) as writer:
+        write_markdown(writer, text)
+
+
+def build_docx_bytes(text):
+    buffer = BytesIO()
+    write_docx(text, buffer)
     return buffer.getvalue()
@@ -0,0 +1,155 @@
+import asyncio
+import hashlib
+
+from .prompts import (
+    PARENT_CHUNK_PROMPT,
+    PARENT_REDUCE_PROMPT,
+    PARENT_REPORT_PROMPT,
+    PARENT_STATISTICS_HEADER,
+    PARENT_SUMMARIES_HEADER,
+)
+
+
+SYSTEM_PROMPT = "Ты профессиональный аналитик."
+
+# Грубая оценка для кириллицы: токенайзер OpenAI даёт ~3 символа на токен
+CHARS_PER_TOKEN = 3
+
+
+def new_usage():
+    return {"requests": 0, "prompt_tokens": 0, "completion_tokens": 0}
+
+
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def _split_block(block, max_tokens):
+    if estimate_tokens(block) <= max_tokens:
+        yield block
+        return
+
+    # Один респондент не влез в бюджет: режем по строкам, повторяя заголовок;
+    # строку длиннее бюджета (длинный свободный ответ) — ещё и по символам
+    header, *lines = block.splitlines(keepends=True)
+    room = max(max_tokens - estimate_tokens(header) - 1, 1) * CHARS_PER_TOKEN
+    part, size = [header], estimate_tokens(header)
+    for line in lines:
+        for start in range(0, len(line), room):
+            piece = line[start:start + room]
+            tokens = estimate_tokens(piece)
+            if len(part) > 1 and size + tokens > max_tokens:
+                yield "".join(part)
+                part, size = [header], estimate_tokens(header)
+            part.append(piece)
+            size += tokens
+    yield "".join(part)
+
+
+def pack_chunks(blocks, max_tokens):
+    """Собирает блоки респондентов в части не больше ``max_tokens``, не разрывая блоки без нужды."""
+    chunk, size = [], 0
+    for block in blocks:
+        for piece in _split_block(block, max_tokens):
+            tokens = estimate_tokens(piece)
+            if chunk and size + tokens > max_tokens:
+                yield "\n".join(chunk)
+                chunk, size = [], 0
+            chunk.append(piece)
+            size += tokens
+
+    if chunk:
+        yield "\n".join(chunk)
+
+
+class ReportEngine:
+    """
+    Map-reduce генерация отчёта по анкетам.
+
+    Сводки респондентов строятся параллельно (не больше ``concurrency``
+    запросов к модели одновременно), затем сворачиваются, пока не поместятся
+    в один запрос, и по ним строится итоговый отчёт. ``client`` — любой
+    объект с асинхронным ``chat.completions.create`` (``AsyncOpenAI`` или заглушка).
+
+    Если передан ``cache`` (Django cache), ответы модели запоминаются по хэшу
+    промпта: при повторной свёртке пересчитываются только изменившиеся группы.
+
+    В ``usage`` накапливаются число запросов и токены из ответов модели.
+    """
+
+    def __init__(self, client, model, temperature, chunk_tokens, concurrency, cache=None, usage=None):
+        self.client = client
+        self.model = model
+        self.temperature = temperature
+        self.chunk_tokens = chunk_tokens
+        self.cache = cache
+        self.usage = usage if usage is not None else new_usage()
+        self._semaphore = asyncio.Semaphore(concurrency)
+
+    def _cache_key(self, prompt):
+        digest = hashlib.sha256(
+            f"{self.model}\n{self.temperature}\n{prompt}".encode("utf-8")
+        ).hexdigest()
+        return f"completion:{digest}"
+
+    async def complete(self, prompt, cached=False):
+        if cached and self.cache is not None:
+            text = await self.cache.aget(self._cache_key(prompt))
+            if text is not None:
+                return text
+
+        text = await self._request(prompt)
+
+        if cached and self.cache is not None:
+            await self.cache.aset(self._cache_key(prompt), text)
+        return text
+
+    async def _request(self, prompt):
+        async with self._semaphore:
+            response = await self.client.chat.completions.create(
+                model=self.model,
+                messages=[
+                    {"role": "system", "content": SYSTEM_PROMPT},
+                    {"role": "user", "content": prompt},
+                ],
+                temperature=self.temperature,
+            )
+        self.usage["requests"] += 1
+        if getattr(response, "usage", None) is not None:
+            self.usage["prompt_tokens"] += response.usage.prompt_tokens or 0
+            self.usage["completion_tokens"] += response.usage.completion_tokens or 0
+        return response.choices[0].message.content
+
+    async def _map(self, template, chunks, cached=False):
+        return await asyncio.gather(
+            *(self.complete(template.format(data=chunk), cached=cached) for chunk in chunks)
+        )
+
+    async def summarise(self, blocks):
+        """
+        Сводка по каждому блоку (респонденту) отдельно, в том же порядке.
+
+        Блок больше ``chunk_tokens`` уходит в модель частями; сводки частей
+        одного респондента склеиваются в одну.
+        """
+        parts = [list(_split_block(block, self.chunk_tokens)) for block in blocks]
+        texts = iter(await self._map(PARENT_CHUNK_PROMPT, [part for block in parts for part in block]))
+        return ["\n".join(next(texts) for _ in block) for block in parts]
+
+    async def reduce(self, summaries, statistics=""):
+        """Сворачивает сводки и строит итоговый отчёт; ``statistics`` — готовые таблицы с числами."""
+        summaries = list(summaries)
+        while len(summaries) > 1 and estimate_tokens("\n\n".join(summaries)) > self.chunk_tokens:
+            groups = list(pack_chunks(summaries, self.chunk_tokens))
+            if len(groups) == len(summaries):
+                # каждая сводка сама по себе близка к бюджету — сворачиваем попарно
+                groups = [
+                    "\n\n".join(summaries[i:i + 2])
+                    for i in range(0, len(summaries), 2)
+                ]
+            summaries = await self._map(PARENT_REDUCE_PROMPT, groups, cached=True)
+
+        data = PARENT_SUMMARIES_HEADER + "\n\n".join(summaries)
+        if statistics:
+            data = PARENT_STATISTICS_HEADER + statistics + "\n\n" + data
+        return await self.complete(PARENT_REPORT_PROMPT.format(data=data))
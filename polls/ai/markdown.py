@@ -0,0 +1,336 @@
+"""
+Разбор markdown из ответов модели для сборки DOCX.
+
+Блоки выделяются за один проход по строкам с просмотром на одну строку
+вперёд; токены отдаются генератором, поэтому документ любого размера не
+держится в памяти целиком. Время разбора линейно по длине текста.
+"""
+import re
+from collections import namedtuple
+
+
+Heading = namedtuple("Heading", ["level", "text"])
+# строки одного абзаца; в DOCX они разделяются переносом строки
+Paragraph = namedtuple("Paragraph", ["lines"])
+# new_list — пункт начинает новый список на своём уровне (для нумерации с ``number``)
+ListItem = namedtuple("ListItem", ["depth", "ordered", "number", "new_list", "text"])
+TableStart = namedtuple("TableStart", ["header", "align"])
+TableRow = namedtuple("TableRow", ["cells"])
+TableEnd = namedtuple("TableEnd", [])
+Code = namedtuple("Code", ["language", "lines"])
+Rule = namedtuple("Rule", [])
+
+Span = namedtuple("Span", ["text", "bold", "italic", "code"])
+
+
+_HEADING = re.compile(r" {0,3}(#{1,6})(?:[ \t]+(.*))?$")
+_RULE = re.compile(r" {0,3}([-*_])(?:[ \t]*\1){2,}[ \t]*$")
+_LIST_ITEM = re.compile(r"([ \t]*)([-*+]|(\d{1,9})[.)])[ \t]+(.*)$")
+_FENCE = re.compile(r" {0,3}```[ \t]*([\w-]*)[ \t]*$")
+_TABLE_SEPARATOR = re.compile(r"[ \t]*\|?[ \t]*:?-+:?[ \t]*(?:\|[ \t]*:?-+:?[ \t]*)*\|?[ \t]*$")
+
+
+def iter_lines(text, chunk_size=64 * 1024):
+    """
+    Строки текста по одной, без копии всего текста в список.
+
+    Текст режется на куски около ``chunk_size`` символов по границе строки,
+    и каждый кусок разбивается на строки целиком: так в памяти лишь один
+    кусок, а генератор не возобновляется ради каждой строки.
+    """
+    start = 0
+    while start < len(text):
+        end = text.find("\n", start + chunk_size)
+        if end == -1:
+            end = len(text)
+            if text.endswith("\n"):
+                end -= 1   # последний перевод строки не начинает новую пустую строку
+        chunk = text[start:end]
+        lines = chunk.split("\n")
+        if "\r" in chunk:
+            lines = [line.rstrip("\r") for line in lines]
+        yield from lines
+        start = end + 1
+
+
+def split_table_row(line):
+    line = line.strip()
+    if line.startswith("|"):
+        line = line[1:]
+    if line.endswith("|") and not line.endswith("\\|"):
+        line = line[:-1]
+    return [cell.strip() for cell in line.split("|")]
+
+
+def _table_align(separator):
+    align = []
+    for cell in split_table_row(separator):
+        if cell.startswith(":") and cell.endswith(":"):
+            align.append("center")
+        elif cell.endswith(":"):
+            align.append("right")
+        else:
+            align.append("left")
+    return align
+
+
+def _heading_text(text):
+    text = text.strip()
+    # закрывающие «##» отделены пробелом; «C#» — часть текста
+    without_closing = text.rstrip("#")
+    if not without_closing or without_closing[-1] in " \t":
+        return without_closing.strip()
+    return text
+
+
+def _indent_width(indent):
+    return len(indent.expandtabs(4))
+
+
+# ======================================================
+# БЛОКИ
+# ======================================================
+
+def tokenize(lines):
+    """Блочные токены markdown по итератору строк."""
+    lines = iter(lines)
+    paragraph = []
+    item = None        # ListItem, который ещё может продолжиться на следующей строке
+    continuation = []  # строки продолжения этого пункта
+    indents = []       # отступы открытых уровней списка
+    list_kinds = []    # ordered для каждого открытого уровня
+
+    def flush():
+        """Накопленные абзац и пункт списка; обычно пусто, поэтому это список, а не генератор."""
+        nonlocal item
+        tokens = []
+        if paragraph:
+            tokens.append(Paragraph(list(paragraph)))
+            paragraph.clear()
+        if item is not None:
+            if continuation:
+                item = item._replace(text=" ".join([item.text, *continuation]))
+                continuation.clear()
+            tokens.append(item)
+            item = None
+        return tokens
+
+    def close_lists():
+        indents.clear()
+        list_kinds.clear()
+
+    line = next(lines, None)
+    while line is not None:
+        next_line = next(lines, None)
+
+        stripped = line.strip()
+        if not stripped:
+            # пустая строка завершает абзац, но не список: «1. …\n\n2. …» — один список
+            yield from flush()
+            line = next_line
+            continue
+
+        # по первому символу отсекаются выражения, которые заведомо не совпадут:
+        # большинство строк отчёта — обычный текст и строки таблиц
+        first = stripped[0]
+
+        fence = _FENCE.match(line) if first == "`" else None
+        if fence:
+            yield from flush()
+            close_lists()
+            block = []
+            while next_line is not None and not next_line.strip().startswith("```"):
+                block.append(next_line)
+                next_line = next(lines, None)
+            yield Code(fence.group(1).lower(), block)
+            line = next(lines, None)
+            continue
+
+        if "|" in line and next_line is not None and _TABLE_SEPARATOR.match(next_line):
+            yield from flush()
+            close_lists()
+            yield TableStart(split_table_row(line), _table_align(next_line))
+            line = next(lines, None)
+            # пустая строка «|» не содержит и тоже завершает таблицу
+            while line is not None and "|" in line:
+                yield TableRow(split_table_row(line))
+                line = next(lines, None)
+            yield TableEnd()
+            continue
+
+        heading = _HEADING.match(line) if first == "#" else None
+        if heading:
+            yield from flush()
+            close_lists()
+            yield Heading(len(heading.group(1)), _heading_text(heading.group(2) or ""))
+            line = next_line
+            continue
+
+        # в линии не меньше трёх маркеров: «- пункт» отсекается без регулярного выражения
+        if first in "-*_" and stripped.count(first) >= 3 and _RULE.match(line):
+            yield from flush()
+            close_lists()
+            yield Rule()
+            line = next_line
+            continue
+
+        marker = _LIST_ITEM.match(line) if first in "-*+" or first.isdigit() else None
+        if marker:
+            yield from flush()
+            indent, _, number, text = marker.groups()
+            width = _indent_width(indent) if indent else 0
+            ordered = number is not None
+            while indents and width < indents[-1]:
+                indents.pop()
+                list_kinds.pop()
+            if not indents or width > indents[-1]:
+                indents.append(width)
+                list_kinds.append(None)
+            new_list = list_kinds[-1] != ordered
+            list_kinds[-1] = ordered
+            item = ListItem(len(indents) - 1, ordered, int(number) if ordered else 0, new_list, text.strip())
+            line = next_line
+            continue
+
+        if item is not None and line[:1] in (" ", "\t"):
+            # продолжение текста пункта на следующей строке с отступом
+            continuation.append(stripped)
+            line = next_line
+            continue
+
+        if item is not None or indents:
+            yield from flush()
+            close_lists()
+        paragraph.append(stripped)
+        line = next_line
+
+    yield from flush()
+
+
+# ======================================================
+# ВЫДЕЛЕНИЕ ВНУТРИ СТРОКИ
+# ======================================================
+
+# обычный текст забирается одним совпадением: движок не перебирает альтернативы на каждом символе
+_INLINE = re.compile(r"[^`*_]+|`[^`\n]*`|\*+|_+|`")
+
+
+def _simple_pairs(text, delimiter, bold, italic):
+    """
+    Фрагменты строки, где вся разметка — пары ``delimiter`` без вложенности.
+
+    Это тот же результат, что дал бы стек разделителей; None — строка
+    сложнее, и её разбирает общий алгоритм.
+    """
+    parts = text.split(delimiter)
+    if len(parts) % 2 == 0:
+        return None
+    spans = []
+    for i, part in enumerate(parts):
+        if i % 2:
+            if not part or part[0].isspace() or part[-1].isspace():
+                return None
+            spans.append(Span(part, bold, italic, False))
+        elif part:
+            spans.append(Span(part, False, False, False))
+    return spans
+
+
+def parse_inline(text):
+    """
+    Фрагменты строки с **жирным**, *курсивом* и `кодом`.
+
+    Разделители сопоставляются стеком за один проход; разделитель без пары
+    остаётся обычным текстом. ``_`` внутри слова (snake_case) — не курсив.
+    """
+    if "*" not in text and "_" not in text and "`" not in text:
+        # большинство строк и ячеек таблиц без разметки
+        return [Span(text, False, False, False)] if text else []
+    if "_" not in text and "`" not in text and "***" not in text:
+        # в ответах модели обычно только **жирный** или только *курсив*
+        if "**" not in text:
+            spans = _simple_pairs(text, "*", False, True)
+        elif text.count("*") == 2 * text.count("**"):
+            spans = _simple_pairs(text, "**", True, False)
+        else:
+            spans = None
+        if spans is not None:
+            return spans
+
+    pieces = []        # str — текст, Span — код, list — разделитель [key, opens, closes]
+    append = pieces.append
+    openers = {}       # key -> стек индексов в pieces
+    paired = False
+    length = len(text)
+
+    for match in _INLINE.finditer(text):
+        token = match.group()
+        first = token[0]
+        if first != "*" and first != "_":
+            if first == "`" and len(token) > 1:
+                append(Span(token[1:-1], False, False, True))
+                paired = True
+            else:
+                append(token)
+            continue
+        if len(token) > 3:
+            append(token)
+            continue
+
+        start, end = match.span()
+        before = text[start - 1] if start else " "
+        after = text[end] if end < length else " "
+        can_open = not after.isspace()
+        can_close = not before.isspace()
+        if first == "_" and before.isalnum() and after.isalnum():
+            can_open = can_close = False
+
+        stack = openers.get(token)
+        if can_close and stack:
+            pieces[stack.pop()][1] = True
+            append([token, False, True])
+            paired = True
+        elif can_open:
+            if stack is None:
+                openers[token] = [len(pieces)]
+            else:
+                stack.append(len(pieces))
+            append([token, False, False])
+        else:
+            append(token)
+
+    if not paired:
+        # ни одной пары и ни одного `кода` — строка целиком обычный текст
+        return [Span(text, False, False, False)]
+
+    spans = []
+    buffer = []        # текст текущего фрагмента; склеивается один раз, без квадратичной конкатенации
+    bold = italic = 0
+    is_bold = is_italic = False
+    for piece in pieces:
+        kind = type(piece)
+        if kind is list:
+            key, opens, closes = piece
+            if opens or closes:
+                step = 1 if opens else -1
+                if len(key) != 1:
+                    bold += step
+                if len(key) != 2:
+                    italic += step
+                continue
+            piece = key  # открывающий без пары
+        elif kind is Span:
+            if buffer:
+                spans.append(Span("".join(buffer), is_bold, is_italic, False))
+                buffer = []
+            spans.append(piece)
+            continue
+        if (bold > 0) is not is_bold or (italic > 0) is not is_italic:
+            if buffer:
+                spans.append(Span("".join(buffer), is_bold, is_italic, False))
+                buffer = []
+            is_bold, is_italic = bold > 0, italic > 0
+        buffer.append(piece)
+    if buffer:
+        spans.append(Span("".join(buffer), is_bold, is_italic, False))
+    return spans
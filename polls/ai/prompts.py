@@ -104,6 +104,15 @@ PARENT_REPORT_PROMPT = """
 2) Усиление системы коммуникации и прозрачности,
 3) Систематизация и продвижение программ развития (ценности, навыки).
 
+Диаграммы:
+Ключевые метрики (средние баллы блока 1, доли положительных ответов) можно
+показать диаграммой. Для этого вставь блок:
+```chart
+Название диаграммы
+Подпись | число
+Подпись | число
+```
+
 Техническое указание:
 При анализе открытых текстовых полей используй методы извлечения ключевых
 слов, определение тональности и ручную (или с помощью LLM) категоризацию для
@@ -112,3 +121,51 @@ PARENT_REPORT_PROMPT = """
 Данные:
 {data}
 """
+
+
+PARENT_CHUNK_PROMPT = """
+Ты — аналитик отдела качества сервиса образовательного проекта
+«Москва студенту верит!». Тебе передана часть базы анкет родителей
+резидентов студенческого общежития. Остальные части анализируются отдельно,
+поэтому итоговые выводы делать не нужно — подготовь сжатую сводку по этой
+части, из которой потом будет собран общий отчёт.
+
+В сводке укажи:
+1. Число респондентов в этой части.
+2. По каждому вопросу со шкалой 1-10: количество ответов и сумму баллов
+   (не только среднее — суммы потом будут сложены между частями).
+3. По каждому вопросу с вариантами: количество ответов на каждый вариант.
+4. По открытым вопросам: тематические кластеры с числом упоминаний и
+   эмоциональной окраской, 1-2 характерные цитаты на кластер.
+5. Заметные связи между ответами одного респондента (например, низкие баллы
+   комфорта и негативные рекомендации).
+
+Пиши кратко, без вступлений, сохраняй формулировки вопросов.
+
+Данные:
+{data}
+"""
+
+PARENT_REDUCE_PROMPT = """
+Тебе переданы промежуточные сводки по разным частям базы анкет родителей.
+Объедини их в одну сводку того же формата: сложи число респондентов,
+количества ответов и суммы баллов по каждому вопросу, объедини одинаковые
+тематические кластеры открытых ответов (суммируя число упоминаний) и сохрани
+самые характерные цитаты. Итоговые выводы и рекомендации делать не нужно.
+
+Сводки:
+{data}
+"""
+
+PARENT_SUMMARIES_HEADER = (
+    "База анкет слишком большая, поэтому ниже приведены сводки по её частям: "
+    "число респондентов, количества ответов и суммы баллов по вопросам, "
+    "кластеры открытых ответов. Считай метрики по этим агрегатам.\n\n"
+)
+
+PARENT_STATISTICS_HEADER = (
+    "Точная статистика по всем анкетам, посчитанная по базе. Средние, доли и "
+    "воронку бери отсюда, а сводки ниже используй для качественного анализа.\n"
+    "Варианты: текст | число ответов | доля ответивших. "
+    "Шкалы: утверждение | n | среднее | медиана | P25–P75 | P90.\n\n"
+)
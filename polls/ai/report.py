@@ -1,7 +1,16 @@
+import asyncio
+import time
+from collections import namedtuple
+
 from django.conf import settings
-from openai import DefaultHttpxClient, OpenAI
-from ..models import Answer
-from .prompts import PARENT_REPORT_PROMPT
+from django.db.models import Count, F, Max
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient, DefaultHttpxClient, OpenAI
+from ..models import ANSWER_FULL_TEXT, Answer, RespondentSummary, User
+from ..services.sessions import finished_user_ids
+from ..services.statistics import format_statistics, statistics_computed_at
+from .cache import completion_cache, parent_answers_watermark, parent_report_cache_key, report_cache
+from .mapreduce import SYSTEM_PROMPT, ReportEngine, new_usage
+from .prompts import PARENT_CHUNK_PROMPT
 
 
 def get_openai_client():
@@ -17,77 +26,300 @@ def get_openai_client():
     return OpenAI(api_key=api_key)
 
 
+def get_async_openai_client():
+    api_key = getattr(settings, "OPENAI_API_KEY", "")
+    if not api_key:
+        raise ValueError("OPENAI_API_KEY is not configured")
+    proxy = getattr(settings, "OPENAI_PROXY", "")
+    if proxy:
+        return AsyncOpenAI(
+            api_key=api_key,
+            http_client=DefaultAsyncHttpxClient(proxies=proxy),
+        )
+    return AsyncOpenAI(api_key=api_key)
+
+
+class OpenAIRunner:
+    """
+    Один цикл событий и один ``AsyncOpenAI`` на всё построение отчёта.
+
+    ORM вызывается между ``run(...)``, вне цикла, поэтому ему не нужен
+    ``sync_to_async``. Клиент создаётся при первом обращении и закрывается
+    на выходе в том же цикле; переданный снаружи клиент не закрывается.
+    """
+
+    def __init__(self, client=None):
+        self._client = client
+        self._owns_client = client is None
+        self._runner = asyncio.Runner()
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = get_async_openai_client()
+        return self._client
+
+    def run(self, coro):
+        return self._runner.run(coro)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        try:
+            if self._owns_client and self._client is not None:
+                self.run(self._client.close())
+        finally:
+            self._runner.close()
+
+
 def build_user_answers(user):
     answers = (
         Answer.objects
         .filter(user=user)
-        .select_related("poll")
         .order_by("created_at")
+        .annotate(answer_text=ANSWER_FULL_TEXT)
+        .values_list("poll__question", "answer_text")
     )
 
-    text = ""
-    for ans in answers:
-        text += f"- {ans.poll.question} — {ans.answer}\n"
+    return "".join(f"- {question} — {answer}\n" for question, answer in answers)
 
-    return text
 
+def _iter_answer_blocks(answers, chunk_size):
+    rows = answers.order_by("user_id", "created_at").annotate(
+        answer_text=ANSWER_FULL_TEXT
+    ).values_list(
+        "user_id", "user__tg_id", "poll__question", "answer_text"
+    ).iterator(chunk_size=chunk_size)
 
-def build_parent_answers():
-    answers = (
-        Answer.objects
-        .filter(user__role="parent")
-        .select_related("poll", "user")
-        .order_by("user_id", "created_at")
-    )
+    current_user_id = None
+    lines = []
+    for user_id, tg_id, question, answer in rows:
+        if current_user_id != user_id:
+            if lines:
+                yield current_user_id, "".join(lines)
+            current_user_id = user_id
+            lines = [f"Респондент {tg_id}:\n"]
 
-    if not answers.exists():
-        return ""
+        lines.append(f"- {question} — {answer}\n")
 
-    text = ""
-    current_user_id = None
-    for ans in answers:
-        if current_user_id != ans.user_id:
-            current_user_id = ans.user_id
-            text += f"\nРеспондент {ans.user.tg_id}:\n"
+    if lines:
+        yield current_user_id, "".join(lines)
 
-        text += f"- {ans.poll.question} — {ans.answer}\n"
 
-    return text.strip()
+def _parent_answers(finished_only=False):
+    # подзапрос, а не JOIN по user__role: тогда ответы читаются по индексу
+    # (user, created_at) уже в нужном порядке, без сортировки всего корпуса
+    answers = Answer.objects.filter(user_id__in=User.objects.filter(role="parent").values("id"))
+    if finished_only:
+        answers = answers.filter(user_id__in=finished_user_ids("parent"))
+    return answers
 
 
-def generate_ai_report(user):
-    data = build_user_answers(user)
-    prompt = PARENT_REPORT_PROMPT.format(data=data)
-    client = get_openai_client()
+def iter_parent_answer_blocks(finished_only=False, chunk_size=2000):
+    """
+    Отдаёт ответы родителей блоками по одному респонденту.
 
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",  # можно gpt-4o
-        messages=[
-            {"role": "system", "content": "Ты профессиональный аналитик."},
-            {"role": "user", "content": prompt},
+    Строки читаются курсором пачками по ``chunk_size``, поэтому память не
+    зависит от числа ответов в базе.
+    """
+    for _, block in _iter_answer_blocks(_parent_answers(finished_only), chunk_size):
+        yield block
+
+
+def build_parent_answers(finished_only=False):
+    return "\n".join(iter_parent_answer_blocks(finished_only=finished_only)).strip()
+
+
+# ======================================================
+# СВОДКИ ПО РЕСПОНДЕНТАМ
+# ======================================================
+
+def _answers_watermark(answers):
+    """(user_id -> (число ответов, id последнего ответа)) для пересчёта только изменившихся сводок."""
+    return {
+        user_id: (count, last_id)
+        for user_id, count, last_id in (
+            answers
+            .order_by()
+            .values("user_id")
+            .annotate(count=Count("id"), last_id=Max("id"))
+            .values_list("user_id", "count", "last_id")
+        )
+    }
+
+
+def stale_summary_user_ids(role="parent"):
+    """Пользователи с ответами, у которых сводки нет или она построена по другому набору ответов."""
+    return list(
+        User.objects
+        .filter(role=role)
+        .annotate(answers_total=Count("answers"), last_answer_id=Max("answers__id"))
+        .filter(answers_total__gt=0)
+        .exclude(
+            summary__answers_count=F("answers_total"),
+            summary__last_answer_id=F("last_answer_id"),
+        )
+        .order_by("id")
+        .values_list("id", flat=True)
+    )
+
+
+def _save_summaries(summaries):
+    RespondentSummary.objects.bulk_create(
+        [
+            RespondentSummary(
+                user_id=user_id,
+                text=text,
+                answers_count=count,
+                last_answer_id=last_id,
+            )
+            for user_id, text, (count, last_id) in summaries
         ],
-        temperature=0.4,
+        update_conflicts=True,
+        unique_fields=["user"],
+        update_fields=["text", "answers_count", "last_answer_id", "updated_at"],
     )
 
-    return response.choices[0].message.content
+
+def _build_engine(client, cache=None, usage=None):
+    return ReportEngine(
+        client=client,
+        model=settings.AI_REPORT_MODEL,
+        temperature=settings.AI_REPORT_TEMPERATURE,
+        chunk_tokens=settings.AI_REPORT_CHUNK_TOKENS,
+        concurrency=settings.AI_REPORT_CONCURRENCY,
+        cache=cache,
+        usage=usage,
+    )
 
 
-def generate_parent_report_for_all():
-    data = build_parent_answers()
+def generate_ai_report(user, client=None):
+    """Сводка по анкете одного пользователя; пересчитывается, только если изменились его ответы."""
+    answers = Answer.objects.filter(user=user)
+    watermark = _answers_watermark(answers).get(user.id, (0, None))
 
-    if not data:
-        return ""
+    summary = RespondentSummary.objects.filter(user=user).first()
+    if summary and (summary.answers_count, summary.last_answer_id) == watermark:
+        return summary.text
 
-    prompt = PARENT_REPORT_PROMPT.format(data=data)
-    client = get_openai_client()
+    data = f"Респондент {user.tg_id}:\n" + build_user_answers(user)
+    client = client or get_openai_client()
 
     response = client.chat.completions.create(
-        model="gpt-4o-mini",  # можно gpt-4o
+        model=settings.AI_REPORT_MODEL,
         messages=[
-            {"role": "system", "content": "Ты профессиональный аналитик."},
-            {"role": "user", "content": prompt},
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": PARENT_CHUNK_PROMPT.format(data=data)},
         ],
-        temperature=0.4,
+        temperature=settings.AI_REPORT_TEMPERATURE,
     )
+    text = response.choices[0].message.content
+
+    _save_summaries([(user.id, text, watermark)])
+    return text
+
+
+def refresh_parent_summaries(client=None, batch_size=200, usage=None, runner=None):
+    """
+    Пересчитывает устаревшие сводки родителей пачками; возвращает число пересчитанных.
+
+    ``runner`` — уже открытый ``OpenAIRunner``; без него создаётся свой на все пачки.
+    """
+    if runner is None:
+        with OpenAIRunner(client) as runner:
+            return refresh_parent_summaries(batch_size=batch_size, usage=usage, runner=runner)
+
+    user_ids = stale_summary_user_ids("parent")
+    if not user_ids:
+        return 0
+
+    engine = _build_engine(runner.client, usage=usage)
+    for start in range(0, len(user_ids), batch_size):
+        batch = Answer.objects.filter(user_id__in=user_ids[start:start + batch_size])
+        # водяной знак читаем до текста: новые ответы в худшем случае вызовут лишний пересчёт
+        watermarks = _answers_watermark(batch)
+        blocks = list(_iter_answer_blocks(batch, chunk_size=2000))
+
+        texts = runner.run(engine.summarise([block for _, block in blocks]))
+        _save_summaries(
+            (user_id, text, watermarks[user_id])
+            for (user_id, _), text in zip(blocks, texts)
+        )
+
+    return len(user_ids)
+
+
+# Итоговый отчёт и всё, что нужно сохранить вместе с ним
+ParentReport = namedtuple("ParentReport", ["text", "cache_key", "watermark", "usage", "timings"])
+
+
+def parent_report_key(finished_only=False):
+    """
+    Водяной знак ответов родителей и ключ отчёта по нему.
+
+    Ключ считается по водяному знаку и времени пересчёта таблиц статистики,
+    без чтения самих таблиц: готовый отчёт находится за пару агрегатов.
+    """
+    watermark = parent_answers_watermark(finished_only)
+    statistics_at = statistics_computed_at("parent", finished_only)
+    return watermark, parent_report_cache_key(watermark, finished_only, statistics_at)
+
+
+def parent_report_inputs(finished_only=False, key=None):
+    """
+    Предрасчитанная статистика, водяной знак ответов и ключ отчёта по ним.
+
+    ``key`` — уже посчитанный результат ``parent_report_key``.
+    """
+    watermark, cache_key = key or parent_report_key(finished_only)
+    return format_statistics("parent", finished_only), watermark, cache_key
+
+
+def generate_parent_report(client=None, use_cache=True, inputs=None):
+    """
+    Отчёт по анкетам родителей вместе с расходом токенов и временем этапов.
+
+    ``inputs`` — уже посчитанный результат ``parent_report_inputs``.
+    """
+    finished_only = getattr(settings, "AI_REPORT_FINISHED_ONLY", False)
+    usage = new_usage()
+    timings = {}
+
+    started = time.perf_counter()
+    statistics, watermark, cache_key = inputs or parent_report_inputs(finished_only)
+    timings["statistics"] = round(time.perf_counter() - started, 3)
+
+    def result(text):
+        timings["total"] = round(time.perf_counter() - started, 3)
+        return ParentReport(text, cache_key, watermark, usage, timings)
+
+    if use_cache:
+        cached = report_cache().get(cache_key)
+        if cached is not None:
+            return result(cached)
+
+    with OpenAIRunner(client) as runner:
+        stage = time.perf_counter()
+        refresh_parent_summaries(usage=usage, runner=runner)
+        timings["summaries"] = round(time.perf_counter() - stage, 3)
+
+        summaries = RespondentSummary.objects.filter(user__role="parent")
+        if finished_only:
+            summaries = summaries.filter(user_id__in=finished_user_ids("parent"))
+        summaries = list(summaries.order_by("user_id").values_list("text", flat=True))
+
+        if not summaries:
+            return result("")
+
+        engine = _build_engine(runner.client, cache=completion_cache(), usage=usage)
+        stage = time.perf_counter()
+        report_text = runner.run(engine.reduce(summaries, statistics))
+        timings["reduce"] = round(time.perf_counter() - stage, 3)
+    if report_text:
+        report_cache().set(cache_key, report_text)
+    return result(report_text)
+
 
-    return response.choices[0].message.content
+def generate_parent_report_for_all(client=None, use_cache=True):
+    return generate_parent_report(client, use_cache).text
@@ -0,0 +1,189 @@
+import logging
+import threading
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import F
+from django.utils import timezone
+
+from .ai.report import generate_ai_report
+from .models import Job, User
+from .services.export import export_answers, export_path
+from .services.reports import deliver_parent_report
+from .services.statistics import refresh_statistics
+
+
+logger = logging.getLogger(__name__)
+
+HANDLERS = {}  # kind -> callable(job)
+
+
+def job_handler(kind):
+    def decorator(func):
+        HANDLERS[kind] = func
+        return func
+    return decorator
+
+
+def enqueue(kind, payload=None, max_attempts=3):
+    return Job.objects.create(kind=kind, payload=payload or {}, max_attempts=max_attempts)
+
+
+def _owned(job):
+    # строка задачи, пока её держит этот воркер; если задачу вернули в очередь
+    # и её взял другой воркер, запись отсюда уже ничего не меняет
+    return Job.objects.filter(pk=job.pk, status=Job.STATUS_RUNNING, locked_by=job.locked_by)
+
+
+def set_progress(job, percent, message=""):
+    job.progress = percent
+    job.progress_message = message
+    _owned(job).update(progress=percent, progress_message=message, heartbeat_at=timezone.now())
+
+
+class Heartbeat:
+    """Фоновый поток, который отмечает задачу, пока обработчик работает (например, ждёт OpenAI)."""
+
+    def __init__(self, job, interval):
+        self.job = job
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"job-{job.pk}-heartbeat", daemon=True)
+
+    def _run(self):
+        try:
+            while not self._stop.wait(self.interval):
+                _owned(self.job).update(heartbeat_at=timezone.now())
+        except Exception:
+            logger.exception("Не удалось отметить задачу %s", self.job)
+        finally:
+            # у потока своё соединение с БД
+            connection.close()
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+
+
+def _requeue_stale():
+    # Воркер умер посреди задачи: давно не отмечался в ней
+    deadline = timezone.now() - timedelta(seconds=settings.JOB_TIMEOUT)
+    stale = Job.objects.filter(status=Job.STATUS_RUNNING, heartbeat_at__lt=deadline)
+    stale.filter(attempts__lt=F("max_attempts")).update(
+        status=Job.STATUS_PENDING,
+        locked_by="",
+    )
+    stale.update(
+        status=Job.STATUS_FAILED,
+        locked_by="",
+        error="Воркер перестал отвечать, попытки исчерпаны",
+        finished_at=timezone.now(),
+    )
+
+
+def claim_next(worker_id):
+    """Забирает ближайшую готовую к запуску задачу; безопасно при нескольких воркерах."""
+    _requeue_stale()
+
+    while True:
+        now = timezone.now()
+        job_id = (
+            Job.objects
+            .filter(status=Job.STATUS_PENDING, run_after__lte=now)
+            .order_by("run_after", "id")
+            .values_list("id", flat=True)
+            .first()
+        )
+        if job_id is None:
+            return None
+
+        claimed = Job.objects.filter(id=job_id, status=Job.STATUS_PENDING).update(
+            status=Job.STATUS_RUNNING,
+            locked_by=worker_id,
+            started_at=now,
+            heartbeat_at=now,
+            attempts=F("attempts") + 1,
+        )
+        if claimed:
+            return Job.objects.get(id=job_id)
+
+
+def run_job(job):
+    handler = HANDLERS.get(job.kind)
+    try:
+        if handler is None:
+            raise LookupError(f"Неизвестный тип задачи: {job.kind}")
+        with Heartbeat(job, settings.JOB_HEARTBEAT_INTERVAL):
+            result = handler(job)
+    except Exception:
+        job.error = traceback.format_exc()
+        if job.attempts < job.max_attempts:
+            delay = settings.JOB_RETRY_BACKOFF * 2 ** (job.attempts - 1)
+            job.status = Job.STATUS_PENDING
+            job.run_after = timezone.now() + timedelta(seconds=delay)
+        else:
+            job.status = Job.STATUS_FAILED
+            job.finished_at = timezone.now()
+        logger.exception("Задача %s завершилась ошибкой", job)
+    else:
+        job.status = Job.STATUS_DONE
+        job.result = result
+        job.progress = 100
+        job.error = ""
+        job.finished_at = timezone.now()
+
+    saved = _owned(job).update(
+        status=job.status,
+        result=job.result,
+        error=job.error,
+        progress=job.progress,
+        run_after=job.run_after,
+        finished_at=job.finished_at,
+        locked_by="",
+    )
+    if not saved:
+        # задачу сочли брошенной и отдали другому воркеру — его состояние не трогаем
+        logger.warning("Задача %s уже не принадлежит воркеру %s, итог не записан", job, job.locked_by)
+        job.refresh_from_db()
+        return job
+
+    job.locked_by = ""
+    return job
+
+
+# ======================================================
+# HANDLERS
+# ======================================================
+
+@job_handler("parent_report")
+def parent_report_job(job):
+    return deliver_parent_report(
+        progress=lambda percent, message: set_progress(job, percent, message)
+    )
+
+
+@job_handler("respondent_summary")
+def respondent_summary_job(job):
+    user = User.objects.get(id=job.payload["user_id"])
+    return {"summary_chars": len(generate_ai_report(user))}
+
+
+@job_handler("statistics")
+def statistics_job(job):
+    return refresh_statistics()
+
+
+@job_handler("export")
+def export_job(job):
+    fmt = job.payload.get("format", "csv")
+    layout = job.payload.get("layout", "long")
+    role = job.payload.get("role") or None
+    path = export_path(fmt, layout, role)
+    rows = export_answers(fmt, layout, path, role=role, selection=job.payload.get("selection"))
+    return {"file": path.name, "rows": rows}
@@ -0,0 +1,45 @@
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+
+from django.db import connection, connections
+from django.db.backends.signals import connection_created
+
+
+@contextmanager
+def benchmark_database(latency_ms=0):
+    """
+    Отдельная тестовая БД для нагрузочных команд; рабочая база не трогается.
+
+    ``latency_ms`` добавляет задержку к каждому SQL-запросу — так на
+    локальной SQLite моделируется сетевой round trip до сервера БД.
+    """
+    test_settings = connection.settings_dict.setdefault("TEST", {})
+    tmp_dir = None
+    if connection.vendor == "sqlite" and not test_settings.get("NAME"):
+        # in-memory БД не годится: каждому потоку нужно своё соединение к тем же данным
+        tmp_dir = tempfile.TemporaryDirectory()
+        test_settings["NAME"] = os.path.join(tmp_dir.name, "benchmark.sqlite3")
+
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    latency = latency_ms / 1000
+
+    def slow_query(execute, sql, params, many, context):
+        time.sleep(latency)
+        return execute(sql, params, many, context)
+
+    def add_latency(sender, connection, **kwargs):
+        connection.execute_wrappers.append(slow_query)
+
+    if latency:
+        connection_created.connect(add_latency)
+    try:
+        connections.close_all()
+        yield
+    finally:
+        connection_created.disconnect(add_latency)
+        connections.close_all()
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        if tmp_dir is not None:
+            tmp_dir.cleanup()
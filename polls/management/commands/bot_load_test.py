@@ -0,0 +1,112 @@
+import asyncio
+import statistics
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from polls.models import Poll, PollDelivery, SurveySession, User
+from polls.services import db
+from polls.services.sessions import advance_session
+
+from ._benchmark import benchmark_database
+
+
+MODES = ["sync_to_async", "async_orm", "pool"]
+
+
+def handler_step(tg_id, telegram_poll_id):
+    """Запросы обработчика ответа на опрос: пользователь, сопоставление опроса, сдвиг позиции."""
+    user = User.objects.get(tg_id=tg_id)
+    PollDelivery.objects.filter(telegram_poll_id=telegram_poll_id).values_list("user_id", "poll_id").first()
+    advance_session(user.id, 1, None)
+
+
+async def async_orm_step(tg_id, telegram_poll_id):
+    user = await User.objects.aget(tg_id=tg_id)
+    await PollDelivery.objects.filter(telegram_poll_id=telegram_poll_id).values_list("user_id", "poll_id").afirst()
+    await SurveySession.objects.filter(user_id=user.id, finished_at__isnull=True).aupdate(position=1)
+
+
+class Command(BaseCommand):
+    help = (
+        "Нагрузочный тест доступа бота к БД: одновременные обработчики через "
+        "sync_to_async, async-ORM Django и пул потоков polls.services.db. "
+        "Работает на отдельной тестовой БД."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--respondents", type=int, default=200, help="Одновременных респондентов")
+        parser.add_argument("--steps", type=int, default=5, help="Ответов на респондента")
+        parser.add_argument(
+            "--latency",
+            type=float,
+            default=2.0,
+            help="Задержка на каждый SQL-запрос, мс (сетевой round trip до сервера БД)",
+        )
+        parser.add_argument("--pool-size", type=int, default=None, help="Размер пула (по умолчанию BOT_DB_POOL_SIZE)")
+        parser.add_argument("--mode", choices=MODES, action="append", help="Какие варианты прогнать (по умолчанию все)")
+
+    def handle(self, *args, **options):
+        if options["pool_size"]:
+            db.shutdown()
+            settings.BOT_DB_POOL_SIZE = options["pool_size"]
+
+        with benchmark_database(options["latency"]):
+            targets = self.populate(options["respondents"])
+            try:
+                for mode in options["mode"] or MODES:
+                    self.report(mode, asyncio.run(self.run(mode, targets, options["steps"])))
+            finally:
+                # соединения потоков пула должны закрыться до удаления тестовой БД
+                db.shutdown()
+
+    def populate(self, respondents):
+        poll = Poll.objects.create(role="parent", question="Нагрузочный тест", options=[{"key": "A", "text": "Да"}])
+        users = User.objects.bulk_create(
+            User(tg_id=1_000_000 + i, role="parent") for i in range(respondents)
+        )
+        SurveySession.objects.bulk_create(
+            SurveySession(user=user, role="parent") for user in users
+        )
+        PollDelivery.objects.bulk_create(
+            PollDelivery(telegram_poll_id=f"load-{user.tg_id}", user=user, poll=poll) for user in users
+        )
+        return [(user.tg_id, f"load-{user.tg_id}") for user in users]
+
+    async def run(self, mode, targets, steps):
+        if mode == "sync_to_async":
+            call = sync_to_async(handler_step)
+        elif mode == "async_orm":
+            call = async_orm_step
+        else:
+            call = db.db_task(handler_step)
+
+        timings = []
+
+        async def respondent(tg_id, telegram_poll_id):
+            for _ in range(steps):
+                started = time.perf_counter()
+                await call(tg_id, telegram_poll_id)
+                timings.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(respondent(*target) for target in targets))
+        elapsed = time.perf_counter() - started
+
+        if mode != "pool":
+            # соединение общего потока sync_to_async иначе переживёт тестовую БД
+            await sync_to_async(connections.close_all)()
+        return elapsed, timings
+
+    def report(self, mode, result):
+        elapsed, timings = result
+        timings.sort()
+        p95 = timings[int(len(timings) * 0.95) - 1]
+        self.stdout.write(
+            f"{mode:14} {len(timings) / elapsed:8.1f} обработчиков/с   "
+            f"p50 {statistics.median(timings) * 1000:8.1f} мс   "
+            f"p95 {p95 * 1000:8.1f} мс   всего {elapsed:6.2f} с"
+        )
@@ -0,0 +1,111 @@
+import re
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from polls.models import Answer, BotState, Poll, PollDelivery, SurveySession, User
+from polls.services.sessions import finished_user_ids
+
+
+# SQLite: "SCAN polls_answer" без индекса; PostgreSQL: "Seq Scan on polls_answer"
+FULL_SCAN_PATTERNS = [
+    re.compile(r"\bSCAN (?!CONSTANT ROW)(?!.*\bUSING (?:COVERING )?INDEX\b)(\w+)"),
+    re.compile(r"\bSeq Scan on (\w+)"),
+]
+
+# ORDER BY, который индекс не обслуживает: SQLite досортировывает строки во
+# временном B-дереве, PostgreSQL — отдельным узлом Sort
+SORT_PATTERNS = [
+    re.compile(r"\bUSE TEMP B-TREE FOR (?:RIGHT PART OF |LAST \d+ TERMS OF )?ORDER BY\b"),
+    re.compile(r"(?m)^\s*(?:->\s*)?(?:Incremental )?Sort\b"),
+]
+
+
+def hot_queries():
+    """Запросы, которые выполняются на каждый ответ респондента или при построении отчёта."""
+    return {
+        "questionnaire": (
+            Poll.objects
+            .filter(role="parent", is_active=True)
+            .order_by("order", "id")
+            .values_list("id", "question", "question_type", "options")
+        ),
+        "user_by_tg_id": User.objects.filter(tg_id=1),
+        "delivery_by_telegram_poll_id": (
+            PollDelivery.objects
+            .filter(telegram_poll_id="1")
+            .values_list("user_id", "poll_id")
+        ),
+        "open_session": SurveySession.objects.filter(user_id=1, finished_at__isnull=True),
+        "fsm_state": BotState.objects.filter(key="fsm:1:1:1:default"),
+        "user_answers": (
+            Answer.objects
+            .filter(user_id=1)
+            .select_related("poll")
+            .order_by("created_at")
+        ),
+        "parent_answers": (
+            Answer.objects
+            .filter(user_id__in=User.objects.filter(role="parent").values("id"))
+            .select_related("poll", "user")
+            .order_by("user_id", "created_at")
+        ),
+        "finished_parent_answers": (
+            Answer.objects
+            .filter(user_id__in=finished_user_ids("parent"))
+            .order_by("user_id", "created_at")
+        ),
+    }
+
+
+def full_scans(plan):
+    tables = []
+    for pattern in FULL_SCAN_PATTERNS:
+        tables.extend(pattern.findall(plan))
+    return tables
+
+
+def sorts_without_index(plan):
+    return any(pattern.search(plan) for pattern in SORT_PATTERNS)
+
+
+class Command(BaseCommand):
+    help = (
+        "Проверяет через EXPLAIN, что горячие запросы не читают таблицы "
+        "целиком и не сортируют строки мимо индекса"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--verbose-plans",
+            action="store_true",
+            help="Печатать план каждого запроса",
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor == "postgresql":
+            # На маленьких таблицах планировщик честно выбирает Seq Scan;
+            # нам важно, что индекс в принципе применим.
+            with connection.cursor() as cursor:
+                cursor.execute("SET enable_seqscan = off")
+
+        failures = []
+        for name, queryset in hot_queries().items():
+            plan = queryset.explain()
+            if options["verbose_plans"]:
+                self.stdout.write(f"--- {name}\n{plan}\n")
+
+            problems = []
+            tables = full_scans(plan)
+            if tables:
+                problems.append(f"полный проход по {', '.join(sorted(set(tables)))}")
+            if sorts_without_index(plan):
+                problems.append("сортировка без индекса")
+
+            if problems:
+                failures.append(f"{name}: {'; '.join(problems)}")
+            else:
+                self.stdout.write(self.style.SUCCESS(f"OK  {name}"))
+
+        if failures:
+            raise CommandError("Запросы без индекса:\n" + "\n".join(failures))
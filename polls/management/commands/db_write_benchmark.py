@@ -0,0 +1,115 @@
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection, connections, transaction
+from django.db.models import Count, F
+
+from polls.models import Answer, Poll, SurveySession, User
+
+from ._benchmark import benchmark_database
+
+
+class Command(BaseCommand):
+    help = (
+        "Параллельная запись ответов (как бот) и чтение сводок (как админка) "
+        "на отдельной тестовой БД с текущими настройками DATABASES. "
+        "Сравнивайте, меняя DB_ENGINE / DB_SQLITE_JOURNAL_MODE."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--writers", type=int, default=8, help="Потоков записи")
+        parser.add_argument("--readers", type=int, default=2, help="Потоков чтения")
+        parser.add_argument("--seconds", type=float, default=5, help="Длительность прогона")
+        parser.add_argument("--batch", type=int, default=1, help="Ответов в одной транзакции")
+        parser.add_argument("--users", type=int, default=200, help="Респондентов в тестовой БД")
+
+    def handle(self, *args, **options):
+        with benchmark_database():
+            self.stdout.write(self.describe_database())
+            poll_id, user_ids = self.populate(options["users"])
+            self.run(poll_id, user_ids, options)
+
+    def describe_database(self):
+        if connection.vendor != "sqlite":
+            return f"{connection.vendor}, CONN_MAX_AGE={connection.settings_dict['CONN_MAX_AGE']}"
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA journal_mode")
+            journal_mode = cursor.fetchone()[0]
+        return f"sqlite, journal_mode={journal_mode}"
+
+    def populate(self, users):
+        poll = Poll.objects.create(role="parent", question="Бенчмарк", question_type="text")
+        created = User.objects.bulk_create(
+            User(tg_id=2_000_000 + i, role="parent") for i in range(users)
+        )
+        SurveySession.objects.bulk_create(
+            SurveySession(user=user, role="parent") for user in created
+        )
+        return poll.id, [user.id for user in created]
+
+    def run(self, poll_id, user_ids, options):
+        stop = threading.Event()
+        batch = options["batch"]
+
+        def writer(offset):
+            commits, errors = [], 0
+            i = offset
+            try:
+                while not stop.is_set():
+                    user_id = user_ids[i % len(user_ids)]
+                    i += options["writers"]
+                    started = time.perf_counter()
+                    try:
+                        # то же, что делает бот на ответ: строки ответов и сдвиг позиции
+                        with transaction.atomic():
+                            Answer.objects.bulk_create(
+                                Answer(user_id=user_id, poll_id=poll_id, answer="бенчмарк")
+                                for _ in range(batch)
+                            )
+                            SurveySession.objects.filter(user_id=user_id).update(position=F("position") + 1)
+                    except OperationalError:
+                        errors += 1
+                        continue
+                    commits.append(time.perf_counter() - started)
+            finally:
+                connections.close_all()
+            return commits, errors
+
+        def reader():
+            reads = 0
+            try:
+                while not stop.is_set():
+                    list(
+                        Answer.objects
+                        .filter(user__role="parent")
+                        .values("poll_id")
+                        .annotate(total=Count("id"))
+                    )
+                    reads += 1
+            finally:
+                connections.close_all()
+            return reads
+
+        with ThreadPoolExecutor(options["writers"] + options["readers"]) as executor:
+            writers = [executor.submit(writer, n) for n in range(options["writers"])]
+            readers = [executor.submit(reader) for _ in range(options["readers"])]
+            time.sleep(options["seconds"])
+            stop.set()
+            results = [future.result() for future in writers]
+            reads = sum(future.result() for future in readers)
+
+        commits = sorted(t for times, _ in results for t in times)
+        errors = sum(errors for _, errors in results)
+        elapsed = options["seconds"]
+        p95 = commits[int(len(commits) * 0.95) - 1] if commits else 0
+
+        self.stdout.write(
+            f"запись:  {len(commits) / elapsed:8.1f} транзакций/с  "
+            f"{len(commits) * batch / elapsed:8.1f} ответов/с  "
+            f"p50 {statistics.median(commits or [0]) * 1000:6.1f} мс  "
+            f"p95 {p95 * 1000:6.1f} мс  ошибок блокировки {errors}"
+        )
+        self.stdout.write(f"чтение:  {reads / elapsed:8.1f} сводок/с")
@@ -0,0 +1,110 @@
+import tempfile
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+
+from polls.ai.docx import build_docx_bytes, write_docx
+from polls.ai.markdown import iter_lines, tokenize
+
+
+SECTION = """## Блок {n}. Безопасность и комфорт
+
+Средний балл по блоку — **7,{n}**, это {n}-е место среди блоков. Родители отмечают
+чистоту и отзывчивость персонала, но **жалуются на прачечную** и шум по вечерам.
+
+1. Сильные стороны: *кураторы*, охрана
+2. Зоны роста:
+   - прачечная
+   - шумоизоляция
+
+| Вопрос | Ответов | Среднее | Доля «Да» |
+| :--- | ---: | ---: | ---: |
+| Уверенность в безопасности | 120 | 8,1 | 84% |
+| Условия проживания | 118 | 7,2 | 71% |
+| Питание | 117 | 6,4 | 58% |
+
+"""
+
+CHART = """```chart
+Средние баллы, блоки {first}–{n}
+Безопасность | 8.1
+Условия | 7.2
+Питание | 6.4
+```
+
+"""
+
+
+def make_report(megabytes):
+    """Синтетический markdown-отчёт заданного размера."""
+    sections = []
+    size, n = 0, 0
+    while size < megabytes * 1024 * 1024:
+        n += 1
+        section = SECTION.format(n=n)
+        # диаграмм в отчёте немного, а каждая — отдельная часть архива с записью в оглавлении zip
+        if n % 10 == 0 and n <= 200:
+            section += CHART.format(first=n - 9, n=n)
+        sections.append(section)
+        size += len(section.encode())
+    return "# AI-отчёт по анкетам родителей\n\n" + "".join(sections)
+
+
+class Command(BaseCommand):
+    help = (
+        "Сборка DOCX из синтетических отчётов разного размера: скорость разбора "
+        "markdown, время и пик памяти при потоковой записи в файл и при сборке в байты"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sizes",
+            type=float,
+            nargs="+",
+            default=[1, 4, 16],
+            help="Размеры отчётов, МБ",
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f"{'отчёт':>8} {'docx':>8} {'разбор':>10} {'в файл':>16} {'в байты':>16}"
+        )
+        for megabytes in options["sizes"]:
+            report = make_report(megabytes)
+
+            def to_file():
+                with tempfile.TemporaryFile() as file:
+                    write_docx(report, file)
+                    return file.tell()
+
+            started = time.perf_counter()
+            for _ in tokenize(iter_lines(report)):
+                pass
+            parse_rate = len(report.encode()) / 2**20 / (time.perf_counter() - started)
+
+            docx_size = to_file()
+            in_file = self.measure(to_file)
+            in_bytes = self.measure(lambda: build_docx_bytes(report))
+
+            self.stdout.write(
+                f"{len(report.encode()) / 2**20:6.1f}МБ {docx_size / 2**20:6.2f}МБ "
+                f"{parse_rate:6.1f}МБ/с "
+                f"{in_file[0]:6.2f}с {in_file[1] / 2**20:6.2f}МБ "
+                f"{in_bytes[0]:6.2f}с {in_bytes[1] / 2**20:6.2f}МБ"
+            )
+
+    def measure(self, func):
+        """(секунды, пик памяти Python в байтах) без учёта уже созданного текста отчёта."""
+        started = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - started
+
+        # tracemalloc сильно замедляет код, поэтому память меряется отдельным прогоном
+        tracemalloc.start()
+        try:
+            func()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        return elapsed, peak
@@ -0,0 +1,49 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from polls.services.export import (
+    FORMATS,
+    LAYOUTS,
+    answers_queryset,
+    build_export,
+    export_answers,
+    export_path,
+    write_csv,
+)
+from polls.services.statistics import ROLES
+
+
+class Command(BaseCommand):
+    help = (
+        "Выгрузка ответов в CSV, XLSX или Parquet. Ответы читаются курсором "
+        "пачками, поэтому память не растёт с размером таблицы."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--format", dest="fmt", choices=FORMATS, default="csv")
+        parser.add_argument(
+            "--layout",
+            choices=LAYOUTS,
+            default="long",
+            help="long — строка на ответ, wide — строка на респондента, колонка на вопрос",
+        )
+        parser.add_argument("--role", choices=ROLES, help="Только ответы этой роли")
+        parser.add_argument(
+            "--output",
+            "-o",
+            help="Путь к файлу; «-» — CSV в stdout. По умолчанию файл в EXPORT_ROOT",
+        )
+
+    def handle(self, *args, **options):
+        fmt, layout, role = options["fmt"], options["layout"], options["role"]
+
+        if options["output"] == "-":
+            if fmt != "csv":
+                raise CommandError("В stdout можно выгрузить только CSV")
+            write_csv(build_export(layout, answers_queryset(role)), sys.stdout)
+            return
+
+        path = options["output"] or export_path(fmt, layout, role)
+        rows = export_answers(fmt, layout, path, role=role)
+        self.stderr.write(self.style.SUCCESS(f"Строк: {rows} → {path}"))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from polls.services.statistics import ROLES, format_statistics, refresh_statistics
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает предрасчитанную статистику анкет (QuestionStat, FunnelStat)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--print",
+            dest="print_role",
+            choices=ROLES,
+            help="Вывести таблицы роли после пересчёта",
+        )
+        parser.add_argument(
+            "--finished-only",
+            action="store_true",
+            help="Выводить таблицы только по прошедшим анкету до конца",
+        )
+
+    def handle(self, *args, **options):
+        result = refresh_statistics()
+        self.stdout.write(self.style.SUCCESS(
+            f"Вопросов/вариантов: {result['question_stats']}, шагов воронки: {result['funnel_steps']}"
+        ))
+        if options["print_role"]:
+            self.stdout.write(format_statistics(options["print_role"], options["finished_only"]))
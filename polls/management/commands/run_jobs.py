@@ -0,0 +1,39 @@
+import os
+import socket
+import time
+
+from django.core.management.base import BaseCommand
+
+from polls.jobs import claim_next, run_job
+
+
+class Command(BaseCommand):
+    help = "Воркер фоновых задач (AI-отчёты, сводки): берёт задачи из таблицы Job и выполняет их"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Выполнить все готовые задачи и выйти",
+        )
+        parser.add_argument(
+            "--sleep",
+            type=float,
+            default=2.0,
+            help="Пауза между опросами пустой очереди, сек.",
+        )
+
+    def handle(self, *args, **options):
+        worker_id = f"{socket.gethostname()}:{os.getpid()}"
+
+        while True:
+            job = claim_next(worker_id)
+            if job is None:
+                if options["once"]:
+                    return
+                time.sleep(options["sleep"])
+                continue
+
+            self.stdout.write(f"→ {job}")
+            job = run_job(job)
+            self.stdout.write(f"← {job}")
@@ -0,0 +1,26 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0008_user_profile_fields'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='poll',
+            name='telegram_poll_id',
+        ),
+        migrations.CreateModel(
+            name='PollDelivery',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('telegram_poll_id', models.CharField(max_length=255, unique=True)),
+                ('sent_at', models.DateTimeField(auto_now_add=True)),
+                ('poll', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='deliveries', to='polls.poll')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='deliveries', to='polls.user')),
+            ],
+        ),
+    ]
@@ -0,0 +1,29 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0010_bot_state'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SurveySession',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('role', models.CharField(choices=[('parent', 'Родитель'), ('student', 'Ученик')], max_length=10)),
+                ('position', models.PositiveIntegerField(default=0)),
+                ('questionnaire_version', models.CharField(blank=True, max_length=40)),
+                ('started_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='survey_sessions', to='polls.user')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'finished_at'], name='polls_surve_user_id_355192_idx'), models.Index(fields=['role', 'finished_at'], name='polls_surve_role_09ed7e_idx')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('finished_at__isnull', True)), fields=('user',), name='polls_one_open_session_per_user')],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0011_survey_session'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='answer',
+            index=models.Index(fields=['user', 'created_at'], name='polls_answe_user_id_ff4b1c_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='poll',
+            index=models.Index(fields=['role', 'is_active', 'order', 'id'], name='polls_poll_role_29627b_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['role'], name='polls_user_role_bda051_idx'),
+        ),
+    ]
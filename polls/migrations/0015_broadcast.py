@@ -0,0 +1,35 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0014_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Broadcast',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('text', models.TextField()),
+                ('role', models.CharField(blank=True, choices=[('parent', 'Родитель'), ('student', 'Ученик')], help_text='Пусто — всем ролям', max_length=10, null=True)),
+                ('audience', models.CharField(choices=[('not_started', 'Не начинали опрос'), ('unfinished', 'Начали, но не закончили'), ('not_finished', 'Не закончили (в т.ч. не начинали)'), ('all', 'Все')], default='not_finished', max_length=20)),
+                ('require_consent', models.BooleanField(default=True, verbose_name='Только давшим согласие на обработку данных')),
+                ('status', models.CharField(choices=[('pending', 'В очереди'), ('running', 'Идёт рассылка'), ('done', 'Завершена'), ('cancelled', 'Остановлена')], default='pending', max_length=10)),
+                ('last_user_id', models.BigIntegerField(default=0)),
+                ('sent', models.PositiveIntegerField(default=0)),
+                ('failed', models.PositiveIntegerField(default=0)),
+                ('blocked', models.PositiveIntegerField(default=0)),
+                ('locked_by', models.CharField(blank=True, max_length=100)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['role', 'consent_personal_data', 'id'], name='polls_user_role_9660d8_idx'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0015_broadcast'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='answer',
+            name='option_index',
+            field=models.PositiveSmallIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='answer',
+            name='option_key',
+            field=models.CharField(blank=True, default='', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='answer',
+            name='score',
+            field=models.PositiveSmallIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='answer',
+            name='text',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddIndex(
+            model_name='answer',
+            index=models.Index(fields=['poll', 'option_key'], name='polls_answe_poll_id_ae665b_idx'),
+        ),
+    ]
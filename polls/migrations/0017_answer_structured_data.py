@@ -0,0 +1,60 @@
+from django.db import migrations
+
+
+BATCH_SIZE = 1000
+
+
+def parse_answer(poll, answer):
+    """Структурированные поля из старого строкового ответа."""
+    if poll.question_type == "scale_group":
+        # "A: 7"
+        key, sep, score = answer.partition(":")
+        if not sep:
+            return {}
+        fields = {"option_key": key.strip()[:20]}
+        if score.strip().isdigit():
+            fields["score"] = int(score.strip())
+        return fields
+
+    if poll.question_type in ("choice", "multi_choice"):
+        for index, opt in enumerate(poll.options or []):
+            if isinstance(opt, dict) and opt.get("text") == answer:
+                return {"option_index": index}
+        return {}
+
+    if poll.question_type == "text":
+        return {"text": answer}
+
+    return {}
+
+
+def fill_structured_fields(apps, schema_editor):
+    Answer = apps.get_model("polls", "Answer")
+    Poll = apps.get_model("polls", "Poll")
+    polls = {poll.id: poll for poll in Poll.objects.all()}
+
+    batch = []
+    for answer in Answer.objects.iterator(chunk_size=BATCH_SIZE):
+        fields = parse_answer(polls[answer.poll_id], answer.answer)
+        if not fields:
+            continue
+        for name, value in fields.items():
+            setattr(answer, name, value)
+        batch.append(answer)
+        if len(batch) >= BATCH_SIZE:
+            Answer.objects.bulk_update(batch, ["option_index", "option_key", "score", "text"])
+            batch = []
+
+    if batch:
+        Answer.objects.bulk_update(batch, ["option_index", "option_key", "score", "text"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0016_answer_structured_fields'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_structured_fields, migrations.RunPython.noop),
+    ]
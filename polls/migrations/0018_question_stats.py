@@ -0,0 +1,55 @@
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0017_answer_structured_data'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FunnelStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('role', models.CharField(max_length=10)),
+                ('step', models.PositiveSmallIntegerField()),
+                ('reached', models.PositiveIntegerField(default=0)),
+                ('answered', models.PositiveIntegerField(default=0)),
+                ('computed_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('poll', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='funnel_stats', to='polls.poll')),
+            ],
+            options={
+                'ordering': ['role', 'step'],
+                'constraints': [models.UniqueConstraint(fields=('role', 'step'), name='polls_funnel_role_step')],
+            },
+        ),
+        migrations.CreateModel(
+            name='QuestionStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('role', models.CharField(max_length=10)),
+                ('kind', models.CharField(choices=[('option', 'Вариант ответа'), ('scale', 'Утверждение шкалы')], max_length=10)),
+                ('option_index', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('option_key', models.CharField(blank=True, default='', max_length=20)),
+                ('label', models.CharField(blank=True, max_length=255)),
+                ('answers', models.PositiveIntegerField(default=0)),
+                ('respondents', models.PositiveIntegerField(default=0)),
+                ('share', models.FloatField(blank=True, null=True)),
+                ('mean', models.FloatField(blank=True, null=True)),
+                ('median', models.FloatField(blank=True, null=True)),
+                ('p25', models.FloatField(blank=True, null=True)),
+                ('p75', models.FloatField(blank=True, null=True)),
+                ('p90', models.FloatField(blank=True, null=True)),
+                ('minimum', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('maximum', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('computed_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('poll', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stats', to='polls.poll')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['role', 'poll'], name='polls_quest_role_5c4048_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0018_question_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Report',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('role', models.CharField(default='parent', max_length=10)),
+                ('cache_key', models.CharField(db_index=True, max_length=100)),
+                ('text', models.TextField()),
+                ('docx', models.FileField(blank=True, upload_to='reports/%Y/%m/')),
+                ('telegram_file_id', models.CharField(blank=True, max_length=255)),
+                ('watermark', models.JSONField(blank=True, default=dict)),
+                ('model', models.CharField(blank=True, max_length=100)),
+                ('finished_only', models.BooleanField(default=False)),
+                ('requests', models.PositiveIntegerField(default=0)),
+                ('prompt_tokens', models.PositiveIntegerField(default=0)),
+                ('completion_tokens', models.PositiveIntegerField(default=0)),
+                ('timings', models.JSONField(blank=True, default=dict)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['-id'],
+            },
+        ),
+    ]
@@ -0,0 +1,36 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def fill_session_poll(apps, schema_editor):
+    """Открытым сессиям — вопрос на их позиции в текущей анкете роли."""
+    Poll = apps.get_model("polls", "Poll")
+    SurveySession = apps.get_model("polls", "SurveySession")
+
+    for role in ("parent", "student"):
+        poll_ids = list(
+            Poll.objects
+            .filter(role=role, is_active=True)
+            .order_by("order", "id")
+            .values_list("id", flat=True)
+        )
+        for position, poll_id in enumerate(poll_ids):
+            SurveySession.objects.filter(
+                role=role, finished_at__isnull=True, position=position
+            ).update(poll_id=poll_id)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0019_report'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='surveysession',
+            name='poll',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='polls.poll'),
+        ),
+        migrations.RunPython(fill_session_poll, migrations.RunPython.noop),
+    ]
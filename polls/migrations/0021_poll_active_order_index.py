@@ -0,0 +1,19 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0020_survey_session_poll'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='poll',
+            name='polls_poll_role_29627b_idx',
+        ),
+        migrations.AddIndex(
+            model_name='poll',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['role', 'order', 'id'], name='polls_poll_active_order_idx'),
+        ),
+    ]
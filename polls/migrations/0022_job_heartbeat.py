@@ -0,0 +1,24 @@
+from django.db import migrations, models
+from django.db.models import F
+
+
+def fill_heartbeat(apps, schema_editor):
+    # выполняющиеся задачи считаем отметившимися в момент запуска
+    Job = apps.get_model("polls", "Job")
+    Job.objects.filter(status="running").update(heartbeat_at=F("started_at"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0021_poll_active_order_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='job',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(fill_heartbeat, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+from django.conf import settings
+from django.db import migrations
+
+
+def set_journal_mode(apps, schema_editor):
+    """Режим журнала SQLite сохраняется в файле БД: достаточно включить его один раз."""
+    connection = schema_editor.connection
+    if connection.vendor != "sqlite":
+        return
+    mode = getattr(settings, "DB_SQLITE_JOURNAL_MODE", "WAL")
+    with connection.cursor() as cursor:
+        cursor.execute(f"PRAGMA journal_mode={mode}")
+
+
+class Migration(migrations.Migration):
+    # journal_mode нельзя сменить внутри транзакции
+    atomic = False
+
+    dependencies = [
+        ('polls', '0022_job_heartbeat'),
+    ]
+
+    operations = [
+        migrations.RunPython(set_journal_mode, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,41 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0023_sqlite_journal_mode'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='funnelstat',
+            options={'ordering': ['role', 'finished_only', 'step']},
+        ),
+        migrations.RemoveConstraint(
+            model_name='funnelstat',
+            name='polls_funnel_role_step',
+        ),
+        migrations.RemoveIndex(
+            model_name='questionstat',
+            name='polls_quest_role_5c4048_idx',
+        ),
+        migrations.AddField(
+            model_name='funnelstat',
+            name='finished_only',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='questionstat',
+            name='finished_only',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddIndex(
+            model_name='questionstat',
+            index=models.Index(fields=['role', 'finished_only', 'poll'], name='polls_quest_role_0afbb2_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='funnelstat',
+            constraint=models.UniqueConstraint(fields=('role', 'finished_only', 'step'), name='polls_funnel_role_finished_step'),
+        ),
+    ]
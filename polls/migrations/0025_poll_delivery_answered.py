@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0024_statistics_finished_only'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='polldelivery',
+            name='answered_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,15 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0025_poll_delivery_answered'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='botstate',
+            index=models.Index(fields=['updated_at'], name='polls_botst_updated_7a630f_idx'),
+        ),
+    ]
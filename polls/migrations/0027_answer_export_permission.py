@@ -0,0 +1,15 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0026_bot_state_updated_at_index'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='answer',
+            options={'permissions': [('export_answer', 'Может выгружать ответы')]},
+        ),
+    ]
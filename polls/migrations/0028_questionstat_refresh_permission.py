@@ -0,0 +1,15 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0027_answer_export_permission'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='questionstat',
+            options={'permissions': [('refresh_questionstat', 'Может пересчитывать статистику')]},
+        ),
+    ]
@@ -1,4 +1,8 @@
 from django.db import models
+from django.db.models import Value
+from django.db.models.functions import Coalesce, NullIf
+from django.utils import timezone
+from django.utils.functional import cached_property
 
 
 class User(models.Model):
@@ -22,6 +26,13 @@ class User(models.Model):
         verbose_name="Администратор (получает AI-отчёты)"
     )
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["role"]),
+            # выборка аудитории рассылки: WHERE role, consent AND id > checkpoint ORDER BY id
+            models.Index(fields=["role", "consent_personal_data", "id"]),
+        ]
+
     def __str__(self):
         return f"{self.tg_id} ({self.role})"
 
@@ -66,15 +77,30 @@ class Poll(models.Model):
 
     order = models.PositiveIntegerField(default=0)
 
-    telegram_poll_id = models.CharField(
-        max_length=255,
-        null=True,
-        blank=True
-    )
+    class Meta:
+        indexes = [
+            # анкета роли: WHERE role AND is_active ORDER BY order, id. Частичный
+            # индекс: SQLite пишет условие как голое "is_active", и с полем
+            # is_active внутри индекса сортировка шла через временное B-дерево
+            models.Index(
+                fields=["role", "order", "id"],
+                condition=models.Q(is_active=True),
+                name="polls_poll_active_order_idx",
+            ),
+        ]
 
     def __str__(self):
         return f"[{self.question_type}] {self.question[:50]}"
 
+    @cached_property
+    def options_by_key(self):
+        """Утверждения scale_group по ключу (в части старых анкет ключ лежит в "code")."""
+        return {
+            opt.get("key") or opt.get("code"): opt.get("text")
+            for opt in self.options or []
+            if isinstance(opt, dict)
+        }
+
 
 
 
@@ -88,8 +114,342 @@ class Answer(models.Model):
         Poll,
         on_delete=models.CASCADE
     )
+    # Ответ в читаемом виде (как его показывает админка и видит AI)
     answer = models.CharField(max_length=255)
+
+    # Структурированные поля, по ним считаются агрегаты:
+    # choice/multi_choice — номер варианта в poll.options,
+    # scale_group — ключ утверждения и оценка, text — полный текст ответа.
+    option_index = models.PositiveSmallIntegerField(null=True, blank=True)
+    option_key = models.CharField(max_length=20, blank=True, default="")
+    score = models.PositiveSmallIntegerField(null=True, blank=True)
+    text = models.TextField(blank=True, default="")
+
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # ответы респондента по порядку и выгрузка по user_id, created_at
+            models.Index(fields=["user", "created_at"]),
+            # средние оценки по утверждениям: GROUP BY poll_id, option_key
+            models.Index(fields=["poll", "option_key"]),
+        ]
+        permissions = [("export_answer", "Может выгружать ответы")]
+
     def __str__(self):
         return f"{self.user.tg_id} → {self.poll.question}"
+
+
+# Полный текст ответа для выгрузок и AI: открытые ответы длиннее 255 символов
+# целиком лежат только в Answer.text
+ANSWER_FULL_TEXT = Coalesce(NullIf("text", Value("")), "answer", output_field=models.TextField())
+
+
+
+
+class PollDelivery(models.Model):
+    telegram_poll_id = models.CharField(max_length=255, unique=True)
+    user = models.ForeignKey(
+        'polls.User',
+        on_delete=models.CASCADE,
+        related_name='deliveries'
+    )
+    poll = models.ForeignKey(
+        Poll,
+        on_delete=models.CASCADE,
+        related_name='deliveries'
+    )
+    sent_at = models.DateTimeField(auto_now_add=True)
+    # первый принятый голос; голос после отзыва ответом уже не считается
+    answered_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.telegram_poll_id} → {self.poll_id}"
+
+
+
+
+
+class BotState(models.Model):
+    key = models.CharField(max_length=255, unique=True)
+    state = models.CharField(max_length=255, null=True, blank=True)
+    data = models.JSONField(default=dict, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        # по нему удаляются состояния, просроченные по BOT_FSM_TTL
+        indexes = [models.Index(fields=["updated_at"])]
+
+    def __str__(self):
+        return f"{self.key}: {self.state}"
+
+
+
+
+class SurveySession(models.Model):
+    user = models.ForeignKey(
+        'polls.User',
+        on_delete=models.CASCADE,
+        related_name='survey_sessions'
+    )
+    role = models.CharField(
+        max_length=10,
+        choices=[
+            ("parent", "Родитель"),
+            ("student", "Ученик"),
+        ]
+    )
+    position = models.PositiveIntegerField(default=0)
+    questionnaire_version = models.CharField(max_length=40, blank=True)
+    # Вопрос на позиции position (пусто — вопросы кончились). Если анкету
+    # изменили после начала сессии, позиция восстанавливается по нему.
+    poll = models.ForeignKey(
+        Poll,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+'
+    )
+    started_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["user", "finished_at"]),
+            models.Index(fields=["role", "finished_at"]),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user"],
+                condition=models.Q(finished_at__isnull=True),
+                name="polls_one_open_session_per_user",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} ({self.role}) #{self.position}"
+
+
+
+
+class RespondentSummary(models.Model):
+    user = models.OneToOneField(
+        'polls.User',
+        on_delete=models.CASCADE,
+        related_name='summary'
+    )
+    text = models.TextField()
+    # по этим значениям понимаем, появились ли у пользователя новые ответы
+    answers_count = models.PositiveIntegerField(default=0)
+    last_answer_id = models.BigIntegerField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Сводка {self.user_id}"
+
+
+
+
+class Job(models.Model):
+    STATUS_PENDING = "pending"
+    STATUS_RUNNING = "running"
+    STATUS_DONE = "done"
+    STATUS_FAILED = "failed"
+    STATUSES = [
+        (STATUS_PENDING, "В очереди"),
+        (STATUS_RUNNING, "Выполняется"),
+        (STATUS_DONE, "Готово"),
+        (STATUS_FAILED, "Ошибка"),
+    ]
+
+    kind = models.CharField(max_length=50)
+    status = models.CharField(max_length=10, choices=STATUSES, default=STATUS_PENDING)
+    payload = models.JSONField(default=dict, blank=True)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    progress = models.PositiveSmallIntegerField(default=0)
+    progress_message = models.CharField(max_length=255, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=3)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, blank=True)
+    # воркер отмечается здесь, пока выполняет задачу; давно не отмечался — считается умершим
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "run_after"]),
+        ]
+
+    def __str__(self):
+        return f"#{self.pk} {self.kind} ({self.get_status_display()})"
+
+
+
+
+class Broadcast(models.Model):
+    AUDIENCE_NOT_STARTED = "not_started"
+    AUDIENCE_UNFINISHED = "unfinished"
+    AUDIENCE_NOT_FINISHED = "not_finished"
+    AUDIENCE_ALL = "all"
+    AUDIENCES = [
+        (AUDIENCE_NOT_STARTED, "Не начинали опрос"),
+        (AUDIENCE_UNFINISHED, "Начали, но не закончили"),
+        (AUDIENCE_NOT_FINISHED, "Не закончили (в т.ч. не начинали)"),
+        (AUDIENCE_ALL, "Все"),
+    ]
+
+    STATUS_PENDING = "pending"
+    STATUS_RUNNING = "running"
+    STATUS_DONE = "done"
+    STATUS_CANCELLED = "cancelled"
+    STATUSES = [
+        (STATUS_PENDING, "В очереди"),
+        (STATUS_RUNNING, "Идёт рассылка"),
+        (STATUS_DONE, "Завершена"),
+        (STATUS_CANCELLED, "Остановлена"),
+    ]
+
+    text = models.TextField()
+    role = models.CharField(
+        max_length=10,
+        choices=[
+            ("parent", "Родитель"),
+            ("student", "Ученик"),
+        ],
+        null=True,
+        blank=True,
+        help_text="Пусто — всем ролям"
+    )
+    audience = models.CharField(max_length=20, choices=AUDIENCES, default=AUDIENCE_NOT_FINISHED)
+    require_consent = models.BooleanField(
+        default=True,
+        verbose_name="Только давшим согласие на обработку данных"
+    )
+
+    status = models.CharField(max_length=10, choices=STATUSES, default=STATUS_PENDING)
+    # id последнего обработанного пользователя: после падения рассылка продолжается с него
+    last_user_id = models.BigIntegerField(default=0)
+    sent = models.PositiveIntegerField(default=0)
+    failed = models.PositiveIntegerField(default=0)
+    blocked = models.PositiveIntegerField(default=0)
+    locked_by = models.CharField(max_length=100, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Рассылка #{self.pk} ({self.get_status_display()})"
+
+
+
+
+class QuestionStat(models.Model):
+    """Предрасчитанная статистика по вопросу: распределение вариантов или оценки по утверждению шкалы."""
+    KIND_OPTION = "option"
+    KIND_SCALE = "scale"
+    KIND_CHOICES = [
+        (KIND_OPTION, "Вариант ответа"),
+        (KIND_SCALE, "Утверждение шкалы"),
+    ]
+
+    role = models.CharField(max_length=10)
+    poll = models.ForeignKey(
+        Poll,
+        on_delete=models.CASCADE,
+        related_name='stats'
+    )
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    option_index = models.PositiveSmallIntegerField(null=True, blank=True)
+    option_key = models.CharField(max_length=20, blank=True, default="")
+    label = models.CharField(max_length=255, blank=True)
+    # статистика только по респондентам, прошедшим анкету до конца
+    finished_only = models.BooleanField(default=False)
+
+    answers = models.PositiveIntegerField(default=0)
+    # сколько респондентов ответили на вопрос — знаменатель доли
+    respondents = models.PositiveIntegerField(default=0)
+    share = models.FloatField(null=True, blank=True)
+
+    mean = models.FloatField(null=True, blank=True)
+    median = models.FloatField(null=True, blank=True)
+    p25 = models.FloatField(null=True, blank=True)
+    p75 = models.FloatField(null=True, blank=True)
+    p90 = models.FloatField(null=True, blank=True)
+    minimum = models.PositiveSmallIntegerField(null=True, blank=True)
+    maximum = models.PositiveSmallIntegerField(null=True, blank=True)
+
+    computed_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["role", "finished_only", "poll"]),
+        ]
+        permissions = [("refresh_questionstat", "Может пересчитывать статистику")]
+
+    def __str__(self):
+        return f"{self.poll_id} {self.option_key or self.option_index}: {self.answers}"
+
+
+
+
+class FunnelStat(models.Model):
+    """Воронка анкеты: сколько сессий дошли до вопроса ``step`` и сколько ответили на него."""
+    role = models.CharField(max_length=10)
+    step = models.PositiveSmallIntegerField()
+    poll = models.ForeignKey(
+        Poll,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='funnel_stats'
+    )
+    reached = models.PositiveIntegerField(default=0)
+    answered = models.PositiveIntegerField(default=0)
+    finished_only = models.BooleanField(default=False)
+    computed_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ["role", "finished_only", "step"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["role", "finished_only", "step"],
+                name="polls_funnel_role_finished_step",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.role} #{self.step}: {self.answered}/{self.reached}"
+
+
+
+class Report(models.Model):
+    """Готовый AI-отчёт: текст, DOCX и метрики генерации. Повторная выдача не вызывает модель."""
+    role = models.CharField(max_length=10, default="parent")
+    # ключ входных данных (промпты, модель, ответы, статистика): одинаковый ключ — тот же отчёт
+    cache_key = models.CharField(max_length=100, db_index=True)
+    text = models.TextField()
+    docx = models.FileField(upload_to="reports/%Y/%m/", blank=True)
+    # file_id загруженного в Telegram файла — повторная отправка без загрузки
+    telegram_file_id = models.CharField(max_length=255, blank=True)
+    watermark = models.JSONField(default=dict, blank=True)
+    model = models.CharField(max_length=100, blank=True)
+    finished_only = models.BooleanField(default=False)
+    requests = models.PositiveIntegerField(default=0)
+    prompt_tokens = models.PositiveIntegerField(default=0)
+    completion_tokens = models.PositiveIntegerField(default=0)
+    # секунды по этапам: statistics, summaries, reduce, docx, total
+    timings = models.JSONField(default=dict, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["-id"]
+
+    def __str__(self):
+        return f"Отчёт #{self.pk} от {timezone.localtime(self.created_at):%d.%m.%Y %H:%M}"
+
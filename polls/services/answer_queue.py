@@ -0,0 +1,152 @@
+import asyncio
+import logging
+from collections import namedtuple
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+
+from ..models import Answer
+from .db import run_db
+from .sessions import advance_session, finish_session
+
+
+logger = logging.getLogger(__name__)
+
+# Сдвиг сессии респондента после ответа: позиция и вопрос на ней;
+# position=None — только завершение анкеты
+SessionStep = namedtuple("SessionStep", ["user_id", "position", "poll_id", "finished"])
+
+
+def _apply_steps(steps):
+    for step in steps:
+        if step.position is not None:
+            advance_session(step.user_id, step.position, step.poll_id)
+        if step.finished:
+            finish_session(step.user_id)
+
+
+def _bulk_insert(batch):
+    """Ответы пачки и сдвиги сессий одной транзакцией: сессия не уходит вперёд несохранённых ответов."""
+    answers, steps = [], []
+    for item in batch:
+        if isinstance(item, SessionStep):
+            steps.append(item)
+            continue
+        user_id, poll_id, answer, fields = item
+        answers.append(Answer(user_id=user_id, poll_id=poll_id, answer=answer, **fields))
+    try:
+        with transaction.atomic():
+            Answer.objects.bulk_create(answers)
+            _apply_steps(steps)
+        return
+    except IntegrityError:
+        pass
+
+    # В пачке есть ответ на удалённый вопрос/пользователя — пишем по одному,
+    # чтобы одна битая строка не блокировала очередь
+    for answer in answers:
+        try:
+            with transaction.atomic():
+                answer.save()
+        except IntegrityError:
+            logger.warning(
+                "Ответ пропущен: user_id=%s poll_id=%s", answer.user_id, answer.poll_id
+            )
+    with transaction.atomic():
+        _apply_steps(steps)
+
+
+class AnswerQueue:
+    """
+    Копит ответы в памяти и пишет их в БД пачками из фоновой задачи.
+
+    Сдвиг позиции в SurveySession идёт через ту же очередь и пишется в одной
+    транзакции с ответами: если процесс упал до сброса, теряются и ответы,
+    и сдвиг, и продолженная анкета снова задаст эти вопросы. Пока сдвиг не
+    записан, текущую позицию респондента отдаёт ``position``.
+    Пачка пишется одной транзакцией; если запись упала, ответы возвращаются
+    в начало очереди и будут записаны при следующем сбросе.
+    """
+
+    def __init__(self, batch_size=200, flush_interval=1.0):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._pending = []  # (user_id, poll_id, answer, fields) | SessionStep
+        self._steps = {}  # user_id -> последний ещё не записанный сдвиг
+        self._wakeup = asyncio.Event()
+        self._lock = asyncio.Lock()
+        self._task = None
+        self._closing = False
+
+    def put(self, user_id, poll_id, answer, **fields):
+        """``fields`` — структурированные поля ответа: option_index, option_key, score, text."""
+        self._append((user_id, poll_id, answer, fields))
+
+    def advance(self, user_id, position, poll_id):
+        """Позиция сессии после ответа; записывается вместе с ответами, поставленными раньше."""
+        step = SessionStep(user_id, position, poll_id, False)
+        self._steps[user_id] = step
+        self._append(step)
+
+    def position(self, user_id):
+        """Позиция из ещё не записанного сдвига или None — позиция в БД актуальна."""
+        step = self._steps.get(user_id)
+        return step.position if step else None
+
+    def finish(self, user_id):
+        self._append(SessionStep(user_id, None, None, True))
+
+    def _append(self, item):
+        self._pending.append(item)
+        if len(self._pending) >= self.batch_size:
+            self._wakeup.set()
+
+    def __len__(self):
+        return len(self._pending)
+
+    async def flush(self):
+        async with self._lock:
+            while self._pending:
+                batch = self._pending[:self.batch_size]
+                del self._pending[:self.batch_size]
+                try:
+                    await run_db(_bulk_insert, batch)
+                except Exception:
+                    self._pending[:0] = batch
+                    raise
+                for item in batch:
+                    # более поздний сдвиг того же респондента ещё ждёт записи
+                    if isinstance(item, SessionStep) and self._steps.get(item.user_id) is item:
+                        del self._steps[item.user_id]
+
+    async def _run(self):
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Не удалось записать %s ответов, повторим позже", len(self))
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        self._closing = True
+        self._wakeup.set()
+        if self._task is not None:
+            await self._task
+            self._task = None
+        await self.flush()
+        self._closing = False
+
+
+answer_queue = AnswerQueue(
+    batch_size=getattr(settings, "ANSWER_BATCH_SIZE", 200),
+    flush_interval=getattr(settings, "ANSWER_FLUSH_INTERVAL", 1.0),
+)
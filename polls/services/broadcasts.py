@@ -0,0 +1,200 @@
+import asyncio
+import logging
+from datetime import timedelta
+
+from aiogram.exceptions import TelegramForbiddenError
+from django.db.models import F
+from django.utils import timezone
+
+from ..models import Broadcast, SurveySession, User
+from .db import run_db
+from .send_scheduler import BULK, send_priority
+
+
+logger = logging.getLogger(__name__)
+
+
+def audience(broadcast):
+    """Получатели рассылки; все фильтры идут по индексам User(role, consent, id) и SurveySession(user)."""
+    users = User.objects.all()
+    if broadcast.role:
+        users = users.filter(role=broadcast.role)
+    if broadcast.require_consent:
+        users = users.filter(consent_personal_data=True)
+
+    sessions = SurveySession.objects.values("user_id")
+    if broadcast.audience == Broadcast.AUDIENCE_NOT_STARTED:
+        users = users.exclude(id__in=sessions)
+    elif broadcast.audience == Broadcast.AUDIENCE_UNFINISHED:
+        users = users.filter(id__in=sessions.filter(finished_at__isnull=True))
+    elif broadcast.audience == Broadcast.AUDIENCE_NOT_FINISHED:
+        users = users.exclude(id__in=sessions.filter(finished_at__isnull=False))
+
+    return users
+
+
+def next_batch(broadcast, size):
+    return list(
+        audience(broadcast)
+        .filter(id__gt=broadcast.last_user_id)
+        .order_by("id")
+        .values_list("id", "tg_id")[:size]
+    )
+
+
+def claim_broadcast(worker_id, stale_after):
+    """Берёт рассылку в работу; брошенную упавшим процессом продолжает с контрольной точки."""
+    now = timezone.now()
+    Broadcast.objects.filter(
+        status=Broadcast.STATUS_RUNNING,
+        updated_at__lt=now - timedelta(seconds=stale_after),
+    ).update(status=Broadcast.STATUS_PENDING, locked_by="")
+
+    broadcast_id = (
+        Broadcast.objects
+        .filter(status=Broadcast.STATUS_PENDING)
+        .order_by("id")
+        .values_list("id", flat=True)
+        .first()
+    )
+    if broadcast_id is None:
+        return None
+
+    claimed = Broadcast.objects.filter(
+        id=broadcast_id, status=Broadcast.STATUS_PENDING
+    ).update(status=Broadcast.STATUS_RUNNING, locked_by=worker_id, updated_at=now)
+    if not claimed:
+        return None
+
+    Broadcast.objects.filter(id=broadcast_id, started_at__isnull=True).update(started_at=now)
+    return Broadcast.objects.get(id=broadcast_id)
+
+
+def _claimed(broadcast):
+    # строка рассылки, пока её держит этот процесс
+    return Broadcast.objects.filter(id=broadcast.id, locked_by=broadcast.locked_by)
+
+
+def save_checkpoint(broadcast, last_user_id, sent, failed, blocked):
+    """Сохраняет контрольную точку; False — рассылку забрал другой процесс."""
+    broadcast.last_user_id = last_user_id
+    return bool(_claimed(broadcast).update(
+        last_user_id=last_user_id,
+        sent=F("sent") + sent,
+        failed=F("failed") + failed,
+        blocked=F("blocked") + blocked,
+        updated_at=timezone.now(),
+    ))
+
+
+def touch_broadcast(broadcast):
+    # пачка может долго ждать в планировщике за ответами респондентам —
+    # отмечаемся, чтобы другой процесс не счёл рассылку брошенной
+    _claimed(broadcast).filter(status=Broadcast.STATUS_RUNNING).update(updated_at=timezone.now())
+
+
+def release_broadcast(broadcast):
+    """Возвращает рассылку в очередь при остановке процесса: после рестарта она продолжится сразу."""
+    _claimed(broadcast).filter(status=Broadcast.STATUS_RUNNING).update(
+        status=Broadcast.STATUS_PENDING,
+        locked_by="",
+        updated_at=timezone.now(),
+    )
+
+
+def finish_broadcast(broadcast):
+    Broadcast.objects.filter(id=broadcast.id, status=Broadcast.STATUS_RUNNING).update(
+        status=Broadcast.STATUS_DONE,
+        locked_by="",
+        finished_at=timezone.now(),
+    )
+
+
+def is_cancelled(broadcast):
+    return Broadcast.objects.filter(
+        id=broadcast.id, status=Broadcast.STATUS_CANCELLED
+    ).exists()
+
+
+async def _deliver(send, chat_id, text):
+    try:
+        await send(chat_id, text)
+        return "sent"
+    except TelegramForbiddenError:
+        return "blocked"
+    except Exception:
+        logger.exception("Рассылка: не удалось отправить %s", chat_id)
+        return "failed"
+
+
+async def _keep_claim(broadcast, interval):
+    while True:
+        await asyncio.sleep(interval)
+        await run_db(touch_broadcast, broadcast)
+
+
+async def run_broadcast(broadcast, send, batch_size=100, heartbeat=100):
+    """
+    Рассылает ``broadcast`` пачками по ``batch_size``, сохраняя контрольную точку после каждой.
+
+    ``send(chat_id, text)`` — корутина отправки; сообщения идут в низкоприоритетной
+    полосе планировщика и не задерживают ответы респондентам. Пока рассылка
+    идёт, её ``updated_at`` обновляется раз в ``heartbeat`` секунд; при отмене
+    задачи (остановка бота) рассылка возвращается в очередь.
+    """
+    token = send_priority.set(BULK)
+    keepalive = asyncio.create_task(_keep_claim(broadcast, heartbeat))
+    try:
+        while True:
+            if await run_db(is_cancelled, broadcast):
+                return
+
+            batch = await run_db(next_batch, broadcast, batch_size)
+            if not batch:
+                await run_db(finish_broadcast, broadcast)
+                return
+
+            results = await asyncio.gather(
+                *(_deliver(send, tg_id, broadcast.text) for _, tg_id in batch)
+            )
+            saved = await run_db(
+                save_checkpoint,
+                broadcast,
+                last_user_id=batch[-1][0],
+                sent=results.count("sent"),
+                failed=results.count("failed"),
+                blocked=results.count("blocked"),
+            )
+            if not saved:
+                logger.warning("%s продолжает другой процесс", broadcast)
+                return
+    except asyncio.CancelledError:
+        # прерванная пачка будет отправлена заново с последней контрольной точки
+        await run_db(release_broadcast, broadcast)
+        raise
+    finally:
+        keepalive.cancel()
+        send_priority.reset(token)
+
+
+async def broadcast_loop(send, worker_id, poll_interval=10, batch_size=100, stale_after=300):
+    """
+    Берёт рассылки из очереди и выполняет их по одной.
+
+    Рассылка, которая не отмечалась ``stale_after`` секунд, считается
+    брошенной упавшим процессом и достаётся следующему.
+    """
+    while True:
+        try:
+            broadcast = await run_db(claim_broadcast, worker_id, stale_after)
+            if broadcast is None:
+                await asyncio.sleep(poll_interval)
+                continue
+
+            logger.info("Старт %s", broadcast)
+            await run_broadcast(broadcast, send, batch_size, heartbeat=stale_after / 3)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Ошибка цикла рассылок")
+            await asyncio.sleep(poll_interval)
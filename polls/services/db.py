@@ -0,0 +1,88 @@
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connections
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _pool_size():
+    return getattr(settings, "BOT_DB_POOL_SIZE", 8)
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=_pool_size(),
+                thread_name_prefix="bot-db",
+            )
+        return _executor
+
+
+def _close_old_connections():
+    # Потоки пула живут всё время работы бота, а сигналы request_started и
+    # request_finished, по которым Django закрывает старые соединения между
+    # HTTP-запросами, здесь не приходят. Поэтому то же делаем перед каждой
+    # задачей: соединение старше CONN_MAX_AGE или сломанное закрывается, и
+    # задача открывает новое (с CONN_HEALTH_CHECKS — проверенное).
+    for conn in connections.all(initialized_only=True):
+        # внутри транзакции закрывать нельзя (TestCase выполняет задачи в ней)
+        if not conn.in_atomic_block:
+            conn.close_if_unusable_or_obsolete()
+
+
+def _call(func, args, kwargs):
+    # Между задачами соединение потока остаётся открытым: переподключение на
+    # каждый запрос съедает весь выигрыш от параллельности. Срок жизни
+    # соединения задаёт CONN_MAX_AGE.
+    _close_old_connections()
+    return func(*args, **kwargs)
+
+async def run_db(func, *args, **kwargs):
+    """
+    Выполняет синхронный ORM-код в пуле потоков бота.
+
+    В отличие от ``sync_to_async`` (и ``aget``/``acreate`` Django, которые
+    работают через него) запросы разных респондентов не выстраиваются
+    в очередь к одному потоку: одновременно идут до ``BOT_DB_POOL_SIZE``.
+    Всё, что должно выполниться в одной транзакции, передавайте одной функцией.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        get_executor(), functools.partial(_call, func, args, kwargs)
+    )
+
+
+def db_task(func):
+    """Асинхронная обёртка над ``func``, выполняемая через ``run_db``."""
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        return await run_db(func, *args, **kwargs)
+    return wrapper
+
+
+def _close_in_worker(barrier):
+    # барьер гарантирует, что каждая задача попадёт в свой поток пула
+    barrier.wait(timeout=10)
+    connections.close_all()
+
+
+def shutdown():
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is None:
+        return
+
+    workers = _pool_size()
+    barrier = threading.Barrier(workers)
+    for _ in range(workers):
+        executor.submit(_close_in_worker, barrier)
+    executor.shutdown(wait=True)
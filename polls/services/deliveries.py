@@ -0,0 +1,78 @@
+from collections import OrderedDict, namedtuple
+
+from django.conf import settings
+from django.utils import timezone
+
+from ..models import PollDelivery
+from .db import run_db
+
+
+Delivery = namedtuple("Delivery", ["user_id", "poll_id"])
+
+
+class DeliveryLRU:
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+
+    def get(self, telegram_poll_id):
+        delivery = self._items.get(telegram_poll_id)
+        if delivery is not None:
+            self._items.move_to_end(telegram_poll_id)
+        return delivery
+
+    def put(self, telegram_poll_id, delivery):
+        self._items[telegram_poll_id] = delivery
+        self._items.move_to_end(telegram_poll_id)
+        while len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
+
+    def __len__(self):
+        return len(self._items)
+
+
+_lru = DeliveryLRU(getattr(settings, "POLL_DELIVERY_CACHE_SIZE", 50_000))
+
+
+async def record_delivery(telegram_poll_id, user_id, poll_id):
+    """Запоминает, какому пользователю и какой вопрос ушёл Telegram-опросом."""
+    _lru.put(telegram_poll_id, Delivery(user_id, poll_id))
+    await run_db(
+        PollDelivery.objects.create,
+        telegram_poll_id=telegram_poll_id,
+        user_id=user_id,
+        poll_id=poll_id,
+    )
+
+
+async def resolve_delivery(telegram_poll_id):
+    delivery = _lru.get(telegram_poll_id)
+    if delivery is not None:
+        return delivery
+
+    row = await run_db(
+        PollDelivery.objects
+        .filter(telegram_poll_id=telegram_poll_id)
+        .values_list("user_id", "poll_id")
+        .first
+    )
+    if row is None:
+        return None
+
+    delivery = Delivery(*row)
+    _lru.put(telegram_poll_id, delivery)
+    return delivery
+
+
+def _claim(telegram_poll_id):
+    return PollDelivery.objects.filter(
+        telegram_poll_id=telegram_poll_id, answered_at__isnull=True
+    ).update(answered_at=timezone.now()) == 1
+
+
+async def claim_delivery(telegram_poll_id):
+    """
+    Отмечает опрос отвеченным. True только для первого голоса: если голос
+    отозвали и отдали заново, ответ уже записан и повторно не принимается.
+    """
+    return await run_db(_claim, telegram_poll_id)
@@ -0,0 +1,308 @@
+import csv
+import datetime
+from collections import Counter, namedtuple
+from itertools import islice
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils import timezone
+
+from ..models import ANSWER_FULL_TEXT, Answer, Poll
+
+
+FORMATS = ("csv", "xlsx", "parquet")
+LAYOUTS = ("long", "wide")
+
+# Таблица выгрузки: имена и типы колонок (int | str | datetime) и поток строк
+Export = namedtuple("Export", ["columns", "types", "rows"])
+
+# первые колонки широкой таблицы — о респонденте
+WIDE_HEAD = ["tg_id", "full_name", "role"]
+
+LONG_COLUMNS = [
+    ("answer_id", "int"),
+    ("created_at", "datetime"),
+    ("user_id", "int"),
+    ("tg_id", "int"),
+    ("full_name", "str"),
+    ("role", "str"),
+    ("poll_id", "int"),
+    ("poll_order", "int"),
+    ("question_type", "str"),
+    ("question", "str"),
+    ("option_index", "int"),
+    ("option_key", "str"),
+    ("score", "int"),
+    ("answer", "str"),
+]
+
+
+def answers_queryset(role=None, answer_ids=None, poll_id=None, tg_id=None, search=""):
+    """
+    Ответы для выгрузки.
+
+    ``answer_ids`` — строки, отмеченные в админке; ``poll_id``, ``tg_id`` и
+    ``search`` повторяют фильтры и поиск списка ответов, когда выбраны все строки.
+    """
+    answers = Answer.objects.all()
+    if role:
+        answers = answers.filter(user__role=role)
+    if answer_ids is not None:
+        answers = answers.filter(id__in=answer_ids)
+    if poll_id is not None:
+        answers = answers.filter(poll_id=poll_id)
+    if tg_id is not None:
+        answers = answers.filter(user__tg_id=tg_id)
+    for term in search.split():
+        answers = answers.filter(answer__icontains=term)
+    return answers
+
+
+# ======================================================
+# РАСКЛАДКИ
+# ======================================================
+
+def long_export(answers, chunk_size=2000):
+    """Строка на каждый ответ; ответы читаются курсором пачками по ``chunk_size``."""
+    rows = (
+        answers
+        .order_by("user_id", "id")
+        .annotate(full_answer=ANSWER_FULL_TEXT)
+        .values_list(
+            "id",
+            "created_at",
+            "user_id",
+            "user__tg_id",
+            "user__full_name",
+            "user__role",
+            "poll_id",
+            "poll__order",
+            "poll__question_type",
+            "poll__question",
+            "option_index",
+            "option_key",
+            "score",
+            "full_answer",
+        )
+        .iterator(chunk_size=chunk_size)
+    )
+    return Export(
+        columns=[name for name, _ in LONG_COLUMNS],
+        types=[kind for _, kind in LONG_COLUMNS],
+        rows=rows,
+    )
+
+
+def _wide_columns(answers):
+    """Колонки широкой таблицы: вопрос, а для scale_group — каждое утверждение отдельно."""
+    polls = (
+        Poll.objects
+        .filter(id__in=answers.order_by().values("poll_id"))
+        .order_by("role", "order", "id")
+    )
+    answered_keys = {}
+    for poll_id, key in (
+        answers
+        .filter(poll__question_type="scale_group")
+        .exclude(option_key="")
+        .order_by()
+        .values_list("poll_id", "option_key")
+        .distinct()
+    ):
+        answered_keys.setdefault(poll_id, set()).add(key)
+
+    columns = []
+    for poll in polls:
+        if poll.question_type != "scale_group":
+            columns.append(((poll.id, ""), poll.question, "str"))
+            continue
+        keys = list(poll.options_by_key)
+        keys += sorted(answered_keys.get(poll.id, set()) - set(keys))
+        for key in keys:
+            statement = poll.options_by_key.get(key) or ""
+            columns.append(((poll.id, key), f"{poll.question} [{key}) {statement}]", "int"))
+
+    # Одинаковые формулировки (например, один вопрос родителям и ученикам) дали бы
+    # одноимённые колонки, а такой Parquet не читается — различаем их по id вопроса
+    counts = Counter(title for _, title, _ in columns)
+    counts.update(WIDE_HEAD)
+    return [
+        (key, f"{title} (вопрос #{key[0]})" if counts[title] > 1 else title, kind)
+        for key, title, kind in columns
+    ]
+
+
+def wide_export(answers, chunk_size=2000):
+    """Строка на респондента, колонка на вопрос; в памяти только ответы текущего респондента."""
+    columns = _wide_columns(answers)
+    position = {key: i for i, (key, _, _) in enumerate(columns)}
+
+    def rows():
+        current_user, head, cells = None, None, None
+        for user_id, tg_id, full_name, role, poll_id, question_type, key, score, text in (
+            answers
+            .order_by("user_id", "id")
+            .annotate(full_answer=ANSWER_FULL_TEXT)
+            .values_list(
+                "user_id",
+                "user__tg_id",
+                "user__full_name",
+                "user__role",
+                "poll_id",
+                "poll__question_type",
+                "option_key",
+                "score",
+                "full_answer",
+            )
+            .iterator(chunk_size=chunk_size)
+        ):
+            if user_id != current_user:
+                if current_user is not None:
+                    yield head + cells
+                current_user = user_id
+                head = [tg_id, full_name, role]
+                cells = [None] * len(columns)
+
+            if question_type == "scale_group":
+                index = position.get((poll_id, key))
+                if index is not None:
+                    cells[index] = score
+                continue
+
+            index = position[(poll_id, "")]
+            # multi_choice: несколько вариантов в одной ячейке
+            cells[index] = text if cells[index] is None else f"{cells[index]}; {text}"
+
+        if current_user is not None:
+            yield head + cells
+
+    return Export(
+        columns=WIDE_HEAD + [title for _, title, _ in columns],
+        types=["int", "str", "str"] + [kind for _, _, kind in columns],
+        rows=rows(),
+    )
+
+
+def build_export(layout, answers):
+    if layout == "long":
+        return long_export(answers)
+    if layout == "wide":
+        return wide_export(answers)
+    raise ValueError(f"Неизвестная раскладка: {layout}")
+
+
+# ======================================================
+# ФОРМАТЫ
+# ======================================================
+
+def _csv_value(value):
+    if isinstance(value, datetime.datetime):
+        return timezone.localtime(value).isoformat(sep=" ", timespec="seconds")
+    return value
+
+
+def write_csv(export, stream):
+    # BOM, чтобы Excel открыл кириллицу без мастера импорта
+    stream.write("\ufeff")
+    writer = csv.writer(stream)
+    writer.writerow(export.columns)
+
+    rows = 0
+    for row in export.rows:
+        writer.writerow([_csv_value(value) for value in row])
+        rows += 1
+    return rows
+
+
+def write_xlsx(export, path):
+    try:
+        from openpyxl import Workbook
+    except ImportError as e:
+        raise ImproperlyConfigured("Выгрузка в XLSX требует установленного пакета openpyxl") from e
+
+    # write-only: строки сразу уходят во временный файл, а не копятся в памяти
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("Ответы")
+    sheet.append(export.columns)
+
+    rows = 0
+    for row in export.rows:
+        sheet.append([_xlsx_value(value) for value in row])
+        rows += 1
+    workbook.save(path)
+    return rows
+
+
+def _xlsx_value(value):
+    if isinstance(value, datetime.datetime):
+        # Excel не хранит часовой пояс
+        return timezone.localtime(value).replace(tzinfo=None)
+    if isinstance(value, str) and len(value) > 32767:
+        return value[:32767]
+    return value
+
+
+def write_parquet(export, path, batch_size=10_000):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise ImproperlyConfigured("Выгрузка в Parquet требует установленного пакета pyarrow") from e
+
+    arrow_types = {"int": pa.int64(), "str": pa.string(), "datetime": pa.timestamp("us", tz="UTC")}
+    schema = pa.schema([
+        (name, arrow_types[kind]) for name, kind in zip(export.columns, export.types)
+    ])
+
+    rows = 0
+    with pq.ParquetWriter(path, schema) as writer:
+        while True:
+            batch = list(islice(export.rows, batch_size))
+            if not batch:
+                break
+            columns = [
+                pa.array(values, type=field.type)
+                for values, field in zip(zip(*batch), schema)
+            ]
+            writer.write_batch(pa.RecordBatch.from_arrays(columns, schema=schema))
+            rows += len(batch)
+    return rows
+
+
+def export_path(fmt, layout, role=None):
+    root = settings.EXPORT_ROOT
+    root.mkdir(parents=True, exist_ok=True)
+    stamp = timezone.localtime().strftime("%Y%m%d-%H%M%S")
+    return root / f"answers-{role or 'all'}-{layout}-{stamp}.{fmt}"
+
+
+def export_answers(fmt, layout, path, role=None, selection=None):
+    """
+    Пишет выгрузку в файл ``path``; возвращает число строк данных.
+
+    ``selection`` — дополнительные аргументы ``answers_queryset`` (выбор в админке).
+
+    Файл собирается под временным именем и переименовывается в конце,
+    поэтому по ``path`` никогда не лежит недописанная выгрузка.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Неизвестный формат: {fmt}")
+
+    path = Path(path)
+    partial = path.with_name(path.name + ".part")
+    export = build_export(layout, answers_queryset(role, **(selection or {})))
+    try:
+        if fmt == "xlsx":
+            rows = write_xlsx(export, partial)
+        elif fmt == "parquet":
+            rows = write_parquet(export, partial)
+        else:
+            with open(partial, "w", encoding="utf-8", newline="") as stream:
+                rows = write_csv(export, stream)
+    except BaseException:
+        partial.unlink(missing_ok=True)
+        raise
+
+    partial.replace(path)
+    return rows
@@ -0,0 +1,175 @@
+import time
+from copy import deepcopy
+from datetime import timedelta
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.utils import timezone
+
+from ..models import BotState
+from .db import run_db
+
+
+def _state_name(state):
+    return state.state if isinstance(state, State) else state
+
+
+# ======================================================
+# MEMORY (TTL)
+# ======================================================
+
+class TTLMemoryStorage(BaseStorage):
+    """In-memory хранилище FSM, которое забывает неактивные ключи через ``ttl`` секунд."""
+
+    def __init__(self, ttl=None, sweep_interval=60):
+        self.ttl = ttl
+        self.sweep_interval = sweep_interval
+        self._records = {}  # key -> [state, data, touched_at]
+        self._next_sweep = time.monotonic() + sweep_interval
+
+    def _record(self, key):
+        now = time.monotonic()
+        if self.ttl and now >= self._next_sweep:
+            self._sweep(now)
+
+        record = self._records.get(key)
+        if record is None:
+            record = self._records[key] = [None, {}, now]
+        elif self.ttl and now - record[2] > self.ttl:
+            record[0], record[1] = None, {}
+        record[2] = now
+        return record
+
+    def _sweep(self, now):
+        expired = [key for key, record in self._records.items() if now - record[2] > self.ttl]
+        for key in expired:
+            del self._records[key]
+        self._next_sweep = now + self.sweep_interval
+
+    async def set_state(self, key, state=None):
+        self._record(key)[0] = _state_name(state)
+
+    async def get_state(self, key):
+        return self._record(key)[0]
+
+    async def set_data(self, key, data):
+        self._record(key)[1] = deepcopy(dict(data))
+
+    async def get_data(self, key):
+        return deepcopy(self._record(key)[1])
+
+    async def close(self):
+        self._records.clear()
+
+
+# ======================================================
+# DATABASE (Django ORM)
+# ======================================================
+
+class DjangoStorage(BaseStorage):
+    """
+    Хранилище FSM в таблице ``BotState``: переживает рестарт и общее для всех процессов бота.
+
+    Раз в ``sweep_interval`` секунд запись удаляет строки, не обновлявшиеся
+    дольше ``ttl``: при чтении они и так считаются пустыми, но иначе копятся.
+    """
+
+    def __init__(self, ttl=None, sweep_interval=300):
+        self.ttl = ttl
+        self.sweep_interval = sweep_interval
+        self.key_builder = DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+        self._next_sweep = time.monotonic() + sweep_interval
+
+    def _deadline(self):
+        return timezone.now() - timedelta(seconds=self.ttl)
+
+    def _load(self, key):
+        row = (
+            BotState.objects
+            .filter(key=self.key_builder.build(key))
+            .values_list("state", "data", "updated_at")
+            .first()
+        )
+        if row is None:
+            return None, {}
+        state, data, updated_at = row
+        if self.ttl and updated_at < self._deadline():
+            return None, {}
+        return state, data or {}
+
+    def _save(self, key, **fields):
+        db_key = self.key_builder.build(key)
+        rows = BotState.objects.filter(key=db_key)
+        with transaction.atomic():
+            if self.ttl:
+                # просроченная строка удаляется, иначе её второе поле ожило бы вместе с новым
+                rows.filter(updated_at__lt=self._deadline()).delete()
+            # Пишется только изменённое поле: set_state и set_data из разных
+            # процессов не затирают друг друга прочитанными ранее значениями
+            BotState.objects.update_or_create(key=db_key, defaults=fields)
+            if not any(fields.values()):
+                # Пустые записи не храним, чтобы таблица не росла от завершённых сессий
+                rows.filter(state__isnull=True, data={}).delete()
+
+        now = time.monotonic()
+        if self.ttl and now >= self._next_sweep:
+            self._next_sweep = now + self.sweep_interval
+            self.purge_expired()
+
+    def purge_expired(self):
+        """Удаляет все состояния, не обновлявшиеся дольше ``ttl``; возвращает их число."""
+        if not self.ttl:
+            return 0
+        deleted, _ = BotState.objects.filter(updated_at__lt=self._deadline()).delete()
+        return deleted
+
+    async def set_state(self, key, state=None):
+        await run_db(self._save, key, state=_state_name(state))
+
+    async def get_state(self, key):
+        state, _ = await run_db(self._load, key)
+        return state
+
+    async def set_data(self, key, data):
+        await run_db(self._save, key, data=dict(data))
+
+    async def get_data(self, key):
+        _, data = await run_db(self._load, key)
+        return data
+
+    async def close(self):
+        pass
+
+
+# ======================================================
+# FACTORY
+# ======================================================
+
+def build_fsm_storage():
+    backend = getattr(settings, "BOT_FSM_STORAGE", "memory")
+    ttl = getattr(settings, "BOT_FSM_TTL", None)
+
+    if backend == "memory":
+        return TTLMemoryStorage(ttl=ttl)
+
+    if backend == "db":
+        return DjangoStorage(ttl=ttl)
+
+    if backend == "redis":
+        try:
+            from aiogram.fsm.storage.redis import RedisStorage
+        except ImportError as e:
+            raise ImproperlyConfigured(
+                "BOT_FSM_STORAGE=redis требует установленного пакета redis"
+            ) from e
+        return RedisStorage.from_url(
+            settings.BOT_FSM_REDIS_URL,
+            key_builder=DefaultKeyBuilder(with_bot_id=True, with_destiny=True),
+            state_ttl=ttl,
+            data_ttl=ttl,
+        )
+
+    raise ImproperlyConfigured(f"Неизвестный BOT_FSM_STORAGE: {backend}")
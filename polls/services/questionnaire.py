@@ -0,0 +1,147 @@
+import hashlib
+import json
+import threading
+import time
+from dataclasses import dataclass
+from types import MappingProxyType
+
+from django.conf import settings
+
+from ..models import Poll
+from .db import run_db
+
+
+@dataclass(frozen=True, slots=True)
+class Question:
+    id: int
+    question: str
+    question_type: str
+    options: tuple
+
+
+@dataclass(frozen=True, slots=True)
+class Questionnaire:
+    role: str
+    version: str
+    questions: tuple
+    positions: MappingProxyType  # poll_id -> index
+    loaded_at: float
+
+    def __len__(self):
+        return len(self.questions)
+
+    def at(self, index):
+        if 0 <= index < len(self.questions):
+            return self.questions[index]
+        return None
+
+    def get(self, poll_id):
+        index = self.positions.get(poll_id)
+        if index is None:
+            return None
+        return self.questions[index]
+
+
+_lock = threading.Lock()
+_cache = {}      # role -> Questionnaire
+_generation = 0  # bumped on every Poll change in this process
+
+
+def _freeze_options(options):
+    if not options:
+        return ()
+    return tuple(
+        MappingProxyType(dict(opt)) if isinstance(opt, dict) else opt
+        for opt in options
+    )
+
+
+def _load(role):
+    rows = list(
+        Poll.objects
+        .filter(role=role, is_active=True)
+        .order_by("order", "id")
+        .values_list("id", "question", "question_type", "options")
+    )
+    questions = tuple(
+        Question(
+            id=poll_id,
+            question=question,
+            question_type=question_type,
+            options=_freeze_options(options),
+        )
+        for poll_id, question, question_type, options in rows
+    )
+
+    # Версия зависит только от содержимого, поэтому совпадает во всех процессах
+    digest = hashlib.sha1(
+        json.dumps(rows, ensure_ascii=False, sort_keys=True).encode("utf-8")
+    ).hexdigest()[:12]
+
+    return Questionnaire(
+        role=role,
+        version=digest,
+        questions=questions,
+        positions=MappingProxyType({q.id: i for i, q in enumerate(questions)}),
+        loaded_at=time.monotonic(),
+    )
+
+
+def _cached(role):
+    ttl = getattr(settings, "QUESTIONNAIRE_CACHE_TTL", 60)
+    cached = _cache.get(role)
+    if cached is not None and time.monotonic() - cached.loaded_at < ttl:
+        return cached
+    return None
+
+
+def get_questionnaire(role):
+    """Активные вопросы роли в порядке показа, без обращения к БД при попадании в кэш."""
+    cached = _cached(role)
+    if cached is not None:
+        return cached
+
+    generation = _generation
+    questionnaire = _load(role)
+
+    with _lock:
+        # Если за время загрузки анкету успели изменить, не кладём устаревшую копию
+        if generation == _generation:
+            _cache[role] = questionnaire
+
+    return questionnaire
+
+
+async def aget_questionnaire(role):
+    cached = _cached(role)
+    if cached is not None:
+        return cached
+    return await run_db(get_questionnaire, role)
+
+
+async def aget_question(role, poll_id):
+    """Вопрос по id; снятые с публикации вопросы достаются из БД."""
+    question = (await aget_questionnaire(role)).get(poll_id)
+    if question is not None:
+        return question
+
+    poll = await run_db(Poll.objects.filter(id=poll_id).first)
+    if poll is None:
+        return None
+    return Question(
+        id=poll.id,
+        question=poll.question,
+        question_type=poll.question_type,
+        options=_freeze_options(poll.options),
+    )
+
+
+def invalidate(role=None):
+    global _generation
+    with _lock:
+        _generation += 1
+        if role is None:
+            _cache.clear()
+        else:
+            _cache.pop(role, None)
+
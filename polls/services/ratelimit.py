@@ -0,0 +1,31 @@
+import asyncio
+import time
+
+
+class TokenBucket:
+    """Асинхронный token bucket: в среднем ``rate`` операций в секунду, всплеск до ``capacity``."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    async def acquire(self):
+        async with self._lock:
+            self._refill()
+            if self._tokens < 1:
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+                self._refill()
+            self._tokens -= 1
+
+    def pause(self, seconds):
+        """Telegram ответил 429: до конца ``retry_after`` новых токенов не будет."""
+        self._tokens = min(self._tokens, 0) - seconds * self.rate
+        self._updated_at = time.monotonic()
@@ -0,0 +1,137 @@
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.files import File
+from django.utils import timezone
+
+from ..ai.docx import write_docx
+from ..ai.report import generate_parent_report, parent_report_inputs, parent_report_key
+from ..models import Answer, Report, User
+from .statistics import refresh_statistics, statistics_computed_at
+from .telegram import send_document_to_many
+
+
+DOCX_CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+
+
+def check_report_settings():
+    """Текст ошибки, если отчёт сформировать нельзя, иначе None."""
+    if not User.objects.filter(is_admin=True).exists():
+        return "❌ Нет пользователей с флагом is_admin"
+
+    if not getattr(settings, "BOT_TOKEN", None):
+        return "❌ BOT_TOKEN не задан в settings.py"
+
+    if not getattr(settings, "OPENAI_API_KEY", None):
+        return "❌ OPENAI_API_KEY не задан в settings.py"
+
+    return None
+
+
+def _statistics_outdated(watermark, finished_only):
+    """Таблицы статистики родителей не считались или посчитаны раньше последнего ответа."""
+    computed_at = statistics_computed_at("parent", finished_only)
+    if computed_at is None:
+        return True
+    # последний ответ водяного знака — по id, без сканирования ответов по времени
+    last_answer_at = (
+        Answer.objects
+        .filter(pk=watermark["max_id"])
+        .values_list("created_at", flat=True)
+        .first()
+    )
+    return last_answer_at is not None and last_answer_at > computed_at
+
+
+def get_parent_report(client=None, progress=lambda percent, message: None):
+    """
+    Отчёт по анкетам родителей из хранилища, а если ответы изменились — новый.
+
+    Возвращает (Report или None, создан ли новый отчёт). Сохранённый отчёт
+    с тем же ключом входных данных выдаётся без обращения к модели и без
+    повторной сборки DOCX. Статистика берётся из предрасчитанных таблиц
+    (задача ``statistics``); если они отстают от ответов, перед генерацией
+    они пересчитываются.
+    """
+    finished_only = getattr(settings, "AI_REPORT_FINISHED_ONLY", False)
+    started = time.perf_counter()
+    key = parent_report_key(finished_only)
+    watermark, cache_key = key
+
+    report = Report.objects.filter(role="parent", cache_key=cache_key).exclude(docx="").first()
+    if report is not None:
+        return report, False
+
+    if _statistics_outdated(watermark, finished_only):
+        # иначе новый отчёт построился бы по новым ответам, но старым (или пустым) таблицам
+        progress(5, "Пересчёт статистики")
+        refresh_statistics()
+        key = parent_report_key(finished_only)
+
+    inputs = parent_report_inputs(finished_only, key=key)
+    statistics_seconds = round(time.perf_counter() - started, 3)
+
+    progress(10, "Генерация AI-отчёта")
+    result = generate_parent_report(client, inputs=inputs)
+    if not result.text:
+        return None, False
+
+    progress(70, "Сборка DOCX")
+    report = Report(
+        role="parent",
+        cache_key=result.cache_key,
+        text=result.text,
+        watermark=result.watermark,
+        model=settings.AI_REPORT_MODEL,
+        finished_only=finished_only,
+        **result.usage,
+    )
+    stage = time.perf_counter()
+    # DOCX пишется во временный файл и оттуда копируется в хранилище
+    with tempfile.TemporaryFile() as report_docx:
+        write_docx(result.text, report_docx)
+        name = f"parent_report_{timezone.localtime():%Y%m%d_%H%M%S}.docx"
+        report.docx.save(name, File(report_docx), save=False)
+    report.timings = {
+        **result.timings,
+        "statistics": statistics_seconds,
+        "docx": round(time.perf_counter() - stage, 3),
+        "total": round(time.perf_counter() - started, 3),
+    }
+    report.save()
+    return report, True
+
+
+def deliver_parent_report(progress=lambda percent, message: None):
+    """Формирует AI-отчёт по анкетам родителей и отправляет его всем администраторам."""
+    report, created = get_parent_report(progress=progress)
+    if report is None:
+        return {"sent": 0, "errors": ["Нет анкет родителей для анализа"]}
+
+    progress(80, "Отправка администраторам")
+    admin_ids = list(User.objects.filter(is_admin=True).values_list("tg_id", flat=True))
+    caption = "AI-отчёт по анкетам родителей (Word)"
+
+    sent, errors, file_id = 0, [], ""
+    if report.telegram_file_id:
+        # файл уже лежит на серверах Telegram — отправляем по file_id без загрузки
+        sent, errors, file_id = send_document_to_many(admin_ids, report.telegram_file_id, caption)
+    if not sent:
+        with report.docx.open("rb") as report_docx:
+            sent, errors, file_id = send_document_to_many(
+                admin_ids,
+                ("parent_report.docx", report_docx, DOCX_CONTENT_TYPE),
+                caption=caption,
+            )
+
+    if file_id and file_id != report.telegram_file_id:
+        Report.objects.filter(pk=report.pk).update(telegram_file_id=file_id)
+
+    return {
+        "sent": sent,
+        "errors": errors,
+        "report_id": report.pk,
+        "reused": not created,
+        "report_chars": len(report.text),
+    }
@@ -0,0 +1,162 @@
+import asyncio
+import contextvars
+import logging
+import time
+from collections import Counter, deque
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramRetryAfter
+
+from .ratelimit import TokenBucket
+
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = 0  # ответы респонденту в диалоге
+BULK = 1         # рассылки и напоминания
+
+LANES = {INTERACTIVE: "interactive", BULK: "bulk"}
+
+# Рассылка выставляет BULK на время своей работы; всё остальное считается диалогом
+send_priority = contextvars.ContextVar("send_priority", default=INTERACTIVE)
+
+
+class SendScheduler:
+    """
+    Очередь исходящих запросов бота.
+
+    Общий token bucket держит темп не выше ``rate`` сообщений в секунду,
+    в каждый чат — не чаще ``chat_rate`` в секунду после всплеска из
+    ``chat_burst`` сообщений. Из готовых к отправке сначала уходят
+    интерактивные ответы, потом массовая рассылка.
+    """
+
+    def __init__(self, rate=30, chat_rate=1.0, chat_burst=3):
+        self.bucket = TokenBucket(rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self._lanes = {lane: deque() for lane in LANES}
+        self._chats = {}  # chat_id -> [tokens, updated_at]
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self.sent = Counter()
+        self.retry_after = Counter()
+        self.max_depth = Counter()
+
+    # ---------- per-chat pacing ----------
+
+    def _chat_wait(self, chat_id, now):
+        tokens, updated_at = self._chats.get(chat_id, (self.chat_burst, now))
+        tokens = min(self.chat_burst, tokens + (now - updated_at) * self.chat_rate)
+        return 0 if tokens >= 1 else (1 - tokens) / self.chat_rate
+
+    def _take_chat_token(self, chat_id, now):
+        tokens, updated_at = self._chats.get(chat_id, (self.chat_burst, now))
+        tokens = min(self.chat_burst, tokens + (now - updated_at) * self.chat_rate)
+        self._chats[chat_id] = [tokens - 1, now]
+
+    def _forget_idle_chats(self, now):
+        idle = [
+            chat_id for chat_id, (tokens, updated_at) in self._chats.items()
+            if tokens + (now - updated_at) * self.chat_rate >= self.chat_burst
+        ]
+        for chat_id in idle:
+            del self._chats[chat_id]
+
+    def pause_chat(self, chat_id, seconds):
+        self._chats[chat_id] = [-seconds * self.chat_rate, time.monotonic()]
+
+    # ---------- queue ----------
+
+    def _pick(self, now):
+        """Первый готовый запрос по приоритету; иначе (None, сколько ждать)."""
+        wait = None
+        for lane in LANES:
+            queue = self._lanes[lane]
+            for index, (chat_id, future) in enumerate(queue):
+                if future.cancelled():
+                    continue
+                chat_wait = self._chat_wait(chat_id, now)
+                if chat_wait == 0:
+                    del queue[index]
+                    return (lane, chat_id, future), None
+                wait = chat_wait if wait is None else min(wait, chat_wait)
+            # отменённые запросы (обработчик упал по таймауту) выкидываем
+            self._lanes[lane] = deque(item for item in queue if not item[1].cancelled())
+        return None, wait
+
+    async def _run(self):
+        last_cleanup = time.monotonic()
+        while True:
+            now = time.monotonic()
+            item, wait = self._pick(now)
+            if item is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            lane, chat_id, future = item
+            await self.bucket.acquire()
+            self._take_chat_token(chat_id, time.monotonic())
+            if not future.done():
+                future.set_result(None)
+                self.sent[LANES[lane]] += 1
+
+            if now - last_cleanup > 60:
+                self._forget_idle_chats(now)
+                last_cleanup = now
+
+    async def acquire(self, chat_id, priority=None):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+        lane = send_priority.get() if priority is None else priority
+        future = asyncio.get_running_loop().create_future()
+        self._lanes[lane].append((chat_id, future))
+        self.max_depth[LANES[lane]] = max(self.max_depth[LANES[lane]], len(self._lanes[lane]))
+        self._wakeup.set()
+        await future
+
+    def on_retry_after(self, chat_id, seconds):
+        self.retry_after[chat_id] += 1
+        self.pause_chat(chat_id, seconds)
+        self.bucket.pause(seconds)
+        logger.warning("429 от Telegram для чата %s, пауза %s с", chat_id, seconds)
+
+    def stats(self):
+        return {
+            "depth": {LANES[lane]: len(queue) for lane, queue in self._lanes.items()},
+            "max_depth": dict(self.max_depth),
+            "sent": dict(self.sent),
+            "retry_after": sum(self.retry_after.values()),
+        }
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+
+class SchedulerMiddleware(BaseRequestMiddleware):
+    """Пропускает все адресованные чату запросы бота через ``SendScheduler``."""
+
+    def __init__(self, scheduler, max_retries=3):
+        self.scheduler = scheduler
+        self.max_retries = max_retries
+
+    async def __call__(self, make_request, bot, method):
+        chat_id = getattr(method, "chat_id", None)
+        if chat_id is None:
+            return await make_request(bot, method)
+
+        for attempt in range(self.max_retries + 1):
+            await self.scheduler.acquire(chat_id)
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                self.scheduler.on_retry_after(chat_id, e.retry_after)
+                if attempt == self.max_retries:
+                    raise
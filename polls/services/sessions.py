@@ -0,0 +1,85 @@
+from django.db import transaction
+from django.utils import timezone
+
+from ..models import SurveySession
+from .db import db_task
+
+
+def _open(user_id):
+    return SurveySession.objects.filter(user_id=user_id, finished_at__isnull=True)
+
+
+def get_open_session(user_id):
+    return _open(user_id).first()
+
+
+def start_session(user_id, role, questionnaire):
+    """Начинает анкету заново: незавершённая сессия пользователя отбрасывается."""
+    first = questionnaire.at(0)
+    with transaction.atomic():
+        _open(user_id).delete()
+        return SurveySession.objects.create(
+            user_id=user_id,
+            role=role,
+            questionnaire_version=questionnaire.version,
+            poll_id=first.id if first else None,
+        )
+
+
+def resume_session(user_id, role, questionnaire):
+    """
+    Позиция, с которой продолжить открытую сессию, или None — анкету надо начать заново.
+
+    Если анкета изменилась после начала сессии (вопрос сняли, переставили
+    или добавили), позиция ищется по id вопроса, на котором респондент
+    остановился; если этот вопрос снят с публикации — None.
+    """
+    session = get_open_session(user_id)
+    if session is None or session.role != role:
+        return None
+    if session.questionnaire_version == questionnaire.version:
+        return session.position
+
+    if session.poll_id is None:
+        # респондент ответил на все вопросы старой версии, кроме, может быть, новых
+        position = len(questionnaire) if session.position else 0
+    else:
+        position = questionnaire.positions.get(session.poll_id)
+        if position is None:
+            return None
+
+    _open(user_id).update(
+        position=position,
+        questionnaire_version=questionnaire.version,
+        updated_at=timezone.now(),
+    )
+    return position
+
+
+def advance_session(user_id, position, poll_id):
+    # абсолютная позиция, а не +1: повторная запись той же пачки ничего не сдвигает
+    _open(user_id).update(position=position, poll_id=poll_id, updated_at=timezone.now())
+
+
+def finish_session(user_id):
+    now = timezone.now()
+    _open(user_id).update(finished_at=now, updated_at=now)
+
+
+def discard_session(user_id):
+    _open(user_id).delete()
+
+
+def finished_user_ids(role):
+    """Подзапрос с id пользователей, прошедших анкету роли до конца."""
+    return (
+        SurveySession.objects
+        .filter(role=role, finished_at__isnull=False)
+        .values("user_id")
+    )
+
+
+aget_open_session = db_task(get_open_session)
+astart_session = db_task(start_session)
+aresume_session = db_task(resume_session)
+adiscard_session = db_task(discard_session)
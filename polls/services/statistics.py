@@ -0,0 +1,273 @@
+from functools import reduce
+from operator import or_
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Count, Max, Q
+from django.utils import timezone
+
+from ..models import Answer, FunnelStat, Poll, QuestionStat, SurveySession
+from .questionnaire import get_questionnaire
+from .sessions import finished_user_ids
+
+
+CHOICE_TYPES = ("choice", "multi_choice")
+ROLES = ("parent", "student")
+
+
+def group_percentiles(values, starts, counts, q):
+    """
+    Перцентиль ``q`` для каждой группы отсортированного массива ``values``.
+
+    Группа ``i`` — это ``values[starts[i]:starts[i] + counts[i]]``, значения
+    внутри группы отсортированы. Интерполяция линейная, как в ``np.percentile``.
+    """
+    position = starts + (counts - 1) * (q / 100)
+    lower = np.floor(position).astype(np.int64)
+    upper = np.minimum(lower + 1, starts + counts - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+# ======================================================
+# РАСЧЁТ
+# ======================================================
+
+def _answers(finished_only):
+    """Ответы для статистики; с ``finished_only`` — только прошедших анкету своей роли."""
+    if not finished_only:
+        return Answer.objects.all()
+    return Answer.objects.filter(reduce(or_, (
+        Q(poll__role=role, user_id__in=finished_user_ids(role)) for role in ROLES
+    )))
+
+
+def option_stats(polls, now, finished_only=False):
+    """Распределение ответов по вариантам choice/multi_choice, включая невыбранные варианты."""
+    answers = _answers(finished_only)
+    counts = {
+        (poll_id, index): n
+        for poll_id, index, n in (
+            answers
+            .filter(poll__question_type__in=CHOICE_TYPES, option_index__isnull=False)
+            .order_by()
+            .values("poll_id", "option_index")
+            .annotate(n=Count("id"))
+            .values_list("poll_id", "option_index", "n")
+        )
+    }
+    respondents = dict(
+        answers
+        .filter(poll__question_type__in=CHOICE_TYPES)
+        .order_by()
+        .values("poll_id")
+        .annotate(n=Count("user_id", distinct=True))
+        .values_list("poll_id", "n")
+    )
+
+    rows = [
+        (poll, index, opt.get("text", "") if isinstance(opt, dict) else str(opt))
+        for poll in polls
+        # снятые с публикации вопросы без ответов только раздували бы таблицы
+        if poll.question_type in CHOICE_TYPES and (poll.is_active or poll.id in respondents)
+        for index, opt in enumerate(poll.options or [])
+    ]
+    if not rows:
+        return []
+
+    answers = np.array([counts.get((poll.id, index), 0) for poll, index, _ in rows])
+    totals = np.array([respondents.get(poll.id, 0) for poll, _, _ in rows])
+    shares = np.divide(answers, totals, out=np.zeros(len(rows)), where=totals > 0)
+
+    return [
+        QuestionStat(
+            role=poll.role,
+            poll=poll,
+            kind=QuestionStat.KIND_OPTION,
+            option_index=index,
+            label=label[:255],
+            answers=int(n),
+            respondents=int(total),
+            share=float(share) if total else None,
+            finished_only=finished_only,
+            computed_at=now,
+        )
+        for (poll, index, label), n, total, share in zip(rows, answers, totals, shares)
+    ]
+
+
+def scale_stats(polls, now, finished_only=False):
+    """Среднее, медиана и перцентили оценок по каждому утверждению scale_group."""
+    rows = list(
+        _answers(finished_only)
+        .filter(poll__question_type="scale_group", score__isnull=False)
+        .exclude(option_key="")
+        .order_by("poll_id", "option_key", "score")
+        .values_list("poll_id", "option_key", "score")
+    )
+    if not rows:
+        return []
+
+    poll_ids, keys, scores = zip(*rows)
+    poll_ids = np.array(poll_ids, dtype=np.int64)
+    keys = np.array(keys)
+    scores = np.array(scores, dtype=np.float64)
+
+    # строки уже отсортированы БД: группа (poll_id, option_key) — непрерывный отрезок
+    boundary = (poll_ids[1:] != poll_ids[:-1]) | (keys[1:] != keys[:-1])
+    starts = np.flatnonzero(np.r_[True, boundary])
+    counts = np.diff(np.r_[starts, len(scores)])
+
+    means = np.add.reduceat(scores, starts) / counts
+    minimums = scores[starts]
+    maximums = scores[starts + counts - 1]
+    percentiles = {
+        q: group_percentiles(scores, starts, counts, q) for q in (25, 50, 75, 90)
+    }
+
+    polls = {poll.id: poll for poll in polls}
+    stats = []
+    for i, start in enumerate(starts):
+        poll = polls.get(int(poll_ids[start]))
+        if poll is None:
+            continue
+        key = str(keys[start])
+        stats.append(QuestionStat(
+            role=poll.role,
+            poll=poll,
+            kind=QuestionStat.KIND_SCALE,
+            option_key=key,
+            label=(poll.options_by_key.get(key) or "")[:255],
+            answers=int(counts[i]),
+            respondents=int(counts[i]),
+            mean=float(means[i]),
+            median=float(percentiles[50][i]),
+            p25=float(percentiles[25][i]),
+            p75=float(percentiles[75][i]),
+            p90=float(percentiles[90][i]),
+            minimum=int(minimums[i]),
+            maximum=int(maximums[i]),
+            finished_only=finished_only,
+            computed_at=now,
+        ))
+    return stats
+
+
+def funnel_stats(role, now, finished_only=False):
+    """Сколько сессий роли дошли до каждого вопроса текущей анкеты и ответили на него."""
+    questionnaire = get_questionnaire(role)
+    sessions = SurveySession.objects.filter(role=role)
+    if finished_only:
+        sessions = sessions.filter(finished_at__isnull=False)
+    histogram = list(
+        sessions
+        .order_by()
+        .values("position")
+        .annotate(n=Count("id"))
+        .values_list("position", "n")
+    )
+    if not histogram or not len(questionnaire):
+        return []
+
+    positions = np.array([position for position, _ in histogram], dtype=np.int64)
+    size = max(len(questionnaire), int(positions.max())) + 1
+    sessions = np.zeros(size, dtype=np.int64)
+    sessions[positions] = [n for _, n in histogram]
+    # at_least[k] — сессий с позицией >= k, то есть ответивших на первые k вопросов
+    at_least = sessions[::-1].cumsum()[::-1]
+
+    return [
+        FunnelStat(
+            role=role,
+            step=step + 1,
+            poll_id=question.id,
+            reached=int(at_least[step]),
+            answered=int(at_least[step + 1]),
+            finished_only=finished_only,
+            computed_at=now,
+        )
+        for step, question in enumerate(questionnaire.questions)
+    ]
+
+
+def refresh_statistics():
+    """
+    Пересчитывает таблицы QuestionStat и FunnelStat целиком.
+
+    Таблицы считаются в двух вариантах: по всем ответам и только по
+    респондентам, прошедшим анкету (для AI_REPORT_FINISHED_ONLY).
+    """
+    now = timezone.now()
+    polls = list(Poll.objects.all())
+    questions, funnel = [], []
+    for finished_only in (False, True):
+        questions += option_stats(polls, now, finished_only) + scale_stats(polls, now, finished_only)
+        funnel += [stat for role in ROLES for stat in funnel_stats(role, now, finished_only)]
+
+    with transaction.atomic():
+        QuestionStat.objects.all().delete()
+        QuestionStat.objects.bulk_create(questions)
+        FunnelStat.objects.all().delete()
+        FunnelStat.objects.bulk_create(funnel)
+
+    return {"question_stats": len(questions), "funnel_steps": len(funnel)}
+
+
+# ======================================================
+# КОМПАКТНЫЕ ТАБЛИЦЫ (для AI и выгрузок)
+# ======================================================
+
+def _short(text, limit):
+    text = " ".join((text or "").split())
+    return text if len(text) <= limit else text[:limit - 1] + "…"
+
+
+def _number(value):
+    return f"{value:.1f}".rstrip("0").rstrip(".")
+
+
+def statistics_computed_at(role, finished_only=False):
+    """Время последнего пересчёта таблиц роли (None — таблицы ещё не считались)."""
+    filters = {"role": role, "finished_only": finished_only}
+    return (
+        QuestionStat.objects.filter(**filters).aggregate(at=Max("computed_at"))["at"]
+        or FunnelStat.objects.filter(**filters).aggregate(at=Max("computed_at"))["at"]
+    )
+
+
+def format_statistics(role, finished_only=False):
+    """
+    Предрасчитанная статистика роли в виде компактных текстовых таблиц.
+
+    Таблицы только читаются: пересчитывает их задача ``statistics``
+    или команда ``refresh_statistics``.
+    """
+    stats = (
+        QuestionStat.objects
+        .filter(role=role, finished_only=finished_only)
+        .select_related("poll")
+        .order_by("poll__order", "poll_id", "option_index", "option_key")
+    )
+
+    lines = []
+    current_poll = None
+    for stat in stats:
+        if stat.poll_id != current_poll:
+            current_poll = stat.poll_id
+            lines.append(f"\n[{stat.poll.question_type}] {_short(stat.poll.question, 150)}")
+
+        if stat.kind == QuestionStat.KIND_OPTION:
+            share = f"{stat.share * 100:.0f}%" if stat.share is not None else "—"
+            lines.append(f"  {_short(stat.label, 80)} | {stat.answers} | {share}")
+        else:
+            lines.append(
+                f"  {stat.option_key}) {_short(stat.label, 80)} | n={stat.answers} | "
+                f"ср {_number(stat.mean)} | мед {_number(stat.median)} | "
+                f"P25–P75 {_number(stat.p25)}–{_number(stat.p75)} | P90 {_number(stat.p90)}"
+            )
+
+    funnel = list(FunnelStat.objects.filter(role=role, finished_only=finished_only).order_by("step"))
+    if funnel:
+        lines.append("\nВоронка (вопрос: дошли → ответили):")
+        lines.append("  " + "; ".join(f"{f.step}: {f.reached}→{f.answered}" for f in funnel))
+
+    return "\n".join(lines).strip()
@@ -1,11 +1,141 @@
-import requests
+import asyncio
+import json
+
+import aiohttp
 from django.conf import settings
 
+from .ratelimit import TokenBucket
+
+
+class TelegramAPIError(Exception):
+    pass
+
+
+class TelegramClient:
+    """
+    Клиент Bot API для рассылок из Django (отчёты, уведомления).
+
+    Держит одну aiohttp-сессию с пулом соединений, ограничивает темп общим
+    token bucket и повторяет запрос после 429 через ``retry_after``.
+    """
+
+    def __init__(self, token=None, api_url=None, rate=None, concurrency=None, max_retries=3):
+        self.token = token or settings.BOT_TOKEN
+        self.api_url = (api_url or settings.TELEGRAM_API_URL).rstrip("/")
+        self.bucket = TokenBucket(rate or settings.TELEGRAM_RATE_LIMIT)
+        self.concurrency = concurrency or settings.TELEGRAM_CONCURRENCY
+        self.max_retries = max_retries
+        self._session = None
+
+    async def __aenter__(self):
+        self._session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.concurrency),
+            timeout=aiohttp.ClientTimeout(total=60),
+        )
+        return self
+
+    async def __aexit__(self, *exc):
+        await self._session.close()
+        self._session = None
+
+    def _form(self, data, files):
+        form = aiohttp.FormData()
+        for key, value in data.items():
+            form.add_field(key, value if isinstance(value, str) else json.dumps(value))
+        for key, (filename, content, content_type) in files.items():
+            if hasattr(content, "seek"):
+                # файл читается с начала при каждой попытке
+                content.seek(0)
+            form.add_field(key, content, filename=filename, content_type=content_type)
+        return form
+
+    async def call(self, method, data, files=None):
+        url = f"{self.api_url}/bot{self.token}/{method}"
+
+        for attempt in range(self.max_retries + 1):
+            await self.bucket.acquire()
+            # FormData нельзя отправить дважды, поэтому собираем заново на каждую попытку
+            kwargs = {"data": self._form(data, files)} if files else {"json": data}
+            async with self._session.post(url, **kwargs) as response:
+                payload = await response.json(content_type=None)
+
+            if payload.get("ok"):
+                return payload["result"]
+
+            retry_after = payload.get("parameters", {}).get("retry_after")
+            if response.status == 429 and retry_after and attempt < self.max_retries:
+                self.bucket.pause(retry_after)
+                continue
+
+            raise TelegramAPIError(f"{method}: {payload.get('description', response.status)}")
+
+    async def send_message(self, chat_id, text, parse_mode="HTML"):
+        return await self.call(
+            "sendMessage",
+            {"chat_id": chat_id, "text": text, "parse_mode": parse_mode},
+        )
+
+    async def send_document(self, chat_id, document, caption=""):
+        """``document`` — file_id уже загруженного файла или кортеж (имя, байты или файл, content-type)."""
+        if isinstance(document, str):
+            return await self.call(
+                "sendDocument",
+                {"chat_id": chat_id, "document": document, "caption": caption},
+            )
+        return await self.call(
+            "sendDocument",
+            {"chat_id": str(chat_id), "caption": caption},
+            files={"document": document},
+        )
+
+    async def send_document_to_many(self, chat_ids, document, caption=""):
+        """
+        Загружает файл один раз и рассылает остальным по ``file_id``.
+
+        Возвращает (число доставленных, список ошибок, file_id) — file_id
+        можно сохранить и в следующий раз передать вместо файла.
+        """
+        errors = []
+        chat_ids = list(chat_ids)
+
+        file_id = None
+        while chat_ids and file_id is None:
+            chat_id = chat_ids.pop(0)
+            try:
+                message = await self.send_document(chat_id, document, caption)
+                file_id = message["document"]["file_id"]
+            except Exception as e:
+                errors.append(f"Ошибка отправки {chat_id}: {e}")
+
+        if file_id is None:
+            return 0, errors, ""
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def send(chat_id):
+            async with semaphore:
+                try:
+                    await self.send_document(chat_id, file_id, caption)
+                    return True
+                except Exception as e:
+                    errors.append(f"Ошибка отправки {chat_id}: {e}")
+                    return False
+
+        results = await asyncio.gather(*(send(chat_id) for chat_id in chat_ids))
+        return 1 + sum(results), errors, file_id
+
+
 def send_telegram_message(chat_id: int, text: str):
-    url = f"https://api.telegram.org/bot{settings.BOT_TOKEN}/sendMessage"
-    payload = {
-        "chat_id": chat_id,
-        "text": text,
-        "parse_mode": "HTML"
-    }
-    requests.post(url, json=payload)
+    async def run():
+        async with TelegramClient() as client:
+            return await client.send_message(chat_id, text)
+
+    return asyncio.run(run())
+
+
+def send_document_to_many(chat_ids, document, caption=""):
+    async def run():
+        async with TelegramClient() as client:
+            return await client.send_document_to_many(chat_ids, document, caption)
+
+    return asyncio.run(run())
@@ -0,0 +1,106 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+from ..models import User
+from .db import run_db
+
+
+class UserCache:
+    """
+    LRU-кэш профилей респондентов по ``tg_id``.
+
+    Запись живёт не дольше ``ttl`` секунд: правки из админки, сделанные
+    в другом процессе, бот увидит не позже чем через ``ttl``. Сохранения
+    в этом процессе попадают в кэш сразу (сигнал ``post_save``).
+    Наружу отдаются копии, чтобы несохранённые правки не утекали в кэш.
+    """
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._items = OrderedDict()  # tg_id -> (user, stored_at)
+        self._lock = threading.Lock()
+        self.generation = 0  # растёт при каждой записи через сигналы
+
+    def get(self, tg_id):
+        with self._lock:
+            item = self._items.get(tg_id)
+            if item is None:
+                return None
+            user, stored_at = item
+            if time.monotonic() - stored_at > self.ttl:
+                del self._items[tg_id]
+                return None
+            self._items.move_to_end(tg_id)
+            return copy.copy(user)
+
+    def _store(self, user):
+        self._items[user.tg_id] = (copy.copy(user), time.monotonic())
+        self._items.move_to_end(user.tg_id)
+        while len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
+
+    def put(self, user, generation):
+        # пока профиль читался из БД, его могли сохранить — тогда прочитанное устарело
+        with self._lock:
+            if generation == self.generation:
+                self._store(user)
+
+    def write(self, user):
+        with self._lock:
+            self.generation += 1
+            self._store(user)
+
+    def forget(self, tg_id):
+        with self._lock:
+            self.generation += 1
+            self._items.pop(tg_id, None)
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._items.clear()
+
+    def __len__(self):
+        return len(self._items)
+
+
+_cache = UserCache(
+    maxsize=getattr(settings, "USER_CACHE_SIZE", 10_000),
+    ttl=getattr(settings, "USER_CACHE_TTL", 300),
+)
+
+
+def _load(tg_id, create):
+    generation = _cache.generation
+    if create:
+        user, _ = User.objects.get_or_create(tg_id=tg_id)
+    else:
+        user = User.objects.get(tg_id=tg_id)
+    _cache.put(user, generation)
+    return user
+
+
+async def aget_user(tg_id, create=False):
+    """Профиль по ``tg_id``; при ``create=True`` создаёт его, как ``get_or_create``."""
+    user = _cache.get(tg_id)
+    if user is None:
+        user = await run_db(_load, tg_id, create)
+    return user
+
+
+async def asave_user(user):
+    # кэш обновит сигнал post_save
+    await run_db(user.save)
+
+
+def remember(user):
+    _cache.write(user)
+
+
+def forget(tg_id):
+    _cache.forget(tg_id)
@@ -0,0 +1,29 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Poll, Report, User
+from .services import questionnaire, users
+
+
+@receiver(post_save, sender=Poll)
+@receiver(post_delete, sender=Poll)
+def invalidate_questionnaire(sender, instance, **kwargs):
+    # Роль могла поменяться при редактировании — сбрасываем кэш целиком
+    questionnaire.invalidate()
+
+
+@receiver(post_save, sender=User)
+def remember_user(sender, instance, **kwargs):
+    users.remember(instance)
+
+
+@receiver(post_delete, sender=User)
+def forget_user(sender, instance, **kwargs):
+    users.forget(instance.tg_id)
+
+
+@receiver(post_delete, sender=Report)
+def delete_report_file(sender, instance, **kwargs):
+    # FileField не удаляет файл вместе со строкой
+    if instance.docx:
+        instance.docx.delete(save=False)
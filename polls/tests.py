@@ -1,3 +1,1808 @@
-from django.test import TestCase
+import asyncio
+import gc
+import os
+import random
+import tempfile
+import threading
+import time
+import unittest
+import zipfile
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from contextlib import contextmanager, suppress
+from importlib import import_module
+from importlib.util import find_spec
+from io import BytesIO, StringIO
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock
+from xml.etree import ElementTree
 
-# Create your tests here.
+from datetime import timedelta
+
+from aiogram.fsm.storage.base import StorageKey
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from django.apps import apps as django_apps
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Permission
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.db import DEFAULT_DB_ALIAS, connection, connections, transaction
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from states import SurveyState
+
+from .ai.docx import build_docx_bytes
+from .ai.mapreduce import ReportEngine, estimate_tokens, new_usage, pack_chunks
+from .ai.markdown import Paragraph, Span, iter_lines, parse_inline, tokenize
+from .ai.prompts import PARENT_CHUNK_PROMPT, PARENT_REDUCE_PROMPT, PARENT_REPORT_PROMPT
+from .ai.report import (
+    build_parent_answers, generate_parent_report, iter_parent_answer_blocks, parent_report_key,
+    refresh_parent_summaries,
+)
+from .jobs import HANDLERS, claim_next, run_job, set_progress
+from .management.commands.check_query_plans import sorts_without_index
+from .models import (
+    Answer, BotState, Broadcast, FunnelStat, Job, Poll, QuestionStat, Report, RespondentSummary,
+    SurveySession, User,
+)
+from .services import db, deliveries, questionnaire, users
+from .services.answer_queue import AnswerQueue, SessionStep, _bulk_insert
+from .services.broadcasts import broadcast_loop, claim_broadcast, save_checkpoint
+from .services.export import export_answers
+from .services.fsm_storage import DjangoStorage, TTLMemoryStorage, build_fsm_storage
+from .services.reports import get_parent_report
+from .services.send_scheduler import BULK, INTERACTIVE, SendScheduler, send_priority
+from .services.sessions import resume_session, start_session
+from .services.statistics import format_statistics, refresh_statistics
+from .services.telegram import TelegramAPIError, TelegramClient
+
+
+class InlineExecutor(Executor):
+    """Пул БД бота, выполняющий задачи в соединении теста: так они видят транзакцию TestCase."""
+
+    def __init__(self):
+        self.connection = connections[DEFAULT_DB_ALIAS]
+
+    def submit(self, fn, *args, **kwargs):
+        # внутри цикла событий у asgiref свой контекст и Django открыл бы новое соединение
+        connections[DEFAULT_DB_ALIAS] = self.connection
+        future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except BaseException as exc:
+            future.set_exception(exc)
+        return future
+
+
+@contextmanager
+def inline_db():
+    # синхронный ORM вызывается прямо из цикла событий — Django это по умолчанию запрещает
+    with mock.patch.object(db, "get_executor", return_value=InlineExecutor()), \
+            mock.patch.dict(os.environ, {"DJANGO_ALLOW_ASYNC_UNSAFE": "true"}):
+        yield
+
+
+def flush_in_test(queue):
+    """Сброс очереди с записью в соединении теста, а не в пуле потоков бота."""
+    calls = []
+
+    async def record(func, *args, **kwargs):
+        calls.append((func, args, kwargs))
+
+    with mock.patch("polls.services.answer_queue.run_db", record):
+        asyncio.run(queue.flush())
+    for func, args, kwargs in calls:
+        func(*args, **kwargs)
+
+
+class AnswerQueueWriteTests(TransactionTestCase):
+    # внешние ключи SQLite проверяются при COMMIT, поэтому без обёртки TestCase
+
+    def setUp(self):
+        self.user = User.objects.create(tg_id=1, role="parent")
+        self.poll = Poll.objects.create(role="parent", question="Вопрос", question_type="text")
+        SurveySession.objects.create(user=self.user, role="parent")
+        self.addCleanup(db.shutdown)
+
+    def test_batches_are_written_on_close(self):
+        queue = AnswerQueue(batch_size=2, flush_interval=60)
+
+        async def scenario():
+            await queue.start()
+            for n in range(5):
+                queue.put(self.user.id, self.poll.id, str(n))
+            queue.advance(self.user.id, 1, None)
+            await queue.close()
+
+        asyncio.run(scenario())
+
+        self.assertEqual(len(queue), 0)
+        self.assertEqual(sorted(Answer.objects.values_list("answer", flat=True)), list("01234"))
+        self.assertEqual(SurveySession.objects.get().position, 1)
+
+    def test_broken_answer_does_not_block_batch(self):
+        with self.assertLogs("polls.services.answer_queue", "WARNING") as logs:
+            _bulk_insert([
+                (self.user.id, self.poll.id, "первый", {}),
+                # вопрос удалили, пока ответ ждал в очереди
+                (self.user.id, self.poll.id + 100, "к удалённому", {}),
+                (self.user.id, self.poll.id, "второй", {}),
+                SessionStep(self.user.id, 1, None, False),
+            ])
+
+        self.assertEqual(sorted(Answer.objects.values_list("answer", flat=True)), ["второй", "первый"])
+        self.assertEqual(SurveySession.objects.get().position, 1)
+        self.assertIn(f"poll_id={self.poll.id + 100}", logs.output[0])
+
+
+# ======================================================
+# КЭШ АНКЕТЫ
+# ======================================================
+
+class QuestionnaireCacheTests(TestCase):
+    def setUp(self):
+        questionnaire.invalidate()
+        self.addCleanup(questionnaire.invalidate)
+        self.poll = Poll.objects.create(role="parent", question="Вопрос", question_type="text")
+
+    def test_cached_questionnaire_does_not_query(self):
+        first = questionnaire.get_questionnaire("parent")
+        with self.assertNumQueries(0):
+            self.assertIs(questionnaire.get_questionnaire("parent"), first)
+
+    def test_saved_poll_invalidates_cache(self):
+        before = questionnaire.get_questionnaire("parent")
+
+        self.poll.question = "Новая формулировка"
+        self.poll.save()
+        after = questionnaire.get_questionnaire("parent")
+
+        self.assertEqual(after.at(0).question, "Новая формулировка")
+        self.assertNotEqual(after.version, before.version)
+
+    def test_added_and_deleted_polls_change_questionnaire(self):
+        added = Poll.objects.create(role="parent", question="Ещё", question_type="text", order=1)
+        self.assertEqual(len(questionnaire.get_questionnaire("parent")), 2)
+
+        added.delete()
+        self.assertEqual(len(questionnaire.get_questionnaire("parent")), 1)
+
+    def test_version_depends_only_on_content(self):
+        version = questionnaire.get_questionnaire("parent").version
+        questionnaire.invalidate()
+        self.assertEqual(questionnaire.get_questionnaire("parent").version, version)
+
+    def test_copy_loaded_during_change_is_not_cached(self):
+        load = questionnaire._load
+
+        def load_during_change(role):
+            loaded = load(role)
+            questionnaire.invalidate()  # вопрос сохранили, пока читалась анкета
+            return loaded
+
+        with mock.patch.object(questionnaire, "_load", side_effect=load_during_change):
+            questionnaire.get_questionnaire("parent")
+        with self.assertNumQueries(1):
+            questionnaire.get_questionnaire("parent")
+
+    @override_settings(QUESTIONNAIRE_CACHE_TTL=0)
+    def test_expired_copy_is_reloaded(self):
+        questionnaire.get_questionnaire("parent")
+        # правка из другого процесса: сигнал сюда не доходит
+        Poll.objects.filter(pk=self.poll.pk).update(question="Из админки")
+        self.assertEqual(questionnaire.get_questionnaire("parent").at(0).question, "Из админки")
+
+
+# ======================================================
+# ОЧЕРЕДЬ ОТВЕТОВ
+# ======================================================
+
+class AnswerQueueTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(tg_id=1, role="parent")
+        self.poll = Poll.objects.create(role="parent", question="Вопрос", question_type="text")
+        self.session = SurveySession.objects.create(user=self.user, role="parent")
+
+    def test_session_moves_only_with_flushed_answers(self):
+        queue = AnswerQueue()
+        queue.put(self.user.id, self.poll.id, "ответ", text="ответ")
+        queue.advance(self.user.id, 1, None)
+
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.position, 0)
+
+        flush_in_test(queue)
+
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.position, 1)
+        self.assertEqual(Answer.objects.filter(user=self.user).count(), 1)
+
+    def test_failed_write_keeps_answers_and_step(self):
+        queue = AnswerQueue()
+        queue.put(self.user.id, self.poll.id, "ответ")
+        queue.advance(self.user.id, 1, None)
+
+        with mock.patch("polls.services.answer_queue.run_db", side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                asyncio.run(queue.flush())
+
+        self.assertEqual(len(queue), 2)
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.position, 0)
+
+    def test_last_answer_finishes_session(self):
+        _bulk_insert([
+            (self.user.id, self.poll.id, "ответ", {}),
+            SessionStep(self.user.id, 1, None, False),
+            SessionStep(self.user.id, None, None, True),
+        ])
+
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.position, 1)
+        self.assertIsNotNone(self.session.finished_at)
+        self.assertEqual(Answer.objects.filter(user=self.user).count(), 1)
+
+
+# ======================================================
+# ПРОДОЛЖЕНИЕ АНКЕТЫ
+# ======================================================
+
+class ResumeSessionTests(TestCase):
+    def setUp(self):
+        questionnaire.invalidate()
+        self.user = User.objects.create(tg_id=1, role="parent")
+        self.polls = [
+            Poll.objects.create(role="parent", question=f"Вопрос {n}", question_type="text", order=n)
+            for n in range(4)
+        ]
+        start_session(self.user.id, "parent", questionnaire.get_questionnaire("parent"))
+        # ответил на два вопроса, следующий — третий
+        _bulk_insert([SessionStep(self.user.id, 2, self.polls[2].id, False)])
+
+    def resume(self):
+        questionnaire.invalidate()
+        return resume_session(self.user.id, "parent", questionnaire.get_questionnaire("parent"))
+
+    def test_same_version_resumes_at_position(self):
+        self.assertEqual(self.resume(), 2)
+
+    def test_deactivated_earlier_question_shifts_position(self):
+        Poll.objects.filter(pk=self.polls[0].pk).update(is_active=False)
+        self.assertEqual(self.resume(), 1)
+        # позиция и версия в сессии обновлены, второе продолжение их не меняет
+        self.assertEqual(self.resume(), 1)
+        self.assertEqual(SurveySession.objects.get().position, 1)
+
+    def test_inserted_question_keeps_current_question(self):
+        Poll.objects.create(role="parent", question="Новый", question_type="text", order=0)
+        self.assertEqual(self.resume(), 3)
+
+    def test_deactivated_current_question_restarts(self):
+        Poll.objects.filter(pk=self.polls[2].pk).update(is_active=False)
+        self.assertIsNone(self.resume())
+
+    def test_other_role_restarts(self):
+        q = questionnaire.get_questionnaire("student")
+        self.assertIsNone(resume_session(self.user.id, "student", q))
+
+
+# ======================================================
+# ОПРОСЫ TELEGRAM
+# ======================================================
+
+class BotHandlerTestCase(TestCase):
+    """Обработчики bot.py с подменённой отправкой в Telegram; пул БД работает в соединении теста."""
+
+    def setUp(self):
+        import bot
+
+        self.bot = bot
+        questionnaire.invalidate()
+        self.user = User.objects.create(
+            tg_id=501, role="parent", full_name="Респондент", phone_number="+7", consent_personal_data=True,
+        )
+        self.polls = [
+            Poll.objects.create(
+                role="parent",
+                question=f"Вопрос {n}",
+                question_type="choice",
+                options=[{"key": "A", "text": "Да"}, {"key": "B", "text": "Нет"}],
+                order=n,
+            )
+            for n in range(3)
+        ]
+
+        sent = iter(range(1, 100))
+
+        async def send_poll(**kwargs):
+            return mock.Mock(poll=mock.Mock(id=f"tg-{next(sent)}"))
+
+        for name, patcher in (
+            ("send_poll", mock.patch.object(bot.bot, "send_poll", side_effect=send_poll)),
+            ("send_message", mock.patch.object(bot.bot, "send_message", new_callable=mock.AsyncMock)),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        database = inline_db()
+        database.__enter__()
+        self.addCleanup(database.__exit__, None, None, None)
+
+    def vote(self, telegram_poll_id, option_ids):
+        # поля PollAnswer, которые читает обработчик; пустой option_ids — отзыв голоса
+        answer = SimpleNamespace(
+            poll_id=telegram_poll_id, user=SimpleNamespace(id=self.user.tg_id), option_ids=option_ids,
+        )
+        asyncio.run(self.bot.poll_answer_handler(answer))
+
+
+class PollAnswerTests(BotHandlerTestCase):
+    def test_revote_after_retract_is_ignored(self):
+        asyncio.run(self.bot.open_survey(self.user.tg_id))
+        self.vote("tg-1", [0])
+        # отозвал голос в первом опросе и проголосовал заново, уже стоя на втором вопросе
+        self.vote("tg-1", [])
+        self.vote("tg-1", [1])
+        asyncio.run(self.bot.answer_queue.flush())
+
+        self.assertEqual(
+            list(Answer.objects.values_list("poll_id", "answer")),
+            [(self.polls[0].id, "Да")],
+        )
+        session = SurveySession.objects.get(user=self.user)
+        self.assertEqual((session.position, session.poll_id), (1, self.polls[1].id))
+
+        # ответ на текущий вопрос по-прежнему принимается
+        self.vote("tg-2", [1])
+        asyncio.run(self.bot.answer_queue.flush())
+        self.assertEqual(Answer.objects.count(), 2)
+        self.assertEqual(SurveySession.objects.get(user=self.user).position, 2)
+
+    def test_vote_of_other_user_is_ignored(self):
+        other = User.objects.create(tg_id=502, role="parent")
+        asyncio.run(self.bot.open_survey(self.user.tg_id))
+        # опрос переслали, и проголосовал не тот, кому он был отправлен
+        answer = SimpleNamespace(poll_id="tg-1", user=SimpleNamespace(id=other.tg_id), option_ids=[0])
+        asyncio.run(self.bot.poll_answer_handler(answer))
+        asyncio.run(self.bot.answer_queue.flush())
+
+        self.assertFalse(Answer.objects.exists())
+        # голос адресата по-прежнему принимается
+        self.vote("tg-1", [0])
+        asyncio.run(self.bot.answer_queue.flush())
+        self.assertEqual(list(Answer.objects.values_list("user_id", flat=True)), [self.user.id])
+
+
+class SurveyProgressTests(BotHandlerTestCase):
+    def progress(self):
+        return asyncio.run(self.bot.get_progress(self.user))
+
+    def saved_position(self):
+        return SurveySession.objects.get(user=self.user).position
+
+    def test_unsaved_step_is_taken_from_answer_queue(self):
+        asyncio.run(self.bot.open_survey(self.user.tg_id))
+        self.vote("tg-1", [0])
+        self.assertEqual((self.progress(), self.saved_position()), (1, 0))
+
+        asyncio.run(self.bot.answer_queue.flush())
+        self.assertIsNone(self.bot.answer_queue.position(self.user.id))
+        self.assertEqual((self.progress(), self.saved_position()), (1, 1))
+
+    def test_crash_returns_to_first_unsaved_answer(self):
+        Poll.objects.filter(pk=self.polls[2].pk).update(question_type="text", options=[])
+        questionnaire.invalidate()
+        asyncio.run(self.bot.open_survey(self.user.tg_id))
+        self.vote("tg-1", [0])
+        asyncio.run(self.bot.answer_queue.flush())
+        self.vote("tg-2", [0])
+        self.assertEqual(
+            asyncio.run(self.bot.user_state(self.user.tg_id).get_data()), {"poll_id": self.polls[2].id},
+        )
+
+        # процесс упал до сброса очереди: ответ на второй вопрос и сдвиг потеряны,
+        # а состояние диалога ждёт ответа на третий
+        with mock.patch.object(self.bot, "answer_queue", AnswerQueue()):
+            self.assertEqual(self.progress(), 1)
+
+            message = SimpleNamespace(
+                from_user=SimpleNamespace(id=self.user.tg_id), text="Ответ", answer=mock.AsyncMock(),
+            )
+            self.bot.bot.send_poll.reset_mock()
+            asyncio.run(self.bot.handle_text_and_scale(message))
+            asyncio.run(self.bot.answer_queue.flush())
+
+        # текст не записан в чужой вопрос, а второй вопрос задан снова
+        self.assertEqual(list(Answer.objects.values_list("poll_id", flat=True)), [self.polls[0].id])
+        self.assertEqual(self.bot.bot.send_poll.call_args.kwargs["question"], "Вопрос 1")
+        self.assertEqual(self.saved_position(), 1)
+
+
+class DeliveryTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(tg_id=1, role="parent")
+        self.poll = Poll.objects.create(role="parent", question="Вопрос", question_type="choice")
+        for patcher in (mock.patch.object(deliveries, "_lru", deliveries.DeliveryLRU(10)), inline_db()):
+            patcher.__enter__()
+            self.addCleanup(patcher.__exit__, None, None, None)
+
+    def test_recorded_delivery_resolves_from_memory(self):
+        asyncio.run(deliveries.record_delivery("tg-1", self.user.id, self.poll.id))
+
+        with self.assertNumQueries(0):
+            delivery = asyncio.run(deliveries.resolve_delivery("tg-1"))
+        self.assertEqual(delivery, (self.user.id, self.poll.id))
+
+    def test_delivery_survives_restart(self):
+        asyncio.run(deliveries.record_delivery("tg-1", self.user.id, self.poll.id))
+        # другой процесс бота или рестарт: в памяти сопоставления нет
+        deliveries._lru = deliveries.DeliveryLRU(10)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(asyncio.run(deliveries.resolve_delivery("tg-1")), (self.user.id, self.poll.id))
+        with self.assertNumQueries(0):
+            asyncio.run(deliveries.resolve_delivery("tg-1"))
+
+    def test_unknown_poll_is_not_resolved(self):
+        self.assertIsNone(asyncio.run(deliveries.resolve_delivery("чужой")))
+
+    def test_delivery_is_claimed_once(self):
+        asyncio.run(deliveries.record_delivery("tg-1", self.user.id, self.poll.id))
+        claims = [asyncio.run(deliveries.claim_delivery("tg-1")) for _ in range(2)]
+        self.assertEqual(claims, [True, False])
+
+    def test_lru_evicts_least_recently_used(self):
+        lru = deliveries.DeliveryLRU(2)
+        lru.put("a", 1)
+        lru.put("b", 2)
+        lru.get("a")
+        lru.put("c", 3)
+        self.assertEqual((lru.get("a"), lru.get("b"), lru.get("c"), len(lru)), (1, None, 3, 2))
+
+
+# ======================================================
+# КЭШ ПРОФИЛЕЙ
+# ======================================================
+
+class UserCacheTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(tg_id=1, role="parent", full_name="Иван")
+        for patcher in (mock.patch.object(users, "_cache", users.UserCache(maxsize=10, ttl=300)), inline_db()):
+            patcher.__enter__()
+            self.addCleanup(patcher.__exit__, None, None, None)
+
+    def get(self, tg_id=1, **kwargs):
+        return asyncio.run(users.aget_user(tg_id, **kwargs))
+
+    def test_profile_is_read_once(self):
+        self.get()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get().full_name, "Иван")
+
+    def test_saved_profile_replaces_cached(self):
+        self.get()
+        # правка в админке того же процесса
+        user = User.objects.get(pk=self.user.pk)
+        user.full_name = "Пётр"
+        user.save()
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get().full_name, "Пётр")
+
+    def test_deleted_profile_is_forgotten(self):
+        self.get()
+        self.user.delete()
+        with self.assertRaises(User.DoesNotExist):
+            self.get()
+
+    def test_unsaved_changes_do_not_leak(self):
+        self.get().full_name = "Черновик"
+        self.assertEqual(self.get().full_name, "Иван")
+
+    def test_profile_read_before_save_is_not_cached(self):
+        cache = users._cache
+        generation = cache.generation
+        stale = User.objects.get(pk=self.user.pk)
+        User.objects.filter(pk=self.user.pk).update(full_name="Пётр")
+        cache.forget(self.user.tg_id)  # сохранение, пока шло чтение
+
+        cache.put(stale, generation)
+        self.assertIsNone(cache.get(self.user.tg_id))
+
+    def test_expired_profile_is_reloaded(self):
+        users._cache.ttl = 0
+        self.get()
+        # правка из другого процесса: сигнал сюда не доходит
+        User.objects.filter(pk=self.user.pk).update(full_name="Пётр")
+        self.assertEqual(self.get().full_name, "Пётр")
+
+    def test_create_makes_profile(self):
+        self.assertEqual(self.get(2, create=True).tg_id, 2)
+        self.assertTrue(User.objects.filter(tg_id=2).exists())
+
+
+# ======================================================
+# СОСТОЯНИЕ ДИАЛОГА (FSM)
+# ======================================================
+
+class Clock:
+    """Подменяемое ``time.monotonic``: тесты TTL не ждут реального времени."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TTLMemoryStorageTests(SimpleTestCase):
+    def setUp(self):
+        self.clock = Clock()
+        patcher = mock.patch("polls.services.fsm_storage.time.monotonic", self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.storage = TTLMemoryStorage(ttl=60, sweep_interval=10)
+        self.key = StorageKey(bot_id=1, chat_id=7, user_id=7)
+
+    def run_storage(self, method, *args, key=None):
+        return asyncio.run(getattr(self.storage, method)(key or self.key, *args))
+
+    def test_round_trip(self):
+        self.run_storage("set_state", SurveyState.text_answer)
+        data = {"poll_id": 5, "nested": {"scale_index": 1}}
+        self.run_storage("set_data", data)
+        data["nested"]["scale_index"] = 2
+
+        self.assertEqual(self.run_storage("get_state"), "SurveyState:text_answer")
+        loaded = self.run_storage("get_data")
+        self.assertEqual(loaded, {"poll_id": 5, "nested": {"scale_index": 1}})
+        # наружу — копия: правка без set_data в хранилище не попадает
+        loaded["poll_id"] = 6
+        self.assertEqual(self.run_storage("get_data")["poll_id"], 5)
+
+    def test_inactive_key_expires(self):
+        self.run_storage("set_state", SurveyState.scale_answer)
+        self.run_storage("set_data", {"poll_id": 5})
+
+        self.clock.now += 59
+        self.assertEqual(self.run_storage("get_data"), {"poll_id": 5})  # чтение продлевает жизнь
+        self.clock.now += 61
+        self.assertIsNone(self.run_storage("get_state"))
+        self.assertEqual(self.run_storage("get_data"), {})
+
+    def test_sweep_drops_expired_keys(self):
+        other = StorageKey(bot_id=1, chat_id=8, user_id=8)
+        self.run_storage("set_data", {"poll_id": 1}, key=other)
+        self.clock.now += 61
+        self.run_storage("set_data", {"poll_id": 2})
+
+        self.assertEqual(list(self.storage._records), [self.key])
+
+    def test_factory_follows_settings(self):
+        with override_settings(BOT_FSM_STORAGE="db", BOT_FSM_TTL=30):
+            storage = build_fsm_storage()
+        self.assertIsInstance(storage, DjangoStorage)
+        self.assertEqual(storage.ttl, 30)
+
+        with override_settings(BOT_FSM_STORAGE="memory", BOT_FSM_TTL=None):
+            self.assertIsInstance(build_fsm_storage(), TTLMemoryStorage)
+        with override_settings(BOT_FSM_STORAGE="файл"), self.assertRaises(ImproperlyConfigured):
+            build_fsm_storage()
+
+
+class DjangoStorageTests(TestCase):
+    def setUp(self):
+        self.storage = DjangoStorage(ttl=3600)
+        self.key = StorageKey(bot_id=1, chat_id=7, user_id=7)
+        database = inline_db()
+        database.__enter__()
+        self.addCleanup(database.__exit__, None, None, None)
+
+    def run_storage(self, method, *args):
+        return asyncio.run(getattr(self.storage, method)(self.key, *args))
+
+    def expire(self):
+        BotState.objects.update(updated_at=timezone.now() - timedelta(hours=2))
+
+    def test_state_and_data_are_written_separately(self):
+        self.run_storage("set_state", "SurveyState:text_answer")
+        # второй процесс бота со своим экземпляром хранилища
+        asyncio.run(DjangoStorage(ttl=3600).set_data(self.key, {"poll_id": 5}))
+
+        self.assertEqual(self.run_storage("get_state"), "SurveyState:text_answer")
+        self.assertEqual(self.run_storage("get_data"), {"poll_id": 5})
+
+        self.run_storage("set_state", None)
+        self.assertEqual(self.run_storage("get_data"), {"poll_id": 5})
+        self.run_storage("set_data", {})
+        self.assertFalse(BotState.objects.exists())
+
+    def test_round_trip(self):
+        self.run_storage("set_state", SurveyState.scale_answer)
+        self.run_storage("set_data", {"poll_id": 5, "scale_index": 2})
+
+        # новый экземпляр хранилища — как после рестарта бота
+        storage = DjangoStorage(ttl=3600)
+        self.assertEqual(asyncio.run(storage.get_state(self.key)), "SurveyState:scale_answer")
+        self.assertEqual(asyncio.run(storage.get_data(self.key)), {"poll_id": 5, "scale_index": 2})
+        # ключ другого чата не пересекается
+        other = StorageKey(bot_id=1, chat_id=8, user_id=8)
+        self.assertIsNone(asyncio.run(storage.get_state(other)))
+
+    def test_expired_data_does_not_come_back(self):
+        self.run_storage("set_data", {"poll_id": 5})
+        self.expire()
+        self.assertEqual(self.run_storage("get_data"), {})
+
+        self.run_storage("set_state", "SurveyState:scale_answer")
+        self.assertEqual(self.run_storage("get_data"), {})
+        self.assertEqual(self.run_storage("get_state"), "SurveyState:scale_answer")
+
+    def test_expired_rows_are_purged(self):
+        other = StorageKey(bot_id=1, chat_id=8, user_id=8)
+        asyncio.run(self.storage.set_data(other, {"poll_id": 1}))
+        self.expire()
+        self.run_storage("set_data", {"poll_id": 2})
+
+        self.assertEqual(self.storage.purge_expired(), 1)
+        self.assertEqual(list(BotState.objects.values_list("data", flat=True)), [{"poll_id": 2}])
+
+
+# ======================================================
+# СТРУКТУРИРОВАННЫЕ ОТВЕТЫ
+# ======================================================
+
+structured_data = import_module("polls.migrations.0017_answer_structured_data")
+
+
+class StructuredAnswerMigrationTests(TestCase):
+    def test_parse_answer(self):
+        choice = SimpleNamespace(
+            question_type="choice", options=[{"key": "A", "text": "Да"}, {"key": "B", "text": "Нет"}],
+        )
+        scale = SimpleNamespace(question_type="scale_group", options=[])
+        text = SimpleNamespace(question_type="text", options=[])
+
+        cases = [
+            (choice, "Нет", {"option_index": 1}),
+            (choice, "Может быть", {}),
+            (scale, "A: 7", {"option_key": "A", "score": 7}),
+            (scale, " B :10 ", {"option_key": "B", "score": 10}),
+            (scale, "A: много", {"option_key": "A"}),
+            (scale, "без оценки", {}),
+            (text, "Свободный ответ", {"text": "Свободный ответ"}),
+        ]
+        for poll, answer, fields in cases:
+            with self.subTest(answer=answer):
+                self.assertEqual(structured_data.parse_answer(poll, answer), fields)
+
+    def test_fill_structured_fields(self):
+        user = User.objects.create(tg_id=1, role="parent")
+        choice = Poll.objects.create(
+            role="parent", question="Да или нет", question_type="choice",
+            options=[{"key": "A", "text": "Да"}, {"key": "B", "text": "Нет"}],
+        )
+        scale = Poll.objects.create(role="parent", question="Оцените", question_type="scale_group")
+        for poll, answer in ((choice, "Нет"), (scale, "A: 7"), (scale, "B: 3")):
+            Answer.objects.create(user=user, poll=poll, answer=answer)
+
+        with mock.patch.object(structured_data, "BATCH_SIZE", 2):
+            structured_data.fill_structured_fields(django_apps, None)
+
+        self.assertEqual(
+            list(Answer.objects.order_by("id").values_list("option_index", "option_key", "score")),
+            [(1, "", None), (None, "A", 7), (None, "B", 3)],
+        )
+
+
+# ======================================================
+# ПЛАНЫ ГОРЯЧИХ ЗАПРОСОВ
+# ======================================================
+
+class QueryPlanTests(TestCase):
+    def test_hot_queries_use_indexes(self):
+        call_command("check_query_plans", stdout=StringIO())
+
+    def test_sort_outside_index_is_reported(self):
+        self.assertTrue(sorts_without_index(
+            "4 0 0 SEARCH polls_poll USING INDEX polls_poll_role_idx (role=?)\n"
+            "21 0 0 USE TEMP B-TREE FOR ORDER BY"
+        ))
+        self.assertTrue(sorts_without_index(
+            "Sort  (cost=8.17..8.18 rows=1 width=4)\n"
+            "  ->  Index Scan using polls_poll_role_idx on polls_poll"
+        ))
+        self.assertFalse(sorts_without_index(
+            "4 0 0 SEARCH polls_poll USING INDEX polls_poll_active_order_idx (role=?)"
+        ))
+
+
+# ======================================================
+# ФОНОВЫЕ ЗАДАЧИ
+# ======================================================
+
+class JobQueueTests(TestCase):
+    def running_job(self, started_ago, heartbeat_ago, attempts=1, max_attempts=3):
+        now = timezone.now()
+        return Job.objects.create(
+            kind="test",
+            status=Job.STATUS_RUNNING,
+            locked_by="worker-a",
+            attempts=attempts,
+            max_attempts=max_attempts,
+            started_at=now - timedelta(seconds=started_ago),
+            heartbeat_at=now - timedelta(seconds=heartbeat_ago),
+        )
+
+    def test_long_job_with_heartbeat_is_not_requeued(self):
+        job = self.running_job(started_ago=3 * 3600, heartbeat_ago=10)
+        with self.settings(JOB_TIMEOUT=300):
+            self.assertIsNone(claim_next("worker-b"))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.locked_by), (Job.STATUS_RUNNING, "worker-a"))
+
+    def test_stale_job_is_requeued(self):
+        job = self.running_job(started_ago=600, heartbeat_ago=600)
+        with self.settings(JOB_TIMEOUT=300):
+            claimed = claim_next("worker-b")
+        self.assertEqual(claimed.pk, job.pk)
+        self.assertEqual((claimed.locked_by, claimed.attempts), ("worker-b", 2))
+
+    def test_stale_job_without_attempts_left_fails(self):
+        job = self.running_job(started_ago=600, heartbeat_ago=600, attempts=3, max_attempts=3)
+        with self.settings(JOB_TIMEOUT=300):
+            self.assertIsNone(claim_next("worker-b"))
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.STATUS_FAILED)
+        self.assertIsNotNone(job.finished_at)
+
+    def test_set_progress_refreshes_heartbeat(self):
+        job = self.running_job(started_ago=600, heartbeat_ago=600)
+        set_progress(job, 50, "половина")
+        job.refresh_from_db()
+        self.assertLess(timezone.now() - job.heartbeat_at, timedelta(seconds=5))
+
+    def test_result_of_reclaimed_job_is_not_saved(self):
+        job = self.running_job(started_ago=0, heartbeat_ago=0)
+
+        def reclaimed(job):
+            # пока обработчик работал, задачу отдали другому воркеру
+            Job.objects.filter(pk=job.pk).update(locked_by="worker-b", attempts=2)
+            return {"ok": True}
+
+        with mock.patch.dict(HANDLERS, {"test": reclaimed}), self.assertLogs("polls.jobs", "WARNING"):
+            run_job(job)
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.locked_by, job.result), (Job.STATUS_RUNNING, "worker-b", None))
+
+    def test_finished_job_is_saved(self):
+        job = self.running_job(started_ago=0, heartbeat_ago=0)
+        with mock.patch.dict(HANDLERS, {"test": lambda job: {"ok": True}}):
+            run_job(job)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.locked_by, job.result), (Job.STATUS_DONE, "", {"ok": True}))
+
+
+# ======================================================
+# КЛИЕНТ BOT API
+# ======================================================
+
+class FakeBotAPI:
+    """
+    Локальный Bot API на aiohttp: ``replies`` — очередь ответов (статус, тело)
+    перед обычным успешным ответом; все запросы записываются в ``calls``.
+    """
+
+    def __init__(self, replies=()):
+        self.replies = list(replies)
+        self.calls = []  # (метод, chat_id, document или содержимое файла, загружен ли файл, время)
+        self.app = web.Application()
+        self.app.router.add_post("/botTEST/{method}", self.handle)
+
+    async def handle(self, request):
+        if request.content_type == "multipart/form-data":
+            form = await request.post()
+            chat_id, uploaded = int(form["chat_id"]), True
+            document = form["document"].file.read()
+        else:
+            body = await request.json()
+            chat_id, document, uploaded = body["chat_id"], body.get("document"), False
+        self.calls.append((request.match_info["method"], chat_id, document, uploaded, time.monotonic()))
+
+        if self.replies:
+            status, payload = self.replies.pop(0)
+            return web.json_response(payload, status=status)
+        result = {"message_id": len(self.calls), "chat": {"id": chat_id}}
+        if request.match_info["method"] == "sendDocument":
+            result["document"] = {"file_id": "file-1" if uploaded else document}
+        return web.json_response({"ok": True, "result": result})
+
+    async def run(self, scenario, **client_options):
+        """Запускает сервер и выполняет ``scenario(client)`` с клиентом, смотрящим на него."""
+        server = TestServer(self.app)
+        await server.start_server()
+        try:
+            options = {"rate": 1000, "concurrency": 4, **client_options}
+            async with TelegramClient(token="TEST", api_url=str(server.make_url("")), **options) as client:
+                return await scenario(client)
+        finally:
+            await server.close()
+
+
+def too_many_requests(retry_after):
+    return 429, {
+        "ok": False,
+        "error_code": 429,
+        "description": "Too Many Requests",
+        "parameters": {"retry_after": retry_after},
+    }
+
+
+class TelegramClientTests(SimpleTestCase):
+    def test_429_is_retried_after_retry_after(self):
+        api = FakeBotAPI([too_many_requests(0.2)])
+
+        result = asyncio.run(api.run(lambda client: client.send_message(1, "Напоминание")))
+
+        self.assertEqual(result["chat"], {"id": 1})
+        self.assertEqual(len(api.calls), 2)
+        self.assertGreaterEqual(api.calls[1][4] - api.calls[0][4], 0.2)
+
+    def test_429_gives_up_after_max_retries(self):
+        api = FakeBotAPI([too_many_requests(0.01)] * 2)
+
+        with self.assertRaisesMessage(TelegramAPIError, "Too Many Requests"):
+            asyncio.run(api.run(lambda client: client.send_message(1, "Напоминание"), max_retries=1))
+        self.assertEqual(len(api.calls), 2)
+
+    def test_requests_are_paced_by_token_bucket(self):
+        api = FakeBotAPI()
+
+        async def scenario(client):
+            await asyncio.gather(*(client.send_message(chat_id, "Напоминание") for chat_id in range(30)))
+
+        asyncio.run(api.run(scenario, rate=20))
+
+        # первые 20 — запас ведра, остальные 10 идут по 20 в секунду
+        times = sorted(call[4] for call in api.calls)
+        self.assertEqual(len(times), 30)
+        self.assertGreaterEqual(times[-1] - times[0], 0.45)
+        self.assertLess(times[19] - times[0], 0.2)
+
+    def test_document_is_uploaded_once_then_sent_by_file_id(self):
+        # первому администратору отправить не удалось — файл загружается второму
+        api = FakeBotAPI([(400, {"ok": False, "description": "Bad Request: chat not found"})])
+        document = ("report.docx", BytesIO(b"docx"), "application/octet-stream")
+
+        sent, errors, file_id = asyncio.run(api.run(
+            lambda client: client.send_document_to_many([1, 2, 3, 4], document, "Отчёт")
+        ))
+
+        self.assertEqual((sent, file_id), (3, "file-1"))
+        self.assertEqual(errors, ["Ошибка отправки 1: sendDocument: Bad Request: chat not found"])
+        self.assertEqual(
+            sorted((chat_id, document, uploaded) for _, chat_id, document, uploaded, _ in api.calls),
+            [(1, b"docx", True), (2, b"docx", True), (3, "file-1", False), (4, "file-1", False)],
+        )
+
+
+# ======================================================
+# ОСТАНОВКА БОТА
+# ======================================================
+
+class BotShutdownTests(SimpleTestCase):
+    def test_webhook_updates_drain_before_queue_and_pool_close(self):
+        import bot
+
+        with self.settings(BOT_WEBHOOK_URL="https://bot.example.com", BOT_WEBHOOK_SECRET="secret"):
+            bot.build_webhook_app()
+
+        callbacks = [handler.callback for handler in bot.dp.shutdown.handlers]
+        drain = callbacks.index(bot.drain_webhook_updates)
+        for later in (bot.answer_queue.close, bot.send_scheduler.close, bot.shutdown_db_pool):
+            self.assertLess(drain, callbacks.index(later))
+
+
+# ======================================================
+# ПЛАНИРОВЩИК ОТПРАВКИ
+# ======================================================
+
+class SendSchedulerTests(SimpleTestCase):
+    def granted_order(self, requests, **options):
+        """Порядок, в котором планировщик пропускает запросы ``(имя, chat_id, приоритет)``."""
+        scheduler = SendScheduler(**{"rate": 1000, "chat_rate": 1000, "chat_burst": 3, **options})
+        order = []
+
+        async def send(name, chat_id, priority):
+            await scheduler.acquire(chat_id, priority)
+            order.append((name, time.monotonic()))
+
+        async def scenario():
+            try:
+                await asyncio.gather(*(send(*request) for request in requests))
+            finally:
+                await scheduler.close()
+
+        asyncio.run(scenario())
+        return order, scheduler
+
+    def test_interactive_goes_before_queued_bulk(self):
+        requests = [(f"рассылка {n}", n, BULK) for n in range(5)] + [("ответ", 100, INTERACTIVE)]
+        order, scheduler = self.granted_order(requests)
+
+        self.assertEqual(order[0][0], "ответ")
+        self.assertEqual([name for name, _ in order[1:]], [f"рассылка {n}" for n in range(5)])
+        self.assertEqual(scheduler.stats()["sent"], {"interactive": 1, "bulk": 5})
+
+    def test_busy_chat_does_not_hold_back_others(self):
+        order, _ = self.granted_order(
+            [("A1", 1, INTERACTIVE), ("A2", 1, INTERACTIVE), ("B1", 2, BULK)], chat_rate=10, chat_burst=1,
+        )
+
+        self.assertEqual([name for name, _ in order], ["A1", "B1", "A2"])
+        # второе сообщение в тот же чат — не раньше чем через 1 / chat_rate
+        self.assertGreaterEqual(order[2][1] - order[0][1], 0.09)
+
+    def test_priority_comes_from_context(self):
+        scheduler = SendScheduler(rate=1000)
+
+        async def scenario():
+            send_priority.set(BULK)
+            try:
+                await scheduler.acquire(1)
+            finally:
+                await scheduler.close()
+
+        asyncio.run(scenario())
+        self.assertEqual(scheduler.stats()["sent"], {"bulk": 1})
+
+
+# ======================================================
+# РАССЫЛКИ
+# ======================================================
+
+class BroadcastClaimTests(TestCase):
+    def test_checkpoint_of_reclaimed_broadcast_is_rejected(self):
+        Broadcast.objects.create(text="Напоминание")
+        broadcast = claim_broadcast("worker-a", stale_after=300)
+        Broadcast.objects.filter(pk=broadcast.pk).update(locked_by="worker-b")
+
+        self.assertFalse(save_checkpoint(broadcast, last_user_id=10, sent=1, failed=0, blocked=0))
+        self.assertEqual(Broadcast.objects.get().sent, 0)
+
+
+class BroadcastShutdownTests(TransactionTestCase):
+    # рассылка работает через пул потоков бота, поэтому данные должны быть закоммичены
+
+    def tearDown(self):
+        db.shutdown()
+
+    def test_cancel_returns_broadcast_to_queue(self):
+        User.objects.create(tg_id=1, role="parent", consent_personal_data=True)
+        broadcast = Broadcast.objects.create(text="Напоминание", audience=Broadcast.AUDIENCE_ALL)
+
+        async def scenario():
+            sending = asyncio.Event()
+
+            async def send(chat_id, text):
+                sending.set()
+                await asyncio.sleep(3600)
+
+            task = asyncio.create_task(broadcast_loop(send, "worker-a", poll_interval=0.01))
+            await sending.wait()
+            task.cancel()
+            with suppress(asyncio.CancelledError):
+                await task
+
+        asyncio.run(scenario())
+
+        broadcast.refresh_from_db()
+        self.assertEqual((broadcast.status, broadcast.locked_by), (Broadcast.STATUS_PENDING, ""))
+        self.assertEqual(claim_broadcast("worker-b", stale_after=300).pk, broadcast.pk)
+
+
+# ======================================================
+# БАЗА ДАННЫХ
+# ======================================================
+
+class DatabaseConcurrencyTests(TransactionTestCase):
+    """Одинаковы для SQLite и PostgreSQL: запись бота из пула потоков не падает на блокировках."""
+
+    def setUp(self):
+        self.poll = Poll.objects.create(role="parent", question="Вопрос", question_type="text")
+        self.users = [User.objects.create(tg_id=n, role="parent") for n in range(8)]
+
+    def run_threads(self, func, count):
+        def target(n):
+            try:
+                return func(n)
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=count) as pool:
+            return list(pool.map(target, range(count)))
+
+    def test_concurrent_writers(self):
+        def write(n):
+            for i in range(20):
+                with transaction.atomic():
+                    Answer.objects.create(user=self.users[n], poll=self.poll, answer=str(i))
+
+        self.run_threads(write, len(self.users))
+        self.assertEqual(Answer.objects.count(), 20 * len(self.users))
+
+    def test_read_then_write_transactions_do_not_deadlock(self):
+        # оба потока читают, затем пишут в одной транзакции; при отложенной
+        # блокировке SQLite один из них сразу получает "database is locked"
+        barrier = threading.Barrier(2)
+
+        def read_then_write(n):
+            with transaction.atomic():
+                SurveySession.objects.filter(user=self.users[n]).exists()
+                try:
+                    barrier.wait(timeout=0.5)
+                except threading.BrokenBarrierError:
+                    pass  # второй поток ждёт блокировку записи — это и нужно
+                SurveySession.objects.create(user=self.users[n], role="parent")
+
+        self.run_threads(read_then_write, 2)
+        self.assertEqual(SurveySession.objects.count(), 2)
+
+    def test_reader_sees_committed_data_during_write(self):
+        started, release = threading.Event(), threading.Event()
+
+        def long_write(n):
+            with transaction.atomic():
+                Answer.objects.create(user=self.users[0], poll=self.poll, answer="в процессе")
+                started.set()
+                release.wait(timeout=5)
+
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            writer = pool.submit(lambda: self.run_threads(long_write, 1))
+            started.wait(timeout=5)
+            try:
+                self.assertEqual(Answer.objects.count(), 0)
+            finally:
+                release.set()
+            writer.result()
+        self.assertEqual(Answer.objects.count(), 1)
+
+    @unittest.skipUnless(connection.vendor == "sqlite", "режим журнала есть только у SQLite")
+    def test_sqlite_database_is_in_wal_mode(self):
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA journal_mode")
+            self.assertEqual(cursor.fetchone()[0], "wal")
+
+
+@override_settings(BOT_DB_POOL_SIZE=1)
+class RunDbConnectionTests(TransactionTestCase):
+    def setUp(self):
+        db.shutdown()
+        self.addCleanup(db.shutdown)
+
+    def connections_of_two_jobs(self, max_age):
+        def current():
+            connection.ensure_connection()
+            return connection.connection
+
+        async def scenario():
+            return await db.run_db(current), await db.run_db(current)
+
+        with mock.patch.dict(connection.settings_dict, {"CONN_MAX_AGE": max_age}):
+            return asyncio.run(scenario())
+
+    def test_connection_is_kept_between_jobs(self):
+        first, second = self.connections_of_two_jobs(max_age=60)
+        self.assertIs(first, second)
+
+    def test_obsolete_connection_is_closed_before_job(self):
+        first, second = self.connections_of_two_jobs(max_age=0)
+        self.assertIsNot(first, second)
+
+
+# ======================================================
+# AI-ОТЧЁТ И СТАТИСТИКА
+# ======================================================
+
+LOCMEM_CACHES = {
+    alias: {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": alias}
+    for alias in ("default", "reports", "report_completions")
+}
+
+
+class ParentReportTests(TestCase):
+    def setUp(self):
+        self.poll = Poll.objects.create(
+            role="parent",
+            question="Вопрос",
+            question_type="choice",
+            options=["Да", "Нет"],
+        )
+        for tg_id, finished in ((1, True), (2, False)):
+            user = User.objects.create(tg_id=tg_id, role="parent")
+            Answer.objects.create(user=user, poll=self.poll, answer="Да", option_index=0)
+            SurveySession.objects.create(
+                user=user,
+                role="parent",
+                position=1,
+                finished_at=timezone.now() if finished else None,
+            )
+
+    def test_stored_report_is_returned_without_statistics(self):
+        refresh_statistics()
+        _, cache_key = parent_report_key()
+        stored = Report.objects.create(cache_key=cache_key, text="# Отчёт", docx="parent_report.docx")
+
+        with mock.patch("polls.ai.report.format_statistics") as format_tables:
+            report, created = get_parent_report()
+
+        self.assertEqual((report, created), (stored, False))
+        format_tables.assert_not_called()
+        # таблицы не пересчитывались: время пересчёта то же, что и в ключе
+        self.assertEqual(parent_report_key()[1], cache_key)
+
+    def test_outdated_statistics_are_refreshed_before_report(self):
+        def statistics_used():
+            with mock.patch("polls.services.reports.generate_parent_report") as generate:
+                generate.return_value.text = ""
+                get_parent_report()
+            statistics, _, _ = generate.call_args.kwargs["inputs"]
+            return statistics
+
+        # таблицы ещё не считались
+        self.assertIn("Да | 2 | 100%", statistics_used())
+
+        user = User.objects.create(tg_id=3, role="parent")
+        Answer.objects.create(user=user, poll=self.poll, answer="Нет", option_index=1)
+        self.assertIn("Нет | 1 | 33%", statistics_used())
+
+    @override_settings(CACHES=LOCMEM_CACHES)
+    def test_report_uses_one_client_and_event_loop(self):
+        client = StubOpenAI()
+        with mock.patch("polls.ai.report.get_async_openai_client", return_value=client) as factory:
+            self.assertEqual(refresh_parent_summaries(batch_size=1), 2)
+            self.assertEqual((factory.call_count, client.closed, len(client.loops)), (1, 1, 1))
+
+            RespondentSummary.objects.all().delete()
+            client.loops.clear()
+            report = generate_parent_report(use_cache=False)
+
+        self.assertEqual(report.text, "сводка")
+        # сводки двух респондентов и итоговый отчёт — в одном цикле и одним клиентом
+        self.assertEqual(len(client.prompts), 5)
+        self.assertEqual((factory.call_count, client.closed, len(client.loops)), (2, 2, 1))
+
+    @override_settings(CACHES=LOCMEM_CACHES, AI_REPORT_CHUNK_TOKENS=3)
+    def test_completions_are_cached_apart_from_reports(self):
+        # при таком бюджете две сводки не помещаются в один запрос и сначала сворачиваются
+        report = generate_parent_report(StubOpenAI(), use_cache=False)
+
+        self.assertEqual(list(caches["reports"]._cache), [caches["reports"].make_key(report.cache_key)])
+        self.assertTrue(caches["report_completions"]._cache)
+
+    def test_passed_client_is_left_open(self):
+        client = StubOpenAI()
+        refresh_parent_summaries(client, batch_size=1)
+        self.assertEqual((len(client.prompts), client.closed), (2, 0))
+
+    def test_report_key_follows_statistics_refresh(self):
+        refresh_statistics()
+        _, before = parent_report_key()
+        self.assertEqual(parent_report_key()[1], before)
+
+        refresh_statistics()
+        self.assertNotEqual(parent_report_key()[1], before)
+
+    def test_finished_only_statistics(self):
+        refresh_statistics()
+
+        def answered(finished_only):
+            return QuestionStat.objects.get(
+                poll=self.poll, option_index=0, finished_only=finished_only,
+            ).answers
+
+        self.assertEqual(answered(False), 2)
+        self.assertEqual(answered(True), 1)
+        self.assertIn("Да | 2 | 100%", format_statistics("parent"))
+        self.assertIn("Да | 1 | 100%", format_statistics("parent", finished_only=True))
+
+
+class ParentCorpusTests(TestCase):
+    def setUp(self):
+        polls = [
+            Poll.objects.create(role="parent", question=f"Вопрос {n}", question_type="text", order=n)
+            for n in range(2)
+        ]
+        self.users = [User.objects.create(tg_id=tg_id, role="parent") for tg_id in (20, 10)]
+        for user in reversed(self.users):
+            for poll in polls:
+                Answer.objects.create(user=user, poll=poll, answer=f"{user.tg_id}-{poll.order}")
+        # полный текст длинного ответа лежит в text
+        Answer.objects.filter(user=self.users[0], poll=polls[1]).update(answer="обрезан", text="целиком")
+
+        student = User.objects.create(tg_id=30, role="student")
+        Answer.objects.create(user=student, poll=polls[0], answer="не родитель")
+        SurveySession.objects.create(user=self.users[1], role="parent", finished_at=timezone.now())
+
+    def test_blocks_follow_respondents(self):
+        self.assertEqual(list(iter_parent_answer_blocks(chunk_size=1)), [
+            "Респондент 20:\n- Вопрос 0 — 20-0\n- Вопрос 1 — целиком\n",
+            "Респондент 10:\n- Вопрос 0 — 10-0\n- Вопрос 1 — 10-1\n",
+        ])
+        self.assertEqual(
+            build_parent_answers(), "\n".join(iter_parent_answer_blocks()).strip(),
+        )
+
+    def test_finished_only(self):
+        blocks = list(iter_parent_answer_blocks(finished_only=True))
+        self.assertEqual([block.splitlines()[0] for block in blocks], ["Респондент 10:"])
+
+    def test_blocks_are_read_lazily(self):
+        blocks = iter_parent_answer_blocks(chunk_size=1)
+        with CaptureQueriesContext(connection) as queries:
+            first = next(blocks)
+        self.assertTrue(first.startswith("Респондент 20:"))
+        # один курсор на весь корпус, без списка всех ответов в памяти
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(len(list(blocks)), 1)
+
+
+class StubOpenAI:
+    """
+    Заглушка ``AsyncOpenAI``: запоминает промпты и отвечает ``reply(prompt)``.
+
+    Каждый ответ «думает» ``delay`` секунд — так видно, сколько запросов идут одновременно.
+    """
+
+    def __init__(self, reply=lambda prompt: "сводка", delay=0.001):
+        self.reply = reply
+        self.delay = delay
+        self.prompts = []
+        self.in_flight = self.max_in_flight = 0
+        self.loops = set()  # циклы событий, в которых шли запросы
+        self.closed = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    async def create(self, model, messages, temperature):
+        prompt = messages[-1]["content"]
+        self.prompts.append(prompt)
+        self.loops.add(asyncio.get_running_loop())
+        content = self.reply(prompt)
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.in_flight -= 1
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=content))],
+            usage=SimpleNamespace(prompt_tokens=len(prompt), completion_tokens=1),
+        )
+
+    async def close(self):
+        self.closed += 1
+
+    def data(self, template):
+        """Данные из промптов по шаблону ``template`` (текст на месте ``{data}``)."""
+        head, tail = template.split("{data}")
+        return [
+            prompt[len(head):len(prompt) - len(tail)]
+            for prompt in self.prompts
+            if prompt.startswith(head) and prompt.endswith(tail)
+        ]
+
+
+class ReportEngineTests(SimpleTestCase):
+    def engine(self, client, chunk_tokens=100, concurrency=4):
+        return ReportEngine(
+            client, model="stub", temperature=0, chunk_tokens=chunk_tokens, concurrency=concurrency,
+        )
+
+    def test_chunks_fit_budget(self):
+        blocks = [f"Респондент {n}:\n" + f"- Вопрос — {'ответ ' * n}\n" * n for n in range(1, 30)]
+        # длинный свободный ответ в одной строке
+        blocks.append("Респондент 99:\n- Вопрос — " + "слово " * 500 + "\n")
+
+        chunks = list(pack_chunks(blocks, 100))
+
+        self.assertTrue(all(estimate_tokens(chunk) <= 100 for chunk in chunks))
+        self.assertEqual(
+            "".join(chunks).replace("Респондент 99:\n", "").count("слово"), 500,
+        )
+
+    def test_oversized_block_is_summarised_in_parts(self):
+        client = StubOpenAI(reply=lambda prompt: f"часть {len(client.prompts)}")
+        blocks = ["Респондент 1:\n- Вопрос — да\n", "Респондент 2:\n" + "- Вопрос — " + "ответ " * 200 + "\n"]
+
+        summaries = asyncio.run(self.engine(client).summarise(blocks))
+
+        data = client.data(PARENT_CHUNK_PROMPT)
+        self.assertGreater(len(data), 2)
+        self.assertTrue(all(estimate_tokens(chunk) <= 100 for chunk in data))
+        self.assertEqual(summaries[0], "часть 1")
+        self.assertEqual(summaries[1], "\n".join(f"часть {n}" for n in range(2, len(data) + 1)))
+
+    def test_reduce_folds_in_several_levels(self):
+        # каждая сводка ~ 70 токенов, в бюджет 100 входит одна: свёртка идёт в несколько уровней
+        client = StubOpenAI(reply=lambda prompt: "я" * 200)
+        report = asyncio.run(self.engine(client).reduce(["я" * 200] * 8, statistics="Да | 2 | 100%"))
+
+        reduced = client.data(PARENT_REDUCE_PROMPT)
+        # 8 → 4 → 2 → 1: попарно на каждом уровне
+        self.assertEqual(len(reduced), 7)
+        self.assertTrue(all(estimate_tokens(group) <= 2 * 70 for group in reduced))
+        final = client.data(PARENT_REPORT_PROMPT)
+        self.assertEqual(len(final), 1)
+        self.assertIn("Да | 2 | 100%", final[0])
+        self.assertEqual(report, "я" * 200)
+
+    def test_concurrency_is_limited(self):
+        client = StubOpenAI(delay=0.01)
+        asyncio.run(self.engine(client, concurrency=3).summarise([f"Респондент {n}:\n" for n in range(12)]))
+
+        self.assertEqual(len(client.prompts), 12)
+        self.assertEqual(client.max_in_flight, 3)
+
+    def test_usage_is_merged_across_calls(self):
+        client = StubOpenAI()
+        usage = new_usage()
+        engine = ReportEngine(client, "stub", 0, chunk_tokens=100, concurrency=2, usage=usage)
+
+        async def run():
+            await engine.summarise(["Респондент 1:\n", "Респондент 2:\n"])
+            await engine.reduce(["сводка"] * 2)
+
+        asyncio.run(run())
+
+        self.assertEqual(usage, {
+            "requests": len(client.prompts),
+            "prompt_tokens": sum(len(prompt) for prompt in client.prompts),
+            "completion_tokens": len(client.prompts),
+        })
+
+
+# ======================================================
+# ВЫГРУЗКА ИЗ АДМИНКИ
+# ======================================================
+
+class AnswerExportViewTests(TestCase):
+    def setUp(self):
+        admin = get_user_model().objects.create_superuser("admin", "admin@example.com", "admin")
+        self.client.force_login(admin)
+        self.url = reverse("admin:polls_answer_export")
+
+    def test_unknown_role_is_rejected(self):
+        response = self.client.post(self.url, {"role": "teacher"}, follow=True)
+
+        self.assertRedirects(response, reverse("admin:polls_answer_changelist"))
+        self.assertContains(response, "Неизвестная роль «teacher»")
+        self.assertFalse(Job.objects.exists())
+
+    def test_known_and_empty_roles_are_queued(self):
+        for role in ("parent", ""):
+            self.client.post(self.url, {"role": role})
+
+        self.assertEqual(
+            [job.payload["role"] for job in Job.objects.order_by("id")],
+            ["parent", ""],
+        )
+
+
+class AdminJobViewPermissionTests(TestCase):
+    """Кнопки, ставящие задачи в очередь: только POST и только с отдельным правом."""
+
+    VIEWS = {
+        # url: (право, список с кнопкой)
+        "admin:polls_answer_export": ("export_answer", "admin:polls_answer_changelist"),
+        "admin:polls_questionstat_refresh": ("refresh_questionstat", "admin:polls_questionstat_changelist"),
+    }
+
+    def setUp(self):
+        self.staff = get_user_model().objects.create_user("staff", password="staff", is_staff=True)
+        self.staff.user_permissions.set(
+            Permission.objects.filter(codename__in=["view_answer", "view_questionstat"])
+        )
+        self.client.force_login(self.staff)
+
+    def grant(self, codename):
+        self.staff.user_permissions.add(Permission.objects.get(codename=codename))
+
+    def test_get_does_not_queue_job(self):
+        for url, (codename, _) in self.VIEWS.items():
+            self.grant(codename)
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(reverse(url)).status_code, 405)
+        self.assertFalse(Job.objects.exists())
+
+    def test_view_permission_is_not_enough(self):
+        for url, (_, changelist) in self.VIEWS.items():
+            with self.subTest(url=url):
+                self.assertEqual(self.client.post(reverse(url)).status_code, 403)
+                self.assertNotContains(self.client.get(reverse(changelist)), reverse(url))
+        self.assertFalse(Job.objects.exists())
+
+        # действия выгрузки выбранных ответов тоже скрыты
+        response = self.client.get(reverse("admin:polls_answer_changelist"))
+        self.assertNotContains(response, "export_csv_long")
+
+    def test_dedicated_permission_allows_post(self):
+        for url, (codename, changelist) in self.VIEWS.items():
+            self.grant(codename)
+            with self.subTest(url=url):
+                self.assertContains(self.client.get(reverse(changelist)), f'action="{reverse(url)}"')
+                self.assertRedirects(self.client.post(reverse(url)), reverse(changelist))
+        self.assertEqual(
+            sorted(Job.objects.values_list("kind", flat=True)), ["export", "statistics"],
+        )
+
+
+class AnswerExportActionTests(TestCase):
+    def setUp(self):
+        admin = get_user_model().objects.create_superuser("admin", "admin@example.com", "admin")
+        self.client.force_login(admin)
+        poll = Poll.objects.create(role="parent", question="Вопрос", question_type="text")
+        self.answers = [
+            Answer.objects.create(user=User.objects.create(tg_id=n, role="parent"), poll=poll, answer=text)
+            for n, text in enumerate(["Да", "Нет", "Да, конечно"], start=1)
+        ]
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings = override_settings(EXPORT_ROOT=Path(directory.name))
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def run_action(self, query="", **data):
+        response = self.client.post(
+            reverse("admin:polls_answer_changelist") + query,
+            {"action": "export_csv_long", "_selected_action": [self.answers[0].pk], **data},
+        )
+        self.assertEqual(response.status_code, 302)
+        job = Job.objects.get()
+        return job.payload["selection"], HANDLERS["export"](job)["rows"]
+
+    def test_selected_rows_are_exported_by_worker(self):
+        self.assertEqual(self.run_action(), ({"answer_ids": [self.answers[0].pk]}, 1))
+
+    def test_select_all_exports_filtered_list(self):
+        selection, rows = self.run_action("?q=Да", select_across="1")
+        self.assertEqual(selection, {"search": "Да"})
+        self.assertEqual(rows, 2)
+
+
+class WideExportTests(TestCase):
+    @unittest.skipUnless(find_spec("pyarrow"), "нужен pyarrow")
+    def test_same_question_for_both_roles_gets_distinct_columns(self):
+        import pyarrow.parquet as pq
+
+        polls = []
+        for n, role in enumerate(("parent", "student")):
+            user = User.objects.create(tg_id=n + 1, role=role)
+            poll = Poll.objects.create(role=role, question="Нравится ли в лицее?", question_type="text")
+            Answer.objects.create(user=user, poll=poll, answer=f"Да ({role})")
+            polls.append(poll)
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / "answers.parquet"
+            rows = export_answers("parquet", "wide", path)
+            table = pq.read_table(path)
+
+        self.assertEqual(rows, 2)
+        self.assertEqual(table.column_names, [
+            "tg_id",
+            "full_name",
+            "role",
+            f"Нравится ли в лицее? (вопрос #{polls[0].id})",
+            f"Нравится ли в лицее? (вопрос #{polls[1].id})",
+        ])
+        self.assertEqual(
+            [list(row.values())[3:] for row in table.to_pylist()],
+            [["Да (parent)", None], [None, "Да (student)"]],
+        )
+
+
+# ======================================================
+# ОТЧЁТЫ В АДМИНКЕ
+# ======================================================
+
+class ReportAdminTests(TestCase):
+    def setUp(self):
+        admin = get_user_model().objects.create_superuser("admin", "admin@example.com", "admin")
+        self.client.force_login(admin)
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        settings = override_settings(MEDIA_ROOT=Path(media.name))
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        self.reports = [
+            Report.objects.create(cache_key=f"key-{n}", text=text)
+            for n, text in enumerate(["# Отчёт\nОбщий вывод\nСтарый абзац", "# Отчёт\nОбщий вывод\nНовый абзац"])
+        ]
+
+    def diff(self, report, **params):
+        return self.client.get(reverse("admin:polls_report_diff", args=[report.pk]), params)
+
+    def test_download_returns_stored_docx(self):
+        report = self.reports[1]
+        report.docx.save("report.docx", ContentFile(b"docx-bytes"))
+
+        response = self.client.get(reverse("admin:polls_report_download", args=[report.pk]))
+
+        self.assertEqual(response.getvalue(), b"docx-bytes")
+        self.assertIn(f'filename="parent_report_{report.pk}.docx"', response["Content-Disposition"])
+
+    def test_download_without_docx_is_404(self):
+        response = self.client.get(reverse("admin:polls_report_download", args=[self.reports[0].pk]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_diff_with_previous_report(self):
+        response = self.diff(self.reports[1])
+
+        # difflib заменяет пробелы на &nbsp;
+        self.assertContains(response, '<span class="diff_sub">Старый&nbsp;абзац</span>')
+        self.assertContains(response, '<span class="diff_add">Новый&nbsp;абзац</span>')
+
+    def test_first_report_has_nothing_to_compare(self):
+        self.assertContains(self.diff(self.reports[0]), "Более раннего отчёта для сравнения нет.")
+
+    def test_diff_against_chosen_report(self):
+        third = Report.objects.create(cache_key="key-2", text="# Отчёт\nОбщий вывод\nНовый абзац")
+        # с предыдущим совпадает, с первым — нет
+        self.assertNotContains(self.diff(third), 'class="diff_add"')
+        self.assertContains(self.diff(third, against=self.reports[0].pk), 'class="diff_add"')
+        self.assertEqual(self.diff(third, against="первый").status_code, 404)
+
+    def test_compare_action_needs_two_reports(self):
+        url = reverse("admin:polls_report_changelist")
+        response = self.client.post(url, {
+            "action": "compare_reports", "_selected_action": [report.pk for report in self.reports],
+        })
+        diff_url = reverse("admin:polls_report_diff", args=[self.reports[1].pk])
+        self.assertRedirects(response, f"{diff_url}?against={self.reports[0].pk}")
+
+        response = self.client.post(url, {
+            "action": "compare_reports", "_selected_action": [self.reports[0].pk],
+        }, follow=True)
+        self.assertContains(response, "Выберите ровно два отчёта")
+
+
+# ======================================================
+# ЧИСЛО ЗАПРОСОВ В АДМИНКЕ
+# ======================================================
+
+# (пользователей, вопросов на роль, ответов на пользователя): второй набор
+# заметно больше первого, а у пользователя больше ответов, чем показывает inline
+SMALL = (3, 3, 5)
+LARGE = (40, 12, 120)
+
+
+def seed_admin_data(users, polls_per_role, answers_per_user):
+    """Данные для страниц админки; повторный вызов добавляет строки к уже созданным."""
+    start = User.objects.count()
+    polls = []
+    for role in ("parent", "student"):
+        for n in range(polls_per_role):
+            polls.append(Poll(
+                role=role,
+                question=f"Вопрос {role} {start}-{n}",
+                question_type="scale_group",
+                options=[{"key": key, "text": f"Утверждение {key}"} for key in "ABC"],
+                order=n,
+            ))
+    polls = Poll.objects.bulk_create(polls)
+
+    respondents = User.objects.bulk_create([
+        User(tg_id=1_000_000 + start + i, full_name=f"Респондент {start + i}", role="parent")
+        for i in range(users)
+    ])
+    Answer.objects.bulk_create([
+        Answer(
+            user=user,
+            poll=polls[i % len(polls)],
+            option_key="ABC"[i % 3],
+            score=i % 10 + 1,
+            answer=f"{'ABC'[i % 3]}: {i % 10 + 1}",
+        )
+        for user in respondents
+        for i in range(answers_per_user)
+    ])
+    SurveySession.objects.bulk_create([
+        SurveySession(user=user, role="parent", position=answers_per_user)
+        for user in respondents
+    ])
+    Job.objects.bulk_create([
+        Job(kind="export", status=Job.STATUS_DONE, result={"file": "answers.csv", "rows": 1})
+        for _ in range(users)
+    ])
+    Broadcast.objects.bulk_create([Broadcast(text="Напоминание") for _ in range(users)])
+    Report.objects.bulk_create([
+        Report(cache_key=f"key-{start + i}", text=f"# Отчёт\n\nВерсия {i}", docx="reports/report.docx")
+        for i in range(users)
+    ])
+    refresh_statistics()
+
+
+def admin_pages():
+    """Все списки и страницы изменения; объекты — последние созданные."""
+    pages = {
+        "answer_changelist_by_tg_id": (
+            reverse("admin:polls_answer_changelist") + f"?tg_id={User.objects.latest('id').tg_id}"
+        ),
+        "answer_changelist_search": reverse("admin:polls_answer_changelist") + "?q=A",
+    }
+    for model in (Answer, User, Poll, SurveySession, Job, Broadcast, Report, QuestionStat, FunnelStat):
+        name = model._meta.model_name
+        pages[f"{name}_changelist"] = reverse(f"admin:polls_{name}_changelist")
+        pages[f"{name}_change"] = reverse(
+            f"admin:polls_{name}_change", args=[model.objects.latest("id").pk]
+        )
+
+    job = Job.objects.latest("id")
+    report, previous = Report.objects.order_by("-id")[:2]
+    pages["job_download"] = reverse("admin:polls_job_download", args=[job.pk])
+    pages["report_download"] = reverse("admin:polls_report_download", args=[report.pk])
+    pages["report_diff"] = reverse("admin:polls_report_diff", args=[report.pk])
+    pages["report_diff_against"] = (
+        reverse("admin:polls_report_diff", args=[report.pk]) + f"?against={previous.pk}"
+    )
+    return pages
+
+
+class AdminQueryCountTests(TestCase):
+    """Число SQL-запросов страниц админки не растёт вместе с числом пользователей и ответов."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        root = Path(directory.name)
+        (root / "reports").mkdir()
+        (root / "reports" / "report.docx").write_bytes(b"docx")
+        (root / "answers.csv").write_text("tg_id\n")
+        settings = override_settings(MEDIA_ROOT=root, EXPORT_ROOT=root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        admin = get_user_model().objects.create_superuser("admin", "admin@example.com", "admin")
+        self.client.force_login(admin)
+
+    def get(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, url)
+        # FileResponse закрывает файл, когда содержимое дочитано до конца
+        response.getvalue()
+
+    def test_query_count_does_not_grow_with_data(self):
+        seed_admin_data(*SMALL)
+        counts = {}
+        for name, url in admin_pages().items():
+            # первый заход заполняет кэш ContentType — считаем со второго
+            self.get(url)
+            with CaptureQueriesContext(connection) as queries:
+                self.get(url)
+            counts[name] = len(queries)
+
+        seed_admin_data(*LARGE)
+        for name, url in admin_pages().items():
+            with self.subTest(page=name), self.assertNumQueries(counts[name]):
+                self.get(url)
+
+
+# ======================================================
+# DOCX ИЗ MARKDOWN
+# ======================================================
+
+# кусочки, из которых собираются случайные строки: разметка вперемешку с текстом
+INLINE_PIECES = ["слово", " ", "snake_case", "**", "*", "***", "_", "__", "`", "`код`", "|", "7,5", "a*b"]
+BLOCK_PREFIXES = ["", "", "", "# ", "### ", "- ", "  - ", "1. ", "| ", "---", "```", "```chart", "> "]
+
+
+def random_line(rng, pieces=10):
+    return "".join(rng.choice(INLINE_PIECES) for _ in range(rng.randrange(pieces)))
+
+
+def random_markdown(rng, lines=40):
+    result = []
+    for _ in range(rng.randrange(lines)):
+        line = rng.choice(BLOCK_PREFIXES) + random_line(rng)
+        if line.startswith("| ") and rng.random() < 0.5:
+            # таблица: заголовок, разделитель и несколько строк
+            result += [line, "| --- | :---: |"] + [f"| {random_line(rng)} | 1 |" for _ in range(3)]
+        else:
+            result.append(line)
+    return "\n".join(result)
+
+
+def is_subsequence(part, text):
+    position = 0
+    for char in part:
+        position = text.find(char, position) + 1
+        if not position:
+            return False
+    return True
+
+
+class MarkdownDocxPropertyTests(SimpleTestCase):
+    """Свойства разбора и сборки на случайных документах; seed фиксирован для воспроизводимости."""
+
+    def setUp(self):
+        self.rng = random.Random(2024)
+
+    def test_package_is_well_formed(self):
+        for _ in range(200):
+            text = random_markdown(self.rng)
+            with self.subTest(text=text):
+                package = zipfile.ZipFile(BytesIO(build_docx_bytes(text)))
+                self.assertIsNone(package.testzip())
+                names = set(package.namelist())
+                for name in names:
+                    ElementTree.fromstring(package.read(name))
+
+                content_types = ElementTree.fromstring(package.read("[Content_Types].xml"))
+                for override in content_types:
+                    if "PartName" in override.attrib:
+                        self.assertIn(override.attrib["PartName"].lstrip("/"), names)
+                relationships = ElementTree.fromstring(package.read("word/_rels/document.xml.rels"))
+                for relationship in relationships:
+                    self.assertIn("word/" + relationship.attrib["Target"], names)
+
+    def test_spans_are_subsequence_of_source(self):
+        for _ in range(2000):
+            text = random_line(self.rng, pieces=20)
+            with self.subTest(text=text):
+                spans = parse_inline(text)
+                # разметка только убирается: текст не добавляется и не переставляется
+                self.assertTrue(is_subsequence("".join(span.text for span in spans), text))
+
+    def test_plain_lines_pass_through(self):
+        plain = [piece for piece in INLINE_PIECES if not set(piece) & set("*_`|")]
+        for _ in range(500):
+            line = "".join(self.rng.choice(plain) for _ in range(self.rng.randrange(1, 10))).strip()
+            with self.subTest(line=line):
+                self.assertEqual(parse_inline(line), [Span(line, False, False, False)] if line else [])
+
+        lines = [f"Строка {n}: ответы родителей, средний балл 7,{n}." for n in range(20)]
+        self.assertEqual(list(tokenize(iter_lines("\n".join(lines)))), [Paragraph(lines)])
+
+    def assertLinear(self, func, make_input, size=10_000):
+        """Время на входе в 10 раз больше растёт не более чем в 30 раз (с запасом на шум)."""
+        def best(argument):
+            timings = []
+            # сборщик мусора срабатывает по числу созданных объектов и добавляет шум
+            gc.disable()
+            try:
+                for _ in range(3):
+                    started = time.perf_counter()
+                    func(argument)
+                    timings.append(time.perf_counter() - started)
+            finally:
+                gc.enable()
+            return min(timings)
+
+        small, large = best(make_input(size)), best(make_input(size * 10))
+        self.assertLess(large, max(small, 1e-3) * 30)
+
+    def test_time_is_linear_on_delimiter_heavy_input(self):
+        inline_inputs = [
+            lambda n: "*a " * n,            # открывающие без пары
+            lambda n: "**a* " * n,          # вперемешку жирный и курсив
+            lambda n: "_x_" * n,            # «_» внутри слова
+            lambda n: "` " * n + "*",       # незакрытые обратные кавычки
+            lambda n: "a" + "*" * n,        # длинная серия разделителей
+        ]
+        for make_input in inline_inputs:
+            with self.subTest(sample=make_input(2)):
+                self.assertLinear(parse_inline, make_input)
+
+        block_inputs = [
+            lambda n: "- *a\n" * n,        # вложенные списки без пар
+            lambda n: "| a | *b |\n| --- | --- |\n" + "| *x | y_ |\n" * n,
+            lambda n: "```\n" + "*\n" * n,  # незакрытый блок кода
+        ]
+        for make_input in block_inputs:
+            with self.subTest(sample=make_input(2)):
+                self.assertLinear(lambda text: list(tokenize(iter_lines(text))), make_input, size=2_000)
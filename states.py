@@ -11,3 +11,11 @@ class EditPollState(StatesGroup):
 
 class DeletePollState(StatesGroup):
     waiting_for_poll_id = State()
+
+
+class SurveyState(StatesGroup):
+    full_name = State()
+    phone = State()
+    consent = State()
+    text_answer = State()
+    scale_answer = State()
@@ -37,6 +37,9 @@ DEBUG = True
 ALLOWED_HOSTS = []
 STATIC_URL = '/static/'
 STATIC_ROOT = BASE_DIR / 'staticfiles'
+# Загруженные и сгенерированные файлы (DOCX отчётов); отдаются через админку
+MEDIA_URL = '/media/'
+MEDIA_ROOT = Path(os.getenv("MEDIA_ROOT", BASE_DIR / 'media'))
 
 # Application definition
 
@@ -84,12 +87,65 @@ WSGI_APPLICATION = 'tg_poll_project.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/6.0/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# DB_ENGINE: sqlite (по умолчанию, файл db.sqlite3) | postgresql
+DB_ENGINE = os.getenv("DB_ENGINE", "sqlite")
+
+if DB_ENGINE == "postgresql":
+    # Нужен psycopg 3 (pip install "psycopg[binary,pool]").
+    # DB_POOL_MAX_SIZE > 0 включает пул psycopg; он несовместим с постоянными
+    # соединениями, поэтому CONN_MAX_AGE тогда 0. Пул должен вмещать потоки
+    # бота (BOT_DB_POOL_SIZE) — они держат соединение всё время работы.
+    DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "0"))
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.getenv("DB_NAME", "botopros"),
+            'USER': os.getenv("DB_USER", "botopros"),
+            'PASSWORD': os.getenv("DB_PASSWORD", ""),
+            'HOST': os.getenv("DB_HOST", "localhost"),
+            'PORT': os.getenv("DB_PORT", "5432"),
+            'CONN_MAX_AGE': 0 if DB_POOL_MAX_SIZE else int(os.getenv("DB_CONN_MAX_AGE", "60")),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {},
+        }
+    }
+    if DB_POOL_MAX_SIZE:
+        DATABASES['default']['OPTIONS']['pool'] = {
+            'min_size': int(os.getenv("DB_POOL_MIN_SIZE", "2")),
+            'max_size': DB_POOL_MAX_SIZE,
+            'timeout': float(os.getenv("DB_POOL_TIMEOUT", "10")),
+        }
+else:
+    # WAL: чтение (админка, отчёты) не ждёт записи ответов ботом. Режим
+    # журнала хранится в самом файле БД, поэтому его один раз включает
+    # миграция 0023_sqlite_journal_mode (manage.py migrate), а не каждое
+    # соединение. synchronous=NORMAL в WAL не теряет целостность, только
+    # последние транзакции при отключении питания. IMMEDIATE берёт блокировку
+    # записи в начале транзакции, и конкурирующие писатели ждут busy_timeout
+    # (DB_SQLITE_TIMEOUT секунд), а не падают с "database is locked".
+    DB_SQLITE_JOURNAL_MODE = os.getenv("DB_SQLITE_JOURNAL_MODE", "WAL")
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.getenv("DB_NAME", BASE_DIR / 'db.sqlite3'),
+            # тесты — на файле, а не в памяти: так WAL и конкурентная запись
+            # проверяются в тех же условиях, что и в работе
+            'TEST': {'NAME': os.getenv("DB_TEST_NAME", BASE_DIR / 'test_db.sqlite3')},
+            # потоки бота держат соединение между задачами до этого срока
+            'CONN_MAX_AGE': int(os.getenv("DB_CONN_MAX_AGE", "60")),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'timeout': float(os.getenv("DB_SQLITE_TIMEOUT", "20")),
+                'transaction_mode': 'IMMEDIATE',
+                'init_command': (
+                    "PRAGMA synchronous=NORMAL;"
+                    "PRAGMA temp_store=MEMORY;"
+                    "PRAGMA cache_size=-20000;"
+                    "PRAGMA mmap_size=134217728;"
+                ),
+            },
+        }
     }
-}
 
 
 # Password validation
@@ -127,3 +183,132 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/6.0/howto/static-files/
 
 STATIC_URL = 'static/'
+
+
+# ======================================================
+# Survey bot
+# ======================================================
+
+# Сколько секунд процесс бота держит анкету в памяти. Изменения в админке
+# сбрасывают кэш сразу (в том же процессе), в остальных — по истечении TTL.
+QUESTIONNAIRE_CACHE_TTL = int(os.getenv("QUESTIONNAIRE_CACHE_TTL", "60"))
+
+# Сколько последних отправленных Telegram-опросов держать в памяти для
+# быстрого сопоставления ответов (остальные ищутся в таблице PollDelivery).
+POLL_DELIVERY_CACHE_SIZE = int(os.getenv("POLL_DELIVERY_CACHE_SIZE", "50000"))
+
+# Профили респондентов в памяти бота: сколько держать и сколько секунд
+# доверять записи (правки из админки бот увидит не позже чем через TTL)
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+USER_CACHE_TTL = int(os.getenv("USER_CACHE_TTL", "300"))
+
+# Хранилище состояний диалога (FSM): memory | db | redis.
+# memory теряет состояние при рестарте; db и redis общие для нескольких процессов бота.
+BOT_FSM_STORAGE = os.getenv("BOT_FSM_STORAGE", "memory")
+BOT_FSM_REDIS_URL = os.getenv("BOT_FSM_REDIS_URL", "redis://localhost:6379/0")
+# Через сколько секунд бездействия состояние респондента забывается
+BOT_FSM_TTL = int(os.getenv("BOT_FSM_TTL", str(7 * 24 * 3600)))
+
+# Ответы пишутся в БД пачками: не больше ANSWER_BATCH_SIZE строк
+# и не реже раза в ANSWER_FLUSH_INTERVAL секунд.
+ANSWER_BATCH_SIZE = int(os.getenv("ANSWER_BATCH_SIZE", "200"))
+ANSWER_FLUSH_INTERVAL = float(os.getenv("ANSWER_FLUSH_INTERVAL", "1.0"))
+
+# Исходящие сообщения бота: общий темп и темп в один чат (после всплеска из BURST)
+BOT_SEND_RATE = float(os.getenv("BOT_SEND_RATE", "30"))
+BOT_SEND_CHAT_RATE = float(os.getenv("BOT_SEND_CHAT_RATE", "1"))
+BOT_SEND_CHAT_BURST = int(os.getenv("BOT_SEND_CHAT_BURST", "3"))
+
+# Режим получения обновлений: polling (long polling) | webhook (aiohttp-сервер)
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+BOT_WEBHOOK_URL = os.getenv("BOT_WEBHOOK_URL", "")  # публичный адрес, например https://bot.example.com
+BOT_WEBHOOK_PATH = os.getenv("BOT_WEBHOOK_PATH", "/telegram/webhook")
+BOT_WEBHOOK_SECRET = os.getenv("BOT_WEBHOOK_SECRET", "")
+BOT_WEBHOOK_HOST = os.getenv("BOT_WEBHOOK_HOST", "0.0.0.0")
+BOT_WEBHOOK_PORT = int(os.getenv("BOT_WEBHOOK_PORT", "8080"))
+# Сколько обновлений один процесс обрабатывает одновременно
+BOT_WEBHOOK_CONCURRENCY = int(os.getenv("BOT_WEBHOOK_CONCURRENCY", "100"))
+# Сколько параллельных соединений Telegram открывает к webhook (на все процессы)
+BOT_WEBHOOK_MAX_CONNECTIONS = int(os.getenv("BOT_WEBHOOK_MAX_CONNECTIONS", "40"))
+
+# Рассылки (Broadcast в админке) выполняет процесс бота: проверяет очередь
+# раз в BOT_BROADCAST_POLL_INTERVAL секунд и шлёт пачками с контрольной точкой
+BOT_BROADCAST_POLL_INTERVAL = int(os.getenv("BOT_BROADCAST_POLL_INTERVAL", "10"))
+BOT_BROADCAST_BATCH_SIZE = int(os.getenv("BOT_BROADCAST_BATCH_SIZE", "100"))
+# Рассылка без отметки процесса дольше стольких секунд считается брошенной
+# и достаётся другому процессу; процесс отмечается в ней втрое чаще
+BOT_BROADCAST_STALE_AFTER = int(os.getenv("BOT_BROADCAST_STALE_AFTER", "300"))
+
+# Потоки (и соединения с БД), в которых бот выполняет запросы к ORM.
+# Для SQLite больше 4–8 смысла нет: запись всё равно идёт по одной.
+BOT_DB_POOL_SIZE = int(os.getenv("BOT_DB_POOL_SIZE", "8"))
+
+
+# ======================================================
+# AI reports
+# ======================================================
+
+AI_REPORT_MODEL = os.getenv("AI_REPORT_MODEL", "gpt-4o-mini")  # можно gpt-4o
+AI_REPORT_TEMPERATURE = float(os.getenv("AI_REPORT_TEMPERATURE", "0.4"))
+# Бюджет одного запроса к модели; больший корпус делится на части (map-reduce)
+AI_REPORT_CHUNK_TOKENS = int(os.getenv("AI_REPORT_CHUNK_TOKENS", "12000"))
+# Сколько запросов к OpenAI выполняется одновременно
+AI_REPORT_CONCURRENCY = int(os.getenv("AI_REPORT_CONCURRENCY", "4"))
+
+# Учитывать в AI-отчёте только родителей, прошедших анкету до конца
+AI_REPORT_FINISHED_ONLY = os.getenv("AI_REPORT_FINISHED_ONLY", "") == "1"
+
+# Готовые отчёты кэшируются по хэшу промптов, модели и набора ответов:
+# повторный запрос без новых ответов не обращается к OpenAI.
+AI_REPORT_CACHE_TTL = int(os.getenv("AI_REPORT_CACHE_TTL", str(7 * 24 * 3600)))
+AI_REPORT_CACHE_MAX_ENTRIES = int(os.getenv("AI_REPORT_CACHE_MAX_ENTRIES", "50"))
+# Ответы модели на промежуточные свёртки — отдельно: их на порядки больше,
+# чем отчётов, и при общем кэше они вытесняли бы готовые отчёты
+AI_REPORT_COMPLETIONS_CACHE_MAX_ENTRIES = int(
+    os.getenv("AI_REPORT_COMPLETIONS_CACHE_MAX_ENTRIES", "5000")
+)
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "reports": {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": BASE_DIR / ".cache" / "reports",
+        "TIMEOUT": AI_REPORT_CACHE_TTL,
+        "OPTIONS": {"MAX_ENTRIES": AI_REPORT_CACHE_MAX_ENTRIES},
+    },
+    "report_completions": {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": BASE_DIR / ".cache" / "report_completions",
+        "TIMEOUT": AI_REPORT_CACHE_TTL,
+        "OPTIONS": {"MAX_ENTRIES": AI_REPORT_COMPLETIONS_CACHE_MAX_ENTRIES},
+    },
+}
+
+
+# ======================================================
+# Background jobs (manage.py run_jobs)
+# ======================================================
+
+# Воркер отмечается в выполняемой задаче раз в JOB_HEARTBEAT_INTERVAL секунд.
+# Задача без отметки дольше JOB_TIMEOUT секунд считается брошенной (воркер
+# умер) и возвращается в очередь; длительность самой задачи не ограничена.
+JOB_HEARTBEAT_INTERVAL = int(os.getenv("JOB_HEARTBEAT_INTERVAL", "30"))
+JOB_TIMEOUT = int(os.getenv("JOB_TIMEOUT", "300"))
+# Пауза перед повтором: JOB_RETRY_BACKOFF * 2^(попытка-1) секунд
+JOB_RETRY_BACKOFF = int(os.getenv("JOB_RETRY_BACKOFF", "30"))
+
+# Куда фоновые задачи складывают выгрузки ответов (XLSX, Parquet, CSV);
+# скачиваются через админку со страницы задачи
+EXPORT_ROOT = Path(os.getenv("EXPORT_ROOT", BASE_DIR / "exports"))
+
+
+# ======================================================
+# Telegram delivery (отчёты и уведомления из Django)
+# ======================================================
+
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org")
+# Глобальный предел Bot API — около 30 сообщений в секунду
+TELEGRAM_RATE_LIMIT = float(os.getenv("TELEGRAM_RATE_LIMIT", "25"))
+TELEGRAM_CONCURRENCY = int(os.getenv("TELEGRAM_CONCURRENCY", "8"))